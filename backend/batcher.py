@@ -0,0 +1,219 @@
+# backend/batcher.py
+# Dynamic micro-batching for /query.
+#
+# Concurrent queries are collected for up to QUERY_BATCH_WINDOW_MS (or until
+# QUERY_BATCH_MAX_SIZE arrive), then served together:
+#   1. one batched embedder.encode() for all query strings
+#   2. one index search per distinct search setting -- normally one (BM25
+#      lookups for sparse/hybrid requests are per query; they are cheap)
+#   3. one padded flan-t5 generate() per distinct (max_new_tokens, decoding)
+# and each caller's future gets its own (answer, sources) back. Answers are
+# shared with query_cache: exact repeats never enter the queue and
+# near-duplicates are answered right after the batched encode. Under load the
+# queue fills while the previous batch runs, so batches grow with traffic and
+# the window only adds latency when the server is nearly idle.
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence
+
+import metrics
+from index_service import get_index_service
+from meta_store import normalize_filters
+from model_registry import get_embedder
+from query_cache import get_query_cache
+from rag_generate import (TOP_K, MAX_NEW_TOKENS, DECODING_MODE, NO_ANSWER, RERANK, candidate_k, decoding_config,
+                          dedupe_chunks, finalize_hits, generate_texts, pack_context, retrieval_config,
+                          was_reranked)
+from workers import PoolSaturated
+
+# ----------------- Config -----------------
+QUERY_BATCHING = os.getenv("QUERY_BATCHING", "1") == "1"  # 0 = /query calls generate_answer per request
+BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "10"))
+BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_PENDING = int(os.getenv("QUERY_BATCH_MAX_PENDING", "256"))  # queued queries before 429
+
+_STOP = object()
+
+
+class _Pending:
+    __slots__ = ("query", "top_k", "max_new_tokens", "nprobe", "ef_search", "decoding", "retrieval", "weights",
+                 "rerank", "rerank_budget_ms", "filters", "future", "chunks", "trace")
+
+    def __init__(self, query, top_k, max_new_tokens, nprobe, ef_search, decoding, retrieval, weights,
+                 rerank, rerank_budget_ms, filters):
+        self.query = query
+        self.top_k = top_k
+        self.max_new_tokens = max_new_tokens
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.decoding = decoding
+        self.retrieval = retrieval
+        self.weights = weights
+        self.rerank = rerank
+        self.rerank_budget_ms = rerank_budget_ms
+        self.filters = filters
+        self.future = Future()
+        self.chunks: List[Dict] = []
+        self.trace = metrics.current_trace()  # the caller's timings, if it asked for them
+
+    @property
+    def cache_params(self) -> tuple:
+        # same key layout as rag_generate.generate_answer
+        return (self.top_k, self.nprobe, self.ef_search, self.max_new_tokens, self.decoding,
+                self.retrieval, self.weights, self.rerank, self.filters)
+
+    @property
+    def search_params(self) -> tuple:
+        return (self.top_k, self.nprobe, self.ef_search, self.retrieval, self.weights, self.rerank, self.filters)
+
+
+def _resolve(item: _Pending, result):
+    # The caller may have given up (client disconnect cancels the wrapped future)
+    if not item.future.done():
+        item.future.set_result(result)
+
+
+class QueryBatcher:
+    def __init__(self, window_ms: float = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX_SIZE,
+                 max_pending: int = BATCH_MAX_PENDING):
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.max_pending = max_pending
+        self._queue: "queue.Queue" = queue.Queue()
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self._thread = threading.Thread(target=self._loop, name="query-batcher", daemon=True)
+        self._thread.start()
+
+    # ---------- callers ----------
+    def submit(self, query: str, top_k: int = TOP_K, max_new_tokens: int = MAX_NEW_TOKENS,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               decoding: Optional[str] = None, retrieval: Optional[str] = None,
+               weights: Optional[Sequence[float]] = None, rerank: Optional[bool] = None,
+               rerank_budget_ms: Optional[float] = None, filters: Optional[Dict] = None) -> Future:
+        """Queue a query; the future resolves to (answer, sources) like generate_answer."""
+        # unknown modes -> ValueError in the caller, not the batch
+        decoding = decoding or DECODING_MODE
+        decoding_config(decoding)
+        retrieval, weights = retrieval_config(retrieval, weights)
+        rerank = RERANK if rerank is None else rerank
+        item = _Pending(query, top_k, max_new_tokens, nprobe, ef_search, decoding, retrieval, weights,
+                        rerank, rerank_budget_ms, normalize_filters(filters))
+        cached = get_query_cache().get_exact("answer", query, item.cache_params)
+        if cached is not None:
+            future = Future()
+            future.set_result((cached[0], cached[1]))
+            return future
+        if self._queue.qsize() >= self.max_pending:
+            raise PoolSaturated("query-batcher")
+        self._queue.put(item)
+        return item.future
+
+    async def answer(self, query: str, **kwargs):
+        return await asyncio.wrap_future(self.submit(query, **kwargs))
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+        }
+
+    def close(self):
+        self._queue.put(_STOP)
+
+    # ---------- batching thread ----------
+    def _collect(self, first) -> List[_Pending]:
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # let the loop see it after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch = self._collect(first)
+            try:
+                with metrics.tracing([item.trace for item in batch if item.trace is not None]):
+                    self._run_batch(batch)
+            except Exception as e:
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+            self.batches += 1
+            self.queries += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def _run_batch(self, batch: List[_Pending]):
+        service, cache = get_index_service(), get_query_cache()
+        version = service.version
+
+        # ---------------- Embed all queries at once -----------------
+        metrics.observe("query_batch_size", len(batch), metrics.SIZE_BUCKETS)
+        with metrics.stage("embed_query"):
+            vecs = get_embedder().encode([item.query for item in batch], batch_size=len(batch),
+                                         convert_to_numpy=True, normalize_embeddings=True).astype("float32")
+
+        # ---------------- Near-duplicates of cached questions -----------------
+        todo = []
+        for i, item in enumerate(batch):
+            # near-duplicate reuse is dense-only, as in rag_generate.semantic_search
+            query_vec = vecs[i] if item.retrieval == "dense" else None
+            cached = cache.get_semantic("answer", query_vec, item.cache_params)
+            if cached is not None:
+                _resolve(item, (cached[0], cached[1]))
+            else:
+                todo.append(i)
+
+        # ---------------- One search per distinct search setting -----------------
+        groups: Dict[tuple, List[int]] = {}
+        for i in todo:
+            groups.setdefault(batch[i].search_params, []).append(i)
+        for (top_k, nprobe, ef_search, mode, weights, rerank, filters), rows in groups.items():
+            dense = [[] for _ in rows]
+            if mode != "sparse":
+                with metrics.stage("search"):
+                    dense = service.search(vecs[rows], candidate_k(top_k, mode, rerank),
+                                           nprobe=nprobe, ef_search=ef_search, filters=filters)
+            for i, hits in zip(rows, dense):
+                item = batch[i]
+                item.chunks = dedupe_chunks(finalize_hits(item.query, hits, top_k, mode, weights,
+                                                          rerank, item.rerank_budget_ms, filters))
+
+        # ---------------- Generate in padded batches -----------------
+        prompts: Dict[int, str] = {}
+        by_config: Dict[tuple, List[int]] = {}
+        for i in todo:
+            if batch[i].chunks:
+                prompts[i], batch[i].chunks, _ = pack_context(batch[i].query, batch[i].chunks)
+                by_config.setdefault((batch[i].max_new_tokens, batch[i].decoding), []).append(i)
+            else:
+                cache.put("answer", batch[i].query, batch[i].cache_params, vecs[i], [NO_ANSWER, []], version)
+                _resolve(batch[i], (NO_ANSWER, []))
+        for (max_new_tokens, decoding), rows in by_config.items():
+            answers = generate_texts([prompts[i] for i in rows], max_new_tokens, decoding)
+            for i, answer in zip(rows, answers):
+                item = batch[i]
+                if not item.rerank or was_reranked(item.chunks):
+                    cache.put("answer", item.query, item.cache_params, vecs[i], [answer, item.chunks], version)
+                _resolve(item, (answer, item.chunks))
@@ -0,0 +1,5 @@
+# backend/bench/__init__.py
+# Micro-benchmarks. Run from the backend directory, e.g.:
+#   python -m bench.embed
+# bench.suite runs the whole pipeline on a synthetic corpus and writes
+# JSON results to data/bench/ for comparing runs.
@@ -0,0 +1,79 @@
+# backend/bench/ann.py
+# Recall@k vs latency of each index backend, with the flat index as ground truth.
+#   python -m bench.ann                      # vectors from data/vectors
+#   python -m bench.ann --synthetic 200000   # clustered random vectors
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from bench.common import percentile
+from index_backends import build_index, estimate_memory_bytes, normalize
+from index_service import IndexService, DIM
+
+NPROBE_SWEEP = (1, 4, 16, 64)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+
+
+def synthetic_vectors(n: int, dim: int = DIM, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    vecs = centers[rng.integers(0, clusters, n)] + 0.3 * rng.normal(size=(n, dim)).astype("float32")
+    return normalize(vecs)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(index, queries, k, truth, params=None):
+    latencies, found = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    return recall_at_k(np.array(found), truth), percentile(latencies, 50), percentile(latencies, 99)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of data/vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic) if args.synthetic else IndexService().export()[0]
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, n, args.queries)] + 0.05 * rng.normal(size=(args.queries, dim)).astype("float32")
+    queries = normalize(queries)
+    k = min(args.k, n)
+
+    flat = build_index("flat", vectors)
+    _, truth = flat.search(queries, k)
+    print(f"{n} vectors, {len(queries)} queries, recall@{k} vs flat")
+    print(f"{'backend':<10} {'setting':<14} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'MB':>8}")
+
+    def report(kind, index, build_s, setting="", params=None):
+        recall, p50, p99 = run(index, queries, k, truth, params)
+        mb = estimate_memory_bytes(kind, n, dim) / 1e6
+        print(f"{kind:<10} {setting:<14} {recall:7.3f} {p50:8.3f} {p99:8.3f} {build_s:8.2f} {mb:8.1f}")
+
+    report("flat", flat, 0.0)
+    for kind in ("ivf_flat", "ivf_pq", "hnsw"):
+        start = time.perf_counter()
+        try:
+            index = build_index(kind, vectors)
+        except ValueError as e:
+            print(f"{kind:<10} skipped: {e}")
+            continue
+        build_s = time.perf_counter() - start
+        if kind == "hnsw":
+            for ef in EF_SEARCH_SWEEP:
+                report(kind, index, build_s, f"efSearch={ef}", faiss.SearchParametersHNSW(efSearch=ef))
+        else:
+            for nprobe in NPROBE_SWEEP:
+                report(kind, index, build_s, f"nprobe={nprobe}", faiss.SearchParametersIVF(nprobe=nprobe))
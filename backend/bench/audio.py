@@ -0,0 +1,76 @@
+# backend/bench/audio.py
+# Real-time factor (processing seconds / audio seconds, lower is better) of
+# one Whisper call over a whole long recording vs VAD-split windows, serially
+# and across worker processes. The recording is synthetic: --clip (any audio
+# file, e.g. a short speech sample) repeated to --minutes with pauses between
+# copies, or tone bursts and pauses when no clip is given.
+#   python -m bench.audio --clip data/uploads/sample.mp3 --minutes 20 --workers 4
+import argparse
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from model_registry import WHISPER_MODEL_SIZE, get_whisper
+from transcribe import SAMPLE_RATE, iter_transcribed_windows, load_audio, plan_windows
+
+PAUSE_SECONDS = 1.5
+
+
+def synthesize(clip, minutes, rng):
+    if clip is None:
+        t = np.arange(int(4 * SAMPLE_RATE)) / SAMPLE_RATE
+        clip = (0.3 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 3 * t)) / 2).astype("float32")
+    pause = (0.002 * rng.standard_normal(int(PAUSE_SECONDS * SAMPLE_RATE))).astype("float32")
+    copies = max(1, int(minutes * 60 * SAMPLE_RATE / (len(clip) + len(pause))))
+    return np.concatenate([part for _ in range(copies) for part in (clip, pause)])
+
+
+def write_wav(path, audio):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+def run_windows(path, workers):
+    start = time.perf_counter()
+    first, segments = None, []
+    for window in iter_transcribed_windows(str(path), workers=workers):
+        first = first if first is not None else time.perf_counter() - start
+        segments.extend(window)
+    return time.perf_counter() - start, first, segments
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clip", help="audio file to repeat (default: synthetic tones)")
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--skip-single", action="store_true", help="skip the slow one-call baseline")
+    args = parser.parse_args()
+
+    audio = synthesize(load_audio(args.clip) if args.clip else None, args.minutes, np.random.default_rng(0))
+    duration = len(audio) / SAMPLE_RATE
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "long.wav"
+        write_wav(path, audio)
+        print(f"{duration / 60:.1f} min of audio, {len(plan_windows(load_audio(str(path))))} speech windows, "
+              f"whisper {WHISPER_MODEL_SIZE}")
+        model = get_whisper()  # exclude load time from every run
+
+        if not args.skip_single:
+            start = time.perf_counter()
+            res = model.transcribe(str(path), language="en")
+            seconds = time.perf_counter() - start
+            print(f"{'single call':>16}: RTF {seconds / duration:.3f} ({seconds:.1f}s), "
+                  f"first chunk after {seconds:.1f}s, {len(res.get('segments', []))} segments")
+        for workers in sorted({1, args.workers}):
+            seconds, first, segments = run_windows(path, workers)
+            last_end = max((s["end"] for s in segments), default=0.0)
+            print(f"{f'windows x{workers}':>16}: RTF {seconds / duration:.3f} ({seconds:.1f}s), "
+                  f"first chunk after {first or 0:.1f}s, {len(segments)} segments, "
+                  f"last ends at {last_end:.1f}s of {duration:.1f}s")
@@ -0,0 +1,70 @@
+# backend/bench/batching.py
+# Queries/sec at 1, 8 and 32 concurrent clients: one-at-a-time generate_answer
+# (capped at LLM_CONCURRENCY, as /query did) vs the QueryBatcher.
+#   python -m bench.batching --queries 64 --max-new-tokens 64
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batcher import QueryBatcher, BATCH_WINDOW_MS, BATCH_MAX_SIZE
+from bench.common import percentile
+from rag_generate import generate_answer
+from workers import MODEL_CONCURRENCY
+
+QUERIES = [
+    "What is retrieval-augmented generation?",
+    "How does a random forest make predictions?",
+    "Summarize the audio recording.",
+    "What are the main findings of the report?",
+]
+
+
+def run(call, clients, n_queries):
+    latencies = []
+
+    def one(i):
+        start = time.perf_counter()
+        call(QUERIES[i % len(QUERIES)])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(n_queries)))
+    elapsed = time.perf_counter() - start
+    return n_queries / elapsed, percentile(latencies, 50), percentile(latencies, 95)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=64, help="queries per concurrency level")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=BATCH_MAX_SIZE)
+    args = parser.parse_args()
+
+    llm_slots = threading.Semaphore(MODEL_CONCURRENCY["llm"])
+
+    def single(q):
+        with llm_slots:
+            return generate_answer(q, max_new_tokens=args.max_new_tokens)
+
+    batcher = QueryBatcher(window_ms=args.window_ms, max_batch=args.max_batch)
+
+    def batched(q):
+        return batcher.submit(q, max_new_tokens=args.max_new_tokens).result()
+
+    single(QUERIES[0])  # load models and exclude lazy init from the timings
+    print(f"{args.queries} queries per level, max_new_tokens={args.max_new_tokens}, "
+          f"window={args.window_ms}ms, max_batch={args.max_batch}")
+    print(f"{'clients':>7} {'mode':>8} {'qps':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for clients in args.clients:
+        base = run(single, clients, args.queries)
+        seen = batcher.batches
+        fast = run(batched, clients, args.queries)
+        for mode, (qps, p50, p95) in (("single", base), ("batched", fast)):
+            print(f"{clients:>7} {mode:>8} {qps:8.2f} {p50:9.1f} {p95:9.1f}")
+        print(f"{'':>7} speedup {fast[0] / base[0]:.2f}x, "
+              f"mean batch {args.queries / max(batcher.batches - seen, 1):.1f}")
+    batcher.close()
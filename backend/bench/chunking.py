@@ -0,0 +1,96 @@
+# backend/bench/chunking.py
+# Fixed 800-char windows vs the structure-aware token chunker on the text
+# documents in data/uploads: chunks per document, tokens embedded (and lost
+# to MiniLM's 256-token truncation), embedding time and retrieval hit rate.
+# Each query is a word window from a document; a hit means a top-k chunk
+# covers the window's centre. The same queries are used for every chunker.
+#   python -m bench.chunking --queries 200 --top-k 5
+import argparse
+import random
+import re
+import time
+
+import faiss
+
+from chunking import CHUNKERS, get_chunker
+from embedding import encode_texts
+from ingest import AUDIO_EXTS, IMAGE_EXTS, UPLOADS_DIR, extract_text_from_docx, iter_pdf_pages
+from model_registry import get_embedder
+
+
+def load_documents(limit):
+    """[(doc key, text)]: one entry per PDF page, one per other document."""
+    docs, n_files = [], 0
+    for path in sorted(p for p in UPLOADS_DIR.glob("*") if p.is_file()):
+        ext = path.suffix.lower()
+        if ext in IMAGE_EXTS + AUDIO_EXTS or n_files >= limit:
+            continue
+        try:
+            if ext == ".pdf":
+                docs.extend(((path.name, p["page"]), p["text"]) for p in iter_pdf_pages(str(path), workers=1))
+            elif ext in (".docx", ".doc"):
+                docs.append(((path.name, None), extract_text_from_docx(str(path))["text"]))
+            else:
+                docs.append(((path.name, None), path.read_text(encoding="utf-8")))
+        except Exception as e:
+            print(f"Skipping {path.name}: {e!r}")
+            continue
+        n_files += 1
+    return [(key, text) for key, text in docs if text.strip()], n_files
+
+
+def make_queries(docs, n, rng, window=12):
+    queries = []
+    for _ in range(n * 4):
+        key, text = rng.choice(docs)
+        words = [(m.start(), m.end()) for m in re.finditer(r"\S+", text)]
+        if len(words) < window:
+            continue
+        at = rng.randrange(len(words) - window + 1)
+        span = words[at:at + window]
+        centre = words[at + window // 2][0]
+        queries.append((text[span[0][0]:span[-1][1]], key, centre))
+        if len(queries) == n:
+            break
+    return queries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    docs, n_files = load_documents(args.files)
+    if not docs:
+        raise SystemExit(f"No text documents in {UPLOADS_DIR}")
+    model = get_embedder()
+    max_len = model.max_seq_length
+    queries = make_queries(docs, args.queries, random.Random(args.seed))
+    qvecs = encode_texts(model, [q for q, _, _ in queries])
+    print(f"{n_files} files ({len(docs)} pages/documents), {len(queries)} queries, top_k={args.top_k}")
+
+    for name in CHUNKERS:
+        chunker = get_chunker(name)
+        start = time.perf_counter()
+        chunks = [(key, s, e, text.strip()) for key, doc in docs for s, e, text in chunker.chunk(doc)]
+        chunk_seconds = time.perf_counter() - start
+        texts = [c[3] for c in chunks]
+        # uncapped (+ [CLS]/[SEP]), to see what truncation drops
+        lengths = [n + 2 for n in get_chunker("structure").count_tokens(texts)]
+        embedded = sum(min(n, max_len) for n in lengths)
+        lost = sum(max(n - max_len, 0) for n in lengths)
+        start = time.perf_counter()
+        vecs = encode_texts(model, texts)
+        embed_seconds = time.perf_counter() - start
+
+        index = faiss.IndexFlatIP(vecs.shape[1])
+        index.add(vecs)
+        _, ids = index.search(qvecs, args.top_k)
+        hits = sum(any(chunks[i][0] == key and chunks[i][1] <= centre < chunks[i][2] for i in row if i >= 0)
+                   for (_, key, centre), row in zip(queries, ids))
+        print(f"{name:>10}: {len(chunks) / n_files:7.1f} chunks/file, {embedded:>8} tokens embedded "
+              f"({lost} truncated), chunking {chunk_seconds:6.2f}s, embedding {embed_seconds:6.2f}s, "
+              f"hit@{args.top_k} {hits / max(len(queries), 1):6.1%}")
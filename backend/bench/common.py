@@ -0,0 +1,36 @@
+# backend/bench/common.py
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+INGESTED_DIR = BASE_DIR / "data" / "ingested"
+
+
+def load_sample_chunks(repeat: int = 1) -> List[Dict]:
+    """Chunks from data/ingested/*.jsonl, optionally repeated to get a bigger sample."""
+    chunks = []
+    for jsonl_file in sorted(INGESTED_DIR.glob("*.jsonl")):
+        with open(jsonl_file, "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                if item.get("text", "").strip():
+                    chunks.append(item)
+    return chunks * max(repeat, 1)
+
+
+@contextmanager
+def timer(result: Dict, key: str):
+    start = time.perf_counter()
+    yield
+    result[key] = time.perf_counter() - start
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
@@ -0,0 +1,151 @@
+# backend/bench/corpus.py
+# Seeded synthetic corpora for bench.suite: plain text, DOCX, text-layer PDF,
+# PNG scans and WAV audio, written to a scratch directory. Prose is drawn
+# from a fixed vocabulary; each document also states a few unique facts
+# ("The budget code of project KX-4821 is 739104.") whose questions and answers
+# are returned as retrieval ground truth. The same seed gives the same files.
+import random
+from pathlib import Path
+from typing import Dict, List, Optional
+
+WORDS = """
+system data model index query document page section result value process table
+network memory storage request response server client signal pattern method
+analysis report review policy budget project team market product customer
+service support design test build release version change update record file
+image audio text source target layer vector token batch cache search score
+rank filter stage worker thread queue limit level range sample metric error
+quality latency throughput cost time rate growth risk plan goal task step
+first second final early late high low large small fast slow new old common
+simple complex local global public private manual automatic annual monthly
+improves reduces supports requires describes measures compares tracks shows
+uses builds stores returns reads writes sends receives checks runs starts
+""".split()
+
+LETTERS = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+ATTRIBUTES = ["budget code", "launch year", "room number", "ticket id", "batch size", "owner id"]
+MODALITIES = ("text", "docx", "pdf", "image", "audio")
+
+
+def sentence(rng: random.Random, low: int = 8, high: int = 16) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng: random.Random, sentences: int = 5) -> str:
+    return " ".join(sentence(rng) for _ in range(rng.randint(max(1, sentences - 2), sentences + 2)))
+
+
+def make_fact(rng: random.Random, file_name: str, modality: str, seen: set) -> Dict:
+    while True:
+        entity = f"project {rng.choice(LETTERS)}{rng.choice(LETTERS)}-{rng.randint(1000, 9999)}"
+        if entity not in seen:
+            seen.add(entity)
+            break
+    attribute, value = rng.choice(ATTRIBUTES), str(rng.randint(100000, 999999))
+    return {"query": f"What is the {attribute} of {entity}?", "answer": value,
+            "sentence": f"The {attribute} of {entity} is {value}.",
+            "file_name": file_name, "modality": modality}
+
+
+def document(rng: random.Random, paragraphs: int, facts: List[Dict]) -> List[str]:
+    """Paragraphs of filler with each fact's sentence placed inside a random one."""
+    out = [paragraph(rng) for _ in range(paragraphs)]
+    for fact in facts:
+        i = rng.randrange(len(out))
+        out[i] = f"{out[i]} {fact['sentence']} {sentence(rng)}"
+    return out
+
+
+# ----------------- Writers -----------------
+def write_text(path: Path, paragraphs: List[str]):
+    path.write_text("\n\n".join(paragraphs) + "\n", encoding="utf-8")
+
+
+def write_docx(path: Path, paragraphs: List[str]):
+    import docx
+    d = docx.Document()
+    for i, text in enumerate(paragraphs):
+        if i % 4 == 0:
+            d.add_heading(f"Section {i // 4 + 1}", level=2)
+        d.add_paragraph(text)
+    d.save(str(path))
+
+
+def write_pdf(path: Path, pages: List[List[str]]):
+    import fitz
+    doc = fitz.open()
+    for paragraphs in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(54, 54, 558, 788), "\n\n".join(paragraphs), fontsize=10)
+    doc.save(str(path))
+    doc.close()
+
+
+def write_image(path: Path, text: str, dpi: int = 150):
+    # A short text rendered like a scanned note; OCR is the only way to read it
+    import fitz
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=300)
+    page.insert_textbox(fitz.Rect(24, 24, 588, 276), text, fontsize=14)
+    page.get_pixmap(dpi=dpi).save(str(path))
+    doc.close()
+
+
+def write_audio(path: Path, minutes: float, clip: Optional[str], seed: int):
+    import numpy as np
+    from bench.audio import synthesize, write_wav
+    from transcribe import load_audio
+    write_wav(path, synthesize(load_audio(clip) if clip else None, minutes, np.random.default_rng(seed)))
+
+
+# ----------------- Corpus -----------------
+def make_corpus(out_dir: Path, docs: int = 10, paragraphs: int = 12, pdf_pages: int = 5,
+                images: int = 10, audio_files: int = 1, audio_minutes: float = 2.0,
+                audio_clip: Optional[str] = None, facts_per_doc: int = 3, seed: int = 0) -> Dict:
+    """
+    Write the corpus under `out_dir`; returns {"files": {modality: [paths]},
+    "facts": [{"query", "answer", "file_name", "modality", ...}]}.
+    Audio carries no facts: its speech, if any, comes from `audio_clip`.
+    """
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files: Dict[str, List[Path]] = {m: [] for m in MODALITIES}
+    facts: List[Dict] = []
+    seen: set = set()
+
+    def new_facts(name, modality, n=facts_per_doc):
+        made = [make_fact(rng, name, modality, seen) for _ in range(n)]
+        facts.extend(made)
+        return made
+
+    for i in range(docs):
+        name = f"bench_{i:04d}.txt"
+        write_text(out_dir / name, document(rng, paragraphs, new_facts(name, "text")))
+        files["text"].append(out_dir / name)
+
+        name = f"bench_{i:04d}.docx"
+        write_docx(out_dir / name, document(rng, paragraphs, new_facts(name, "docx")))
+        files["docx"].append(out_dir / name)
+
+        name = f"bench_{i:04d}.pdf"
+        page_facts = new_facts(name, "pdf")
+        pages = [document(rng, max(1, paragraphs // pdf_pages), [f for j, f in enumerate(page_facts)
+                                                                 if j % pdf_pages == p])
+                 for p in range(pdf_pages)]
+        write_pdf(out_dir / name, pages)
+        files["pdf"].append(out_dir / name)
+
+    for i in range(images):
+        name = f"bench_{i:04d}.png"
+        fact = new_facts(name, "image", 1)[0]
+        write_image(out_dir / name, f"{sentence(rng)} {fact['sentence']} {sentence(rng)}")
+        files["image"].append(out_dir / name)
+
+    for i in range(audio_files if audio_minutes > 0 else 0):
+        name = f"bench_{i:04d}.wav"
+        write_audio(out_dir / name, audio_minutes, audio_clip, seed + i)
+        files["audio"].append(out_dir / name)
+
+    return {"files": files, "facts": facts}
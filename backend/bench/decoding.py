@@ -0,0 +1,69 @@
+# backend/bench/decoding.py
+# Encoder tokens and generation latency before/after context packing:
+#   before  all top-k chunks, max_length=2048, sampling (the old generate_answer)
+#   after   chunks packed into LLM_MAX_INPUT_TOKENS, for each decoding mode
+# Queries are the opening words of chunks from the sample corpus.
+#   python -m bench.decoding --queries 20 --max-new-tokens 128
+import argparse
+import random
+import time
+
+import torch
+
+from bench.common import load_sample_chunks, percentile
+from model_registry import get_llm, get_device
+from rag_generate import (DECODING_MODES, LLM_MAX_INPUT_TOKENS, TOP_K, build_prompt, pack_context,
+                          retrieve_chunks)
+
+
+def generate(prompt, max_length, max_new_tokens, config):
+    tokenizer, model = get_llm()
+    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=max_length).to(get_device())
+    start = time.perf_counter()
+    with torch.no_grad():
+        model.generate(**inputs, max_new_tokens=max_new_tokens, pad_token_id=tokenizer.eos_token_id, **config)
+    return int(inputs["input_ids"].shape[-1]), (time.perf_counter() - start) * 1000
+
+
+def report(name, tokens, latencies):
+    print(f"{name:>16}: {sum(tokens) / len(tokens):7.1f} encoder tokens/query, "
+          f"p50 {percentile(latencies, 50):8.1f} ms, p95 {percentile(latencies, 95):8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = load_sample_chunks()
+    if not chunks:
+        raise SystemExit("No sample chunks in data/ingested; ingest some files first")
+    rng = random.Random(args.seed)
+    queries = [" ".join(c["text"].split()[:12]) for c in rng.sample(chunks, min(args.queries, len(chunks)))]
+    contexts = [(q, retrieve_chunks(q, TOP_K)) for q in queries]
+    contexts = [(q, found) for q, found in contexts if found]
+    generate("warm up", 16, 4, DECODING_MODES["greedy"])
+
+    tokens, latencies = [], []
+    for q, found in contexts:
+        n, ms = generate(build_prompt(q, found), 2048, args.max_new_tokens, DECODING_MODES["sampling"])
+        tokens.append(n)
+        latencies.append(ms)
+    print(f"{len(contexts)} queries, top_k={TOP_K}, max_new_tokens={args.max_new_tokens}, "
+          f"input budget={LLM_MAX_INPUT_TOKENS}")
+    report("before/sampling", tokens, latencies)
+    before = sum(tokens)
+
+    packed = [pack_context(q, found) for q, found in contexts]
+    kept = sum(len(used) for _, used, _ in packed) / max(len(packed), 1)
+    for mode, config in DECODING_MODES.items():
+        tokens, latencies = [], []
+        for prompt, _, _ in packed:
+            n, ms = generate(prompt, LLM_MAX_INPUT_TOKENS, args.max_new_tokens, config)
+            tokens.append(n)
+            latencies.append(ms)
+        report(f"packed/{mode}", tokens, latencies)
+    print(f"chunks kept per query: {kept:.1f} of {TOP_K}; "
+          f"encoder tokens: {sum(tokens) / max(before, 1):.0%} of before")
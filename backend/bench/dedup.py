@@ -0,0 +1,114 @@
+# backend/bench/dedup.py
+# Index size after a run of repeated uploads, built four ways in scratch
+# directories from the chunks in data/ingested:
+#   append   every upload adds its chunks (the old behaviour, random ids)
+#   upsert   content-derived ids: a re-upload replaces the file's chunks
+#   dedup    upsert + aliasing exact duplicates of other files' chunks (default)
+#   near     dedup + near duplicates (NEAR_DUP_BITS=3)
+# The upload sequence: every file, every file again, a renamed copy of each,
+# a revision of each with REVISE_SHARE of its chunks lightly edited, then an
+# edited copy of each under a new name. Half of the edits insert a word, half
+# an invoice number. Against the size, "text recall" is the share of the
+# final files' chunks whose exact text is still in a row of the index, so
+# keyword search can match every token of it. Near-dup aliases give up that
+# share to save vectors.
+#   python -m bench.dedup --files 10
+import argparse
+import random
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+from bench.common import load_sample_chunks
+from dedup import ChunkIds, normalize_text
+from index_service import IndexService
+from model_registry import get_embedder
+
+REVISE_SHARE = 0.1
+NEAR_BITS = 3
+STRATEGIES = ("append", "upsert", "dedup", "near")
+
+
+def with_ids(file_name, chunks):
+    chunk_id = ChunkIds(file_name)
+    return [{**c, "file_name": file_name, "id": chunk_id(c["text"])} for c in chunks]
+
+
+def revise(chunks, rng):
+    out = []
+    for c in chunks:
+        if rng.random() < REVISE_SHARE:
+            words = c["text"].split()
+            edit = "revised" if rng.random() < 0.5 else f"INV-{rng.randint(10000, 99999)}"
+            words.insert(rng.randrange(len(words) + 1), edit)
+            c = {**c, "text": " ".join(words)}
+        out.append(c)
+    return out
+
+
+def uploads(files, rng):
+    for name, chunks in files.items():
+        yield name, with_ids(name, chunks)
+    for name, chunks in files.items():
+        yield name, with_ids(name, chunks)
+    for name, chunks in files.items():
+        yield f"copy of {name}", with_ids(f"copy of {name}", chunks)
+    for name, chunks in files.items():
+        yield name, with_ids(name, revise(chunks, rng))
+    for name, chunks in files.items():
+        yield f"edited copy of {name}", with_ids(f"edited copy of {name}", revise(chunks, rng))
+
+
+def text_recall(service, final) -> float:
+    """Share of the final uploads' chunks whose text is held verbatim by a live row."""
+    rows = service.metadata
+    texts = {normalize_text(rows[r]["text"]) for r in range(len(rows)) if r not in service.deleted}
+    chunks = [c for file_chunks in final.values() for c in file_chunks]
+    return sum(normalize_text(c["text"]) in texts for c in chunks) / max(len(chunks), 1)
+
+
+def run(strategy, files, model, seed):
+    rng = random.Random(seed)
+    embedded = 0
+    final = {}
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        service = IndexService(vector_dir=tmp)
+        service.near_dup_bits = NEAR_BITS if strategy == "near" else 0
+        for name, chunks in uploads(files, rng):
+            final[name] = chunks
+            if strategy == "append":
+                embedded += service.add_chunks([{**c, "id": str(uuid.uuid4())} for c in chunks], model)
+            else:
+                embedded += service.upsert_file(name, [chunks], model, dedup=strategy != "upsert")["added"]
+        service.compact()
+        stats = service.stats()
+        recall = text_recall(service, final)
+    return stats, embedded, recall, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10, help="ingested files to use")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    by_file = defaultdict(list)
+    for c in load_sample_chunks():
+        by_file[c["file_name"]].append(c)
+    files = dict(sorted(by_file.items())[:args.files])
+    if not files:
+        raise SystemExit("No ingested chunks found; run ingest_dir.py first")
+    model = get_embedder()
+    n_chunks = sum(len(c) for c in files.values())
+    print(f"{len(files)} files, {n_chunks} chunks; 5 uploads per file "
+          "(repeat, renamed copy, revision, edited copy)")
+
+    baseline = None
+    for strategy in STRATEGIES:
+        stats, embedded, recall, seconds = run(strategy, files, model, args.seed)
+        baseline = baseline or stats["vectors"]
+        print(f"{strategy:>8}: {stats['vectors']:>7} vectors ({stats['vectors'] / baseline:6.1%} of append), "
+              f"{stats['aliases']:>6} aliases, {stats['index_mb']:8.2f} MB, {embedded:>7} chunks embedded, "
+              f"text recall {recall:6.1%}, {seconds:7.1f}s")
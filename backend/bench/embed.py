@@ -0,0 +1,49 @@
+# backend/bench/embed.py
+# Chunks/sec for per-chunk vs batched embedding on the sample corpus.
+#   python -m bench.embed --repeat 20 --batch-size 64
+import argparse
+
+import faiss
+import numpy as np
+
+from bench.common import load_sample_chunks, timer
+from embed_faiss import DIM
+from embedding import embed_into_index
+from model_registry import get_embedder
+
+
+def per_chunk(model, chunks):
+    index = faiss.IndexFlatIP(DIM)
+    for c in chunks:
+        emb = model.encode(c["text"].strip(), convert_to_numpy=True, normalize_embeddings=True)
+        index.add(np.array([emb], dtype="float32"))
+    return index.ntotal
+
+
+def batched(model, chunks, batch_size):
+    index = faiss.IndexFlatIP(DIM)
+    embed_into_index(model, chunks, index, [], batch_size=batch_size)
+    return index.ntotal
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20, help="repeat the sample corpus N times")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    chunks = load_sample_chunks(args.repeat)
+    print(f"Corpus: {len(chunks)} chunks")
+    model = get_embedder()
+    model.encode(["warm up"])  # exclude lazy CUDA/MKL init from the timings
+
+    res = {}
+    with timer(res, "per_chunk"):
+        n1 = per_chunk(model, chunks)
+    with timer(res, "batched"):
+        n2 = batched(model, chunks, args.batch_size)
+    assert n1 == n2, (n1, n2)
+
+    for mode in ("per_chunk", "batched"):
+        print(f"{mode:>10}: {n1 / res[mode]:8.1f} chunks/sec ({res[mode]:.2f}s)")
+    print(f"speedup: {res['per_chunk'] / res['batched']:.2f}x")
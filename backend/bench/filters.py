@@ -0,0 +1,46 @@
+# backend/bench/filters.py
+# Filtered vs unfiltered dense search latency on the live index, per file:
+# a filtered query should cost in proportion to the file's chunk count.
+#   python -m bench.filters --queries 50
+import argparse
+import random
+import time
+from collections import Counter
+
+from bench.common import percentile
+from index_service import get_index_service
+from rag_generate import embed_query
+
+
+def time_search(service, vecs, filters):
+    latencies = []
+    for vec in vecs:
+        start = time.perf_counter()
+        service.search(vec.reshape(1, -1), 5, filters=filters)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return percentile(latencies, 50), percentile(latencies, 95)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--files", type=int, default=5, help="files to filter on (largest, smallest and between)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    service = get_index_service()
+    if not len(service):
+        raise SystemExit("Index is empty; ingest some files first")
+    rng = random.Random(args.seed)
+    rows = [r for r in range(len(service.metadata)) if r not in service.deleted]
+    sizes = Counter(service.metadata[r]["file_name"] for r in rows)
+    ranked = [name for name, _ in sizes.most_common()]
+    picks = [ranked[int(i * (len(ranked) - 1) / max(args.files - 1, 1))] for i in range(min(args.files, len(ranked)))]
+    vecs = [embed_query(service.metadata[r]["text"][:200]) for r in rng.sample(rows, min(args.queries, len(rows)))]
+    service.search(vecs[0].reshape(1, -1), 5, filters={"file_name": picks[0]})  # build the attribute index
+
+    p50, p95 = time_search(service, vecs, None)
+    print(f"{'(no filter)':>32} {len(rows):>8} rows: p50 {p50:7.2f} ms, p95 {p95:7.2f} ms")
+    for name in dict.fromkeys(picks):
+        p50, p95 = time_search(service, vecs, {"file_name": [name]})
+        print(f"{name[:32]:>32} {sizes[name]:>8} rows: p50 {p50:7.2f} ms, p95 {p95:7.2f} ms")
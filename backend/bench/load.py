@@ -0,0 +1,74 @@
+# backend/bench/load.py
+# /query latency with and without concurrent uploads, against a running server:
+#   uvicorn main:app --port 8000 &
+#   python -m bench.load --url http://localhost:8000 --clients 8 --seconds 30
+# Needs httpx (pip install httpx).
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+import httpx
+
+from bench.common import BASE_DIR, percentile
+
+QUERIES = [
+    "What is retrieval-augmented generation?",
+    "How does a random forest make predictions?",
+    "Summarize the audio recording.",
+]
+
+
+async def query_client(client, url, stop_at, latencies, statuses):
+    i = 0
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        r = await client.post(f"{url}/query", json={"query": QUERIES[i % len(QUERIES)]})
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+        i += 1
+
+
+async def upload_client(client, url, stop_at, files, statuses):
+    i = 0
+    while time.perf_counter() < stop_at:
+        path = files[i % len(files)]
+        with open(path, "rb") as f:
+            r = await client.post(f"{url}/upload", files={"file": (f"load_{i}_{path.name}", f.read())})
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+        if r.status_code == 429:
+            await asyncio.sleep(1)
+        i += 1
+
+
+async def phase(url, clients, uploaders, seconds, files):
+    latencies, q_status, u_status = [], {}, {}
+    stop_at = time.perf_counter() + seconds
+    async with httpx.AsyncClient(timeout=600) as client:
+        tasks = [query_client(client, url, stop_at, latencies, q_status) for _ in range(clients)]
+        tasks += [upload_client(client, url, stop_at, files, u_status) for _ in range(uploaders)]
+        await asyncio.gather(*tasks)
+    return latencies, q_status, u_status
+
+
+def report(label, latencies, q_status, u_status):
+    print(f"{label:<16} n={len(latencies):5d}  p50={percentile(latencies, 50):8.1f} ms  "
+          f"p99={percentile(latencies, 99):8.1f} ms  query={q_status}  upload={u_status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent /query clients")
+    parser.add_argument("--uploaders", type=int, default=4, help="concurrent /upload clients in phase 2")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--files", type=Path, nargs="*",
+                        default=sorted((BASE_DIR / "data" / "uploads").glob("*.*")))
+    args = parser.parse_args()
+
+    baseline = asyncio.run(phase(args.url, args.clients, 0, args.seconds, args.files))
+    report("queries only", *baseline)
+    loaded = asyncio.run(phase(args.url, args.clients, args.uploaders, args.seconds, args.files))
+    report("with uploads", *loaded)
+    ratio = percentile(loaded[0], 99) / max(percentile(baseline[0], 99), 1e-9)
+    print(f"p99 ratio (with uploads / queries only): {ratio:.2f}")
@@ -0,0 +1,68 @@
+# backend/bench/meta_store.py
+# Open time, RSS growth and top-k lookup cost: metadatas.json vs the
+# memory-mapped columnar store, on a synthetic corpus.
+#   python -m bench.meta_store --rows 200000
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from meta_store import MetaStore, write_store
+from model_registry import process_rss_bytes
+
+
+def synthetic_records(n: int):
+    rng = random.Random(0)
+    words = "retrieval augmented generation index vector chunk page audio image scan".split()
+    for i in range(n):
+        yield {
+            "id": f"{i:032x}",
+            "file_name": f"doc_{i % 500}.pdf",
+            "source_type": "pdf",
+            "page": i % 300 + 1,
+            "char_start": 0,
+            "char_end": 800,
+            "start_time": None,
+            "end_time": None,
+            "raw_path": f"/data/uploads/doc_{i % 500}.pdf",
+            "text": " ".join(rng.choice(words) for _ in range(120)),
+        }
+
+
+def measure(label, open_fn, rows, k=5):
+    rss = process_rss_bytes()
+    start = time.perf_counter()
+    store = open_fn()
+    open_s = time.perf_counter() - start
+    grown = (process_rss_bytes() - rss) / 1e6
+    start = time.perf_counter()
+    for _ in range(1000):
+        for i in random.sample(range(rows), k):
+            store[i]["text"]
+    lookup_us = (time.perf_counter() - start) / 1000 * 1e6
+    print(f"{label:<10} open {open_s * 1000:9.1f} ms   RSS +{grown:8.1f} MB   top-{k} decode {lookup_us:7.1f} us")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        with open(tmp / "metadatas.json", "w", encoding="utf-8") as f:
+            json.dump(list(synthetic_records(args.rows)), f, ensure_ascii=False, indent=2)
+        write_store(tmp, synthetic_records(args.rows))
+        print(f"{args.rows} rows")
+
+        def open_json():
+            with open(tmp / "metadatas.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        # Columnar first so the JSON load does not inflate its RSS baseline
+        store = measure("columnar", lambda: MetaStore(tmp), args.rows)
+        measure("json", open_json, args.rows)
+        store.close()
@@ -0,0 +1,76 @@
+# backend/bench/ocr.py
+# Pages/sec of OCR on a synthetic image-only PDF (text pages rendered to
+# 300-DPI bitmaps, as a scanner would produce): one readtext call per page at
+# scan resolution, as image ingestion did, vs the OCR stage (grayscale at
+# OCR_DPI, batched, optionally across worker processes), then a re-run that
+# is served from the content-hash cache.
+#   python -m bench.ocr --pages 40 --workers 2
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import fitz
+import numpy as np
+
+from model_registry import get_ocr_reader
+from ocr import OCR_BATCH_SIZE, OCR_DPI, iter_ocr_pdf_pages
+
+SCAN_DPI = 300
+LINE = "Invoice 4471-B was approved on 12 March; the retrieval index covers every scanned page. "
+
+
+def make_scanned_pdf(path: Path, pages: int):
+    src, out = fitz.open(), fitz.open()
+    for pno in range(pages):
+        page = src.new_page()
+        page.insert_textbox(fitz.Rect(54, 54, 558, 788), f"Page {pno + 1}. " + LINE * 12, fontsize=11)
+        pix = page.get_pixmap(dpi=SCAN_DPI)
+        scan = out.new_page(width=page.rect.width, height=page.rect.height)
+        scan.insert_image(scan.rect, pixmap=pix)
+    out.save(str(path))
+    src.close()
+    out.close()
+
+
+def per_page_baseline(path: Path, pages: int) -> float:
+    reader = get_ocr_reader()
+    doc = fitz.open(str(path))
+    start = time.perf_counter()
+    for pno in range(pages):
+        pix = doc[pno].get_pixmap(dpi=SCAN_DPI)
+        img = np.frombuffer(pix.samples, dtype="uint8").reshape(pix.height, pix.width, pix.n)
+        reader.readtext(img)
+    doc.close()
+    return time.perf_counter() - start
+
+
+def staged(path: Path, pages: int, workers: int, cache_path) -> float:
+    start = time.perf_counter()
+    n = sum(1 for _ in iter_ocr_pdf_pages(str(path), list(range(1, pages + 1)), workers=workers,
+                                          cache_path=cache_path))
+    assert n == pages
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "scan.pdf"
+        make_scanned_pdf(pdf, args.pages)
+        get_ocr_reader()  # exclude model load from the in-process runs
+        print(f"{args.pages} scanned pages at {SCAN_DPI} DPI; OCR stage at {OCR_DPI} DPI, batch {OCR_BATCH_SIZE}")
+
+        seconds = per_page_baseline(pdf, args.pages)
+        print(f"{'per page, scan DPI':>24}: {args.pages / seconds:6.2f} pages/sec")
+        for workers in sorted({1, args.workers}):
+            seconds = staged(pdf, args.pages, workers, None)
+            print(f"{f'batched x{workers}':>24}: {args.pages / seconds:6.2f} pages/sec")
+        cache_path = Path(tmp) / "ocr_cache.sqlite3"
+        staged(pdf, args.pages, 1, cache_path)
+        seconds = staged(pdf, args.pages, 1, cache_path)
+        print(f"{'cached re-run':>24}: {args.pages / seconds:6.2f} pages/sec")
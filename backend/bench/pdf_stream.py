@@ -0,0 +1,77 @@
+# backend/bench/pdf_stream.py
+# Peak RSS and wall time of PDF ingestion on a synthetic multi-thousand-page
+# document: the old build-everything-in-lists path vs the streaming pipeline
+# (single process and with multiprocess page-range extraction). Each mode runs
+# in a fresh subprocess so peak RSS is not shared between modes.
+#   python -m bench.pdf_stream --pages 5000
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import fitz
+
+LINE = "Retrieval-augmented generation grounds answers in retrieved document chunks. "
+
+
+def make_pdf(path: Path, pages: int):
+    doc = fitz.open()
+    for pno in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), f"Page {pno + 1}. " + LINE * 40, fontsize=9)
+    doc.save(str(path))
+    doc.close()
+
+
+def run_child(mode: str, pdf: str):
+    # PDF_EXTRACT_WORKERS comes from the environment set by the parent
+    from ingest import chunk_text, extract_text_from_pdf, iter_chunks
+
+    start = time.perf_counter()
+    n = 0
+    with tempfile.TemporaryFile("w", encoding="utf-8") as fh:
+        if mode == "lists":
+            # Previous behaviour: every page's text, then every chunk dict, then the JSONL
+            info = extract_text_from_pdf(pdf)
+            items = [{"page": p["page"], "char_start": s, "char_end": e, "text": c.strip()}
+                     for p in info["pages"] for s, e, c in chunk_text(p["text"])]
+            for it in items:
+                fh.write(json.dumps(it) + "\n")
+            n = len(items)
+        else:
+            for it in iter_chunks(pdf):
+                fh.write(json.dumps(it) + "\n")
+                n += 1
+    seconds = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(json.dumps({"chunks": n, "seconds": seconds, "peak_rss_mb": peak_mb}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4, help="processes for the parallel streaming mode")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PDF"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1])
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "synthetic.pdf"
+        start = time.perf_counter()
+        make_pdf(pdf, args.pages)
+        print(f"{args.pages}-page PDF ({pdf.stat().st_size / 1e6:.1f} MB) built in {time.perf_counter() - start:.1f}s")
+        for mode, workers in (("lists", 1), ("stream", 1), ("stream", args.workers)):
+            env = {**os.environ, "PDF_EXTRACT_WORKERS": str(workers)}
+            out = subprocess.run([sys.executable, "-m", "bench.pdf_stream", "--child", mode, str(pdf)],
+                                 capture_output=True, text=True, check=True, env=env)
+            res = json.loads(out.stdout.strip().splitlines()[-1])
+            label = f"{mode} x{workers}"
+            print(f"{label:<12} {res['chunks']:7d} chunks  {res['seconds']:7.2f}s  peak RSS {res['peak_rss_mb']:7.1f} MB")
@@ -0,0 +1,36 @@
+# backend/bench/rebuild.py
+# embed_faiss.build_index over data/ingested: a full re-embed (no cache) vs a
+# rebuild from a warm embedding cache, and a warm rebuild after one file's
+# chunks changed. Nothing is written to data/vectors.
+#   python -m bench.rebuild
+import time
+
+import embed_faiss
+from embedding_cache import get_embedding_cache
+
+if __name__ == "__main__":
+    items = embed_faiss.load_ingested_items()
+    if not items:
+        raise SystemExit("No ingested chunks; run ingest_dir.py --no-index first")
+    cache = get_embedding_cache()
+    if cache is None:
+        raise SystemExit("EMBED_CACHE=0; enable the embedding cache to run this benchmark")
+    print(f"{len(items)} chunks")
+
+    def run(label, use_cache, corpus=items):
+        start = time.perf_counter()
+        index, _ = embed_faiss.build_index(use_cache=use_cache, items=corpus)
+        seconds = time.perf_counter() - start
+        print(f"{label:>20}: {seconds:8.2f}s ({index.ntotal} vectors)")
+        return seconds
+
+    full = run("full re-embed", False)
+    run("fill cache", True)
+    warm = run("warm cache", True)
+
+    # one file's chunks change: only those are encoded again
+    changed = items[0]["file_name"]
+    revised = [{**it, "text": it["text"] + " (revised)"} if it["file_name"] == changed else it for it in items]
+    partial = run("one file changed", True, revised)
+    print(f"warm rebuild {full / max(warm, 1e-9):.1f}x faster, one changed file "
+          f"{full / max(partial, 1e-9):.1f}x faster than a full re-embed; cache {cache.stats()}")
@@ -0,0 +1,69 @@
+# backend/bench/rerank.py
+# Added latency vs ranking quality of the cross-encoder rerank stage.
+# Labels come from --labels (JSONL: {"query": ..., "relevant": [chunk ids]})
+# or, by default, from the same chunk-derived queries as bench.retrieval.
+#   python -m bench.rerank --queries 100 --top-k 5
+#   python -m bench.rerank --labels data/eval/queries.jsonl
+import argparse
+import json
+import random
+import time
+
+from bench.common import percentile
+from bench.retrieval import make_queries
+from index_service import get_index_service
+from rag_generate import candidate_k, embed_query, finalize_hits
+from reranker import RERANK_CANDIDATES
+
+
+def load_labels(path, service):
+    labeled = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            item = json.loads(line)
+            rows = service.metadata.rows_where("id", item["relevant"])
+            labeled.append((item["query"], set(rows)))
+    return labeled
+
+
+def evaluate(service, labeled, top_k, rerank, budget_ms):
+    latencies, hits, rr = [], 0, 0.0
+    for q, relevant in labeled:
+        start = time.perf_counter()
+        dense = service.search(embed_query(q).reshape(1, -1), candidate_k(top_k, "dense", rerank))[0]
+        found = finalize_hits(q, dense, top_k, "dense", rerank=rerank, rerank_budget_ms=budget_ms)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ranks = [i for i, h in enumerate(found, 1) if h["row"] in relevant]
+        hits += bool(ranks)
+        rr += 1.0 / ranks[0] if ranks else 0.0
+    n = max(len(labeled), 1)
+    return hits / n, rr / n, latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", help="JSONL of {query, relevant: [chunk ids]}")
+    parser.add_argument("--queries", type=int, default=100, help="generated queries when --labels is not given")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    service = get_index_service()
+    if args.labels:
+        labeled = load_labels(args.labels, service)
+    else:
+        labeled = [(q, {row}) for q, row in make_queries(service, args.queries, random.Random(args.seed))]
+    if not labeled:
+        raise SystemExit("No labeled queries (empty index?)")
+
+    # warm both models and exclude their load time; no budget so nothing degrades here
+    evaluate(service, labeled[:1], args.top_k, True, 0)
+    print(f"{len(labeled)} queries, top_k={args.top_k}, rerank candidates={RERANK_CANDIDATES}")
+    results = {}
+    for name, rerank in (("retrieval", False), ("reranked", True)):
+        hit, mrr, latencies = evaluate(service, labeled, args.top_k, rerank, 0)
+        results[name] = latencies
+        print(f"{name:>10}: hit@{args.top_k} {hit:6.1%}, MRR {mrr:.3f}, "
+              f"p50 {percentile(latencies, 50):7.1f} ms, p95 {percentile(latencies, 95):7.1f} ms")
+    added = [b - a for a, b in zip(results["retrieval"], results["reranked"])]
+    print(f"added latency: p50 {percentile(added, 50):.1f} ms, p95 {percentile(added, 95):.1f} ms")
@@ -0,0 +1,96 @@
+# backend/bench/retrieval.py
+# Latency and hit rate of dense, sparse (BM25) and hybrid (RRF) retrieval on
+# the live index. Each query is a short word window from an indexed chunk that
+# includes the chunk's rarest token (an identifier, number or acronym where
+# there is one); a hit means that chunk comes back in the top k.
+#   python -m bench.retrieval --queries 200 --top-k 5
+#   python -m bench.retrieval --sparse-scale 1000000   # BM25 alone on a synthetic 1M-row index
+import argparse
+import random
+import tempfile
+import time
+from collections import Counter
+
+from bench.common import load_sample_chunks, percentile
+from bm25_index import BM25Index, BM25Writer, tokenize
+from index_service import get_index_service
+from rag_generate import RETRIEVAL_MODES, HYBRID_WEIGHTS, candidate_k, combine_hits, embed_query
+
+
+def make_queries(service, n, rng, window=8):
+    live = [r for r in range(len(service.metadata)) if r not in service.deleted]
+    rows = rng.sample(live, min(n, len(live)))
+    df = Counter()
+    for row in rows:
+        df.update(set(tokenize(service.metadata[row]["text"])))
+    queries = []
+    for row in rows:
+        words = service.metadata[row]["text"].split()
+        if len(words) < 3:
+            continue
+        rare = min(tokenize(" ".join(words)) or [""], key=lambda t: (df[t], -len(t)))
+        at = next((i for i, w in enumerate(words) if rare and rare in w.lower()), 0)
+        start = max(0, min(at - window // 2, len(words) - window))
+        queries.append((" ".join(words[start:start + window]), row))
+    return queries
+
+
+def retrieve(service, query, mode, top_k):
+    dense = []
+    if mode != "sparse":
+        dense = service.search(embed_query(query).reshape(1, -1), candidate_k(top_k, mode))[0]
+    return combine_hits(query, dense, top_k, mode, HYBRID_WEIGHTS)
+
+
+def sparse_at_scale(n_rows, n_queries, top_k, rng):
+    chunks = load_sample_chunks()
+    if not chunks:
+        raise SystemExit("No sample chunks in data/ingested; ingest some files first")
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        writer = BM25Writer()
+        for i in range(n_rows):
+            # vary each copy with a unique identifier so postings are not all identical
+            writer.append(f"{chunks[i % len(chunks)]['text']} doc-{i:07d}")
+        writer.write(tmp)
+        print(f"Built BM25 over {n_rows} rows in {time.perf_counter() - start:.1f}s")
+        index = BM25Index(tmp)
+        latencies = {"identifier": [], "keywords": []}
+        for _ in range(n_queries):
+            i = rng.randrange(n_rows)
+            words = chunks[i % len(chunks)]["text"].split()
+            for kind, q in (("identifier", f"doc-{i:07d}"), ("keywords", " ".join(words[:4]))):
+                start = time.perf_counter()
+                index.search(q, top_k)
+                latencies[kind].append((time.perf_counter() - start) * 1000)
+        for kind, values in latencies.items():
+            print(f"{kind:>10}: p50 {percentile(values, 50):.3f} ms, p95 {percentile(values, 95):.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sparse-scale", type=int, default=0, help="also time BM25 alone on N synthetic rows")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    service = get_index_service()
+    queries = make_queries(service, args.queries, rng)
+    if queries:
+        retrieve(service, queries[0][0], "dense", args.top_k)  # load the embedder
+        print(f"{len(queries)} queries over {len(service)} chunks, top_k={args.top_k}")
+        for mode in RETRIEVAL_MODES:
+            latencies, hits = [], 0
+            for q, row in queries:
+                start = time.perf_counter()
+                found = retrieve(service, q, mode, args.top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += any(h["row"] == row for h in found)
+            print(f"{mode:>7}: hit@{args.top_k} {hits / len(queries):6.1%}, "
+                  f"p50 {percentile(latencies, 50):7.2f} ms, p95 {percentile(latencies, 95):7.2f} ms")
+    else:
+        print("Index is empty; skipping dense/sparse/hybrid comparison")
+    if args.sparse_scale:
+        sparse_at_scale(args.sparse_scale, args.queries, args.top_k, rng)
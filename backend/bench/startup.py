@@ -0,0 +1,81 @@
+# backend/bench/startup.py
+# Cold start of the API server, from process launch:
+#   import            seconds to `import main` alone (a separate process)
+#   first response    until GET / answers 200
+#   ready             until GET /health/ready answers 200; a tree without
+#                     that endpoint (which preloaded models before serving)
+#                     counts as ready at its first response
+# Runs `uvicorn main:app` in --cwd, so the same script can time an older
+# checkout for a before/after comparison:
+#   python -m bench.startup --runs 3
+#   git worktree add /tmp/before HEAD~1 && python -m bench.startup --cwd /tmp/before/backend
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def status_of(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return 0  # not listening yet
+
+
+def import_seconds(cwd: Path) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def one_run(cwd: Path, port: int, timeout: float) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)], cwd=cwd,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first = ready = None
+    try:
+        while time.perf_counter() - start < timeout and ready is None:
+            if server.poll() is not None:
+                raise SystemExit(f"Server exited with {server.returncode}")
+            if first is None and status_of(base + "/") == 200:
+                first = time.perf_counter() - start
+            if first is not None:
+                code = status_of(base + "/health/ready")
+                if code == 200 or code == 404:
+                    ready = time.perf_counter() - start if code == 200 else first
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return {"first_response_seconds": first, "ready_seconds": ready}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cwd", default=str(BACKEND_DIR), help="backend directory to start")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+    cwd = Path(args.cwd).resolve()
+
+    result = {"cwd": str(cwd), "preload": os.getenv("PRELOAD_MODELS", "embedder,llm"),
+              "import_seconds": round(import_seconds(cwd), 3), "runs": []}
+    print(f"import main: {result['import_seconds']:.2f}s")
+    for i in range(args.runs):
+        run = one_run(cwd, args.port, args.timeout)
+        result["runs"].append(run)
+        print(f"run {i + 1}: first response {run['first_response_seconds'] or float('nan'):.2f}s, "
+              f"ready {run['ready_seconds'] or float('nan'):.2f}s")
+    print(json.dumps(result))
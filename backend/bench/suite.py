@@ -0,0 +1,263 @@
+# backend/bench/suite.py
+# End-to-end benchmark on a seeded synthetic corpus (bench.corpus), written
+# as one JSON file per run so runs can be compared over time:
+#   ingest   files/sec, chunks/sec and MB/sec per modality (models loaded first)
+#   index    embedding + IndexService build time over every ingested chunk
+#   search   per-query latency percentiles and recall@k of dense, sparse and
+#            hybrid retrieval; a hit is a top-k chunk containing the fact's answer
+#   query    /query latency percentiles and throughput at each --concurrency,
+#            in process through main.app with the scratch index installed
+#
+# Everything runs in a scratch directory: data/vectors, data/ingested, the
+# job queue database and the embedding/OCR/query caches are not read or
+# written, so every run is cold. Only the results file lands in data/bench.
+# Models are the local ones main.py uses, on CPU and offline unless the
+# environment already says otherwise. /query needs httpx (pip install httpx).
+#   python -m bench.suite --docs 20 --images 10 --audio-minutes 2 --concurrency 1,8
+#   python -m bench.suite --skip audio,query --compare data/bench/<earlier run>.json
+import os
+
+# Before anything imports the modules that read these
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+for _name in ("EMBED_CACHE", "OCR_CACHE", "QUERY_CACHE"):
+    os.environ[_name] = "0"
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from bench.common import BASE_DIR, percentile
+from bench.corpus import MODALITIES, make_corpus
+
+RESULTS_DIR = BASE_DIR / "data" / "bench"
+SEARCH_MODES = ("dense", "sparse", "hybrid")
+
+
+def latency_summary(latencies_ms: List[float]) -> Dict:
+    return {"n": len(latencies_ms), "p50_ms": round(percentile(latencies_ms, 50), 3),
+            "p95_ms": round(percentile(latencies_ms, 95), 3), "p99_ms": round(percentile(latencies_ms, 99), 3),
+            "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 3) if latencies_ms else 0.0}
+
+
+def run_info() -> Dict:
+    from model_registry import EMBEDDING_MODEL_NAME, LLM_MODEL_NAME
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit,
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "models": {"embedder": EMBEDDING_MODEL_NAME, "llm": LLM_MODEL_NAME, "whisper": "tiny"}}  # as ingest.py
+
+
+# ----------------- Stages -----------------
+def bench_ingest(files: Dict[str, List[Path]], skip) -> Tuple[Dict, Dict[str, List[Dict]]]:
+    from ingest import iter_chunks
+    from model_registry import get_embed_tokenizer, get_ocr_reader, get_whisper
+
+    loaders = {"image": get_ocr_reader, "audio": lambda: get_whisper("tiny")}
+    results, chunks = {}, {}
+    start = time.perf_counter()
+    get_embed_tokenizer()  # the chunker's; shared by every modality
+    results["tokenizer_load_seconds"] = round(time.perf_counter() - start, 3)
+    for modality in MODALITIES:
+        paths = files.get(modality, [])
+        if modality in skip or not paths:
+            continue
+        try:
+            start = time.perf_counter()
+            if modality in loaders:
+                loaders[modality]()
+            load_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            chunks[modality] = [c for path in paths for c in iter_chunks(path)]
+            seconds = time.perf_counter() - start
+        except Exception as e:  # e.g. whisper not installed; the other modalities still count
+            results[modality] = {"error": repr(e)}
+            continue
+        mb = sum(p.stat().st_size for p in paths) / 1e6
+        results[modality] = {"files": len(paths), "chunks": len(chunks[modality]), "mb": round(mb, 3),
+                             "seconds": round(seconds, 3), "model_load_seconds": round(load_seconds, 3),
+                             "files_per_sec": round(len(paths) / seconds, 3),
+                             "chunks_per_sec": round(len(chunks[modality]) / seconds, 3),
+                             "mb_per_sec": round(mb / seconds, 3)}
+        print(f"ingest {modality:>6}: {len(paths)} files, {len(chunks[modality])} chunks "
+              f"in {seconds:.2f}s ({len(paths) / seconds:.2f} files/s)")
+    return results, chunks
+
+
+def bench_index(service, chunks: List[Dict]) -> Dict:
+    from model_registry import get_embedder
+    start = time.perf_counter()
+    embedder = get_embedder()
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    added = service.add_chunks(chunks, embedder)
+    seconds = time.perf_counter() - start
+    stats = service.stats()
+    print(f"index: {added} vectors in {seconds:.2f}s ({added / max(seconds, 1e-9):.1f} chunks/s)")
+    return {"vectors": added, "seconds": round(seconds, 3), "model_load_seconds": round(load_seconds, 3),
+            "chunks_per_sec": round(added / max(seconds, 1e-9), 3), "index_mb": stats["index_mb"],
+            "backend": stats["backend"]}
+
+
+def bench_search(service, facts: List[Dict], top_k: int) -> Dict:
+    from bench.retrieval import retrieve
+    from rag_generate import embed_query
+
+    embed_ms = []
+    for fact in facts:
+        start = time.perf_counter()
+        embed_query(fact["query"])
+        embed_ms.append((time.perf_counter() - start) * 1000)
+    results = {"queries": len(facts), "top_k": top_k, "embed_query": latency_summary(embed_ms)}
+    for mode in SEARCH_MODES:
+        latencies, hits, by_modality = [], 0, {}
+        for fact in facts:
+            start = time.perf_counter()
+            found = retrieve(service, fact["query"], mode, top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hit = any(fact["answer"] in h.get("text", "") for h in found)
+            hits += hit
+            seen = by_modality.setdefault(fact["modality"], [0, 0])
+            seen[0] += hit
+            seen[1] += 1
+        results[mode] = {**latency_summary(latencies), "recall": round(hits / max(len(facts), 1), 4),
+                         "recall_by_modality": {m: round(h / n, 4) for m, (h, n) in sorted(by_modality.items())}}
+        print(f"search {mode:>6}: recall@{top_k} {hits / max(len(facts), 1):6.1%}, "
+              f"p50 {results[mode]['p50_ms']:.2f} ms, p99 {results[mode]['p99_ms']:.2f} ms")
+    return results
+
+
+async def query_level(client, facts: List[Dict], clients: int, requests: int, max_new_tokens: int) -> Dict:
+    todo = iter(range(requests))
+    latencies, statuses, correct = [], {}, 0
+
+    async def worker():
+        nonlocal correct
+        for i in todo:
+            fact = facts[i % len(facts)]
+            start = time.perf_counter()
+            r = await client.post("/query", json={"query": fact["query"], "max_new_tokens": max_new_tokens})
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[str(r.status_code)] = statuses.get(str(r.status_code), 0) + 1
+            if r.status_code == 200 and fact["answer"] in r.json().get("answer", ""):
+                correct += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    seconds = time.perf_counter() - start
+    return {**latency_summary(latencies), "clients": clients, "seconds": round(seconds, 3),
+            "queries_per_sec": round(len(latencies) / seconds, 3), "statuses": statuses,
+            "answer_accuracy": round(correct / max(len(latencies), 1), 4)}
+
+
+async def bench_query(service, facts: List[Dict], levels: List[int], requests: int, max_new_tokens: int) -> Dict:
+    import httpx
+    import main
+
+    results = {"batching": main.batcher is not None, "max_new_tokens": max_new_tokens}
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            start = time.perf_counter()
+            await client.post("/query", json={"query": facts[0]["query"], "max_new_tokens": max_new_tokens})
+            results["first_query_seconds"] = round(time.perf_counter() - start, 3)  # includes the LLM load
+            for clients in levels:
+                level = await query_level(client, facts, clients, max(requests, clients), max_new_tokens)
+                results[f"c{clients}"] = level
+                print(f"query c={clients:<3}: {level['queries_per_sec']:.2f} q/s, p50 {level['p50_ms']:.0f} ms, "
+                      f"p99 {level['p99_ms']:.0f} ms, statuses {level['statuses']}")
+    finally:
+        if main.batcher is not None:
+            main.batcher.close()
+        main.pools.shutdown()
+    return results
+
+
+# ----------------- Comparing runs -----------------
+def flatten(d: Dict, prefix: str = "") -> Dict[str, float]:
+    out = {}
+    for key, value in d.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(previous: Dict, current: Dict):
+    old, new = flatten(previous.get("results", {})), flatten(current.get("results", {}))
+    print(f"\nvs {previous.get('run', {}).get('started_at')} ({previous.get('run', {}).get('commit')}):")
+    for name in sorted(set(old) & set(new)):
+        if old[name] != new[name]:
+            change = f"{(new[name] - old[name]) / abs(old[name]):+8.1%}" if old[name] else "     new"
+            print(f"  {name:<48} {old[name]:>12} -> {new[name]:<12} {change}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10, help="text, DOCX and PDF documents each")
+    parser.add_argument("--paragraphs", type=int, default=12, help="per document")
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--audio-files", type=int, default=1)
+    parser.add_argument("--audio-minutes", type=float, default=2.0)
+    parser.add_argument("--audio-clip", help="speech to repeat in the audio files (default: synthetic tones)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated /query client counts")
+    parser.add_argument("--requests", type=int, default=32, help="/query requests per concurrency level")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--skip", default="", help="comma-separated modalities and/or stages: search, query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help=f"results file (default: {RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+    skip = {s.strip() for s in args.skip.split(",") if s.strip()}
+
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "compare")}
+    report = {"run": run_info(), "config": config, "results": {}}
+    results = report["results"]
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["JOBS_DB"] = str(Path(tmp) / "jobs.sqlite3")  # read when main.py is imported
+        start = time.perf_counter()
+        corpus = make_corpus(Path(tmp) / "corpus", docs=args.docs, paragraphs=args.paragraphs,
+                             pdf_pages=args.pdf_pages, images=args.images,
+                             audio_files=0 if "audio" in skip else args.audio_files,
+                             audio_minutes=args.audio_minutes, audio_clip=args.audio_clip, seed=args.seed)
+        results["corpus"] = {"seconds": round(time.perf_counter() - start, 3),
+                             "files": {m: len(p) for m, p in corpus["files"].items()},
+                             "facts": len(corpus["facts"])}
+
+        results["ingest"], chunks = bench_ingest(corpus["files"], skip)
+        facts = [f for f in corpus["facts"] if f["modality"] in chunks]
+        all_chunks = [c for modality in MODALITIES for c in chunks.get(modality, [])]
+
+        import index_service
+        (Path(tmp) / "vectors").mkdir()
+        service = index_service.IndexService(vector_dir=Path(tmp) / "vectors")
+        index_service._service = service  # rag_generate, the batcher and main.py use the scratch index
+        results["index"] = bench_index(service, all_chunks)
+        if "search" not in skip and facts:
+            results["search"] = bench_search(service, facts, args.top_k)
+        if "query" not in skip and facts:
+            levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+            results["query"] = asyncio.run(bench_query(service, facts, levels, args.requests,
+                                                       args.max_new_tokens))
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"Results -> {out}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
@@ -0,0 +1,224 @@
+# backend/bm25_index.py
+# BM25 keyword index over the same rows as the FAISS index, so exact
+# identifiers, part numbers and acronyms that dense search blurs still match.
+#
+#   bm25_terms.json    vocabulary in term-id order
+#   bm25_offsets.npy   int64 [n_terms + 1]; term t's postings are [off[t], off[t + 1])
+#   bm25_docs.npy      int32 row numbers, ascending within each term
+#   bm25_tfs.npy       uint16 term frequencies, parallel to bm25_docs.npy
+#   bm25_doclens.npy   int32 token count per row
+#
+# Like meta_store, the snapshot files are memory-mapped and only the postings
+# of the query's terms are touched. Rows added since the snapshot (replayed
+# from the index service log) live in an in-memory tail until compaction
+# writes a new snapshot.
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+TERMS_FILE = "bm25_terms.json"
+OFFSETS_FILE = "bm25_offsets.npy"
+DOCS_FILE = "bm25_docs.npy"
+TFS_FILE = "bm25_tfs.npy"
+DOCLENS_FILE = "bm25_doclens.npy"
+BM25_FILES = (TERMS_FILE, OFFSETS_FILE, DOCS_FILE, TFS_FILE, DOCLENS_FILE)
+
+K1 = 1.2
+B = 0.75
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+PART_RE = re.compile(r"[-_./]")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have if in into is it its of on or so such that the their "
+    "then there these they this to was were will with".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound tokens like "ab-1234" or "v2.1" also yield their parts."""
+    tokens = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        if tok in STOPWORDS:
+            continue
+        tokens.append(tok)
+        if not tok.isalnum():
+            tokens.extend(p for p in PART_RE.split(tok) if p and p not in STOPWORDS)
+    return tokens
+
+
+def bm25_exists(directory: Path) -> bool:
+    return all((Path(directory) / name).exists() for name in BM25_FILES)
+
+
+# ----------------- Writing -----------------
+class BM25Writer:
+    """Accumulates postings for rows 0..n-1 in order and writes a snapshot."""
+
+    def __init__(self):
+        self._terms: Dict[str, int] = {}
+        self._term_ids = array("i")
+        self._rows = array("i")
+        self._tfs = array("H")
+        self._doclens = array("i")
+
+    def append(self, text: str):
+        row = len(self._doclens)
+        tokens = tokenize(text or "")
+        self._doclens.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self._term_ids.append(self._terms.setdefault(term, len(self._terms)))
+            self._rows.append(row)
+            self._tfs.append(min(tf, 65535))
+
+    def tap(self, records: Iterable[Dict]) -> Iterable[Dict]:
+        """Pass records through unchanged while indexing their text (e.g. into write_store)."""
+        for meta in records:
+            self.append(meta.get("text"))
+            yield meta
+
+    def write(self, directory: Path, commit: bool = True):
+        """Write the snapshot files; with commit=False they stay "<name>.tmp" for the caller to rename."""
+        directory = Path(directory)
+        term_ids = np.frombuffer(self._term_ids, dtype="int32") if len(self._term_ids) else np.zeros(0, "int32")
+        order = np.argsort(term_ids, kind="stable")  # stable: rows stay ascending within a term
+        offsets = np.zeros(len(self._terms) + 1, dtype="int64")
+        np.cumsum(np.bincount(term_ids, minlength=len(self._terms)), out=offsets[1:])
+        arrays = {
+            OFFSETS_FILE: offsets,
+            DOCS_FILE: np.asarray(self._rows, dtype="int32")[order],
+            TFS_FILE: np.asarray(self._tfs, dtype="uint16")[order],
+            DOCLENS_FILE: np.asarray(self._doclens, dtype="int32"),
+        }
+        for name, arr in arrays.items():
+            with open(directory / (name + ".tmp"), "wb") as f:
+                np.save(f, arr)
+        with open(directory / (TERMS_FILE + ".tmp"), "w", encoding="utf-8") as f:
+            json.dump(sorted(self._terms, key=self._terms.get), f, ensure_ascii=False)
+        if commit:
+            for name in BM25_FILES:
+                os.replace(directory / (name + ".tmp"), directory / name)
+
+
+def write_bm25(directory: Path, records: Iterable[Dict]) -> int:
+    writer = BM25Writer()
+    for meta in records:
+        writer.append(meta.get("text"))
+    writer.write(directory)
+    return len(writer._doclens)
+
+
+# ----------------- Reading + in-memory tail -----------------
+class BM25Index:
+    def __init__(self, directory: Path):
+        directory = Path(directory)
+        self.terms: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype="int64")
+        self.docs = np.zeros(0, dtype="int32")
+        self.tfs = np.zeros(0, dtype="uint16")
+        self.doclens = np.zeros(0, dtype="int32")
+        if bm25_exists(directory):
+            with open(directory / TERMS_FILE, "r", encoding="utf-8") as f:
+                self.terms = {t: i for i, t in enumerate(json.load(f))}
+            self.offsets = np.load(directory / OFFSETS_FILE, mmap_mode="r")
+            self.docs = np.load(directory / DOCS_FILE, mmap_mode="r")
+            self.tfs = np.load(directory / TFS_FILE, mmap_mode="r")
+            self.doclens = np.load(directory / DOCLENS_FILE, mmap_mode="r")
+        self.base = len(self.doclens)
+        self.total_tokens = int(np.sum(self.doclens, dtype="int64"))
+        self.tail: Dict[str, List[Tuple[int, int]]] = {}
+        # Token counts of the tail rows: a buffer grown by doubling, so adding a
+        # batch costs O(batch) however long the tail already is
+        self.tail_doclens = np.zeros(1024, dtype="int32")
+        self.n_tail = 0
+
+    def __len__(self) -> int:
+        return self.base + self.n_tail
+
+    def add(self, texts: Iterable[str]):
+        """Index texts as the next rows (same order as the vectors added to FAISS)."""
+        for text in texts:
+            row = len(self)
+            tokens = tokenize(text or "")
+            if self.n_tail == len(self.tail_doclens):
+                grown = np.zeros(2 * len(self.tail_doclens), dtype="int32")
+                grown[:self.n_tail] = self.tail_doclens
+                self.tail_doclens = grown
+            self.tail_doclens[self.n_tail] = len(tokens)
+            self.n_tail += 1
+            self.total_tokens += len(tokens)
+            for term, tf in Counter(tokens).items():
+                self.tail.setdefault(term, []).append((row, tf))
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        rows, tfs = np.zeros(0, dtype="int32"), np.zeros(0, dtype="uint16")
+        tid = self.terms.get(term)
+        if tid is not None:
+            lo, hi = int(self.offsets[tid]), int(self.offsets[tid + 1])
+            rows, tfs = np.asarray(self.docs[lo:hi]), np.asarray(self.tfs[lo:hi])
+        tail = self.tail.get(term)
+        if tail:
+            extra = np.asarray(tail, dtype="int64")
+            rows = np.concatenate([rows, extra[:, 0].astype("int32")])
+            tfs = np.concatenate([tfs, extra[:, 1].astype("uint16")])
+        return rows, tfs
+
+    def _doclens_of(self, rows: np.ndarray) -> np.ndarray:
+        out = np.empty(len(rows), dtype="float32")
+        in_base = rows < self.base
+        out[in_base] = self.doclens[rows[in_base]]
+        out[~in_base] = self.tail_doclens[rows[~in_base] - self.base]
+        return out
+
+    def search(self, query: str, top_k: int, deleted: Set[int] = frozenset(),
+               allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        (row, score) for the top_k live rows matching any query term, best
+        first; `allowed` (sorted row numbers) restricts the candidates.
+        """
+        n = len(self)
+        if not n:
+            return []
+        avgdl = max(self.total_tokens / n, 1e-9)
+        row_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            rows, tfs = self._postings(term)
+            if not len(rows):
+                continue
+            df = len(rows)
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            tf = tfs.astype("float32")
+            norm = K1 * (1.0 - B + B * self._doclens_of(rows) / avgdl)
+            row_parts.append(rows)
+            score_parts.append(idf * tf * (K1 + 1.0) / (tf + norm))
+        if not row_parts:
+            return []
+        rows, scores = row_parts[0], score_parts[0]
+        if len(row_parts) > 1:
+            rows, inverse = np.unique(np.concatenate(row_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        if allowed is not None:
+            keep = np.isin(rows, allowed)
+            rows, scores = rows[keep], scores[keep]
+            if not len(rows):
+                return []
+        k = min(top_k + len(deleted), len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        hits = []
+        for i in top:
+            row = int(rows[i])
+            if row in deleted:
+                continue
+            hits.append((row, float(scores[i])))
+            if len(hits) == top_k:
+                break
+        return hits
+
+    def stats(self) -> Dict:
+        return {"rows": len(self), "terms": len(self.terms) + sum(1 for t in self.tail if t not in self.terms),
+                "postings": int(len(self.docs)) + sum(len(p) for p in self.tail.values())}
@@ -0,0 +1,183 @@
+# backend/chunking.py
+# Pluggable chunkers used by ingest.iter_chunks.
+#
+#   fixed      the original 800-char windows with 200 chars of overlap
+#   structure  (default) cuts only at paragraph, sentence or line boundaries
+#              and sizes chunks in embedding-model tokens, so no chunk runs
+#              past MiniLM's 256-token window (the tail would be truncated
+#              and never embedded) and no text is embedded twice
+#
+# A chunker turns text into (char_start, char_end, text) spans and groups
+# Whisper segments into (start_time, end_time, text) spans. PDF pages reach
+# it as PyMuPDF layout blocks joined by blank lines, so a block is a paragraph.
+import os
+import re
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from model_registry import get_embed_tokenizer
+
+# ----------------- Config -----------------
+CHUNKER = os.getenv("CHUNKER", "structure")
+# MiniLM embeds at most 256 tokens including [CLS] and [SEP]
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "254"))
+# Start a new chunk at a paragraph break once the current one has this many tokens
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "96"))
+# Trailing sentences repeated at the start of the next chunk (0 = no overlap)
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+# Audio: a pause this long between Whisper segments also ends a chunk
+AUDIO_PAUSE_SECONDS = float(os.getenv("AUDIO_PAUSE_SECONDS", "2.0"))
+
+FIXED_CHUNK_CHARS = 800
+FIXED_CHUNK_OVERLAP = 200
+
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+Span = Tuple[int, int, str]
+
+
+class FixedChunker:
+    name = "fixed"
+
+    def __init__(self, chunk_chars: int = FIXED_CHUNK_CHARS, overlap: int = FIXED_CHUNK_OVERLAP):
+        self.chunk_chars = chunk_chars
+        self.overlap = overlap
+
+    def chunk(self, text: str) -> Iterator[Span]:
+        n = len(text)
+        start = 0
+        while start < n:
+            end = min(start + self.chunk_chars, n)
+            yield start, end, text[start:end]
+            if end == n:
+                break
+            start = max(0, end - self.overlap)
+
+    def group_segments(self, segments: Sequence[Dict]) -> Iterator[Tuple[float, float, str]]:
+        # one chunk per Whisper segment, as before
+        for seg in segments:
+            text = seg.get("text", "").strip()
+            if text:
+                yield float(seg.get("start", 0.0)), float(seg.get("end", 0.0)), text
+
+
+class StructureChunker:
+    name = "structure"
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, min_tokens: int = CHUNK_MIN_TOKENS,
+                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS, pause_seconds: float = AUDIO_PAUSE_SECONDS,
+                 tokenizer=None):
+        self.max_tokens = max_tokens
+        self.min_tokens = min(min_tokens, max_tokens)
+        self.overlap_tokens = overlap_tokens
+        self.pause_seconds = pause_seconds
+        self._tokenizer = tokenizer
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._tokenizer = get_embed_tokenizer()
+        return self._tokenizer
+
+    def count_tokens(self, texts: Sequence[str]) -> List[int]:
+        if not texts:
+            return []
+        return [len(ids) for ids in self.tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
+
+    # ---------- units: (start, end, tokens, starts_paragraph) ----------
+    def _split_long(self, text: str, start: int, end: int) -> List[Tuple[int, int, int]]:
+        """Cut a sentence longer than max_tokens at word boundaries near every max_tokens tokens."""
+        piece = text[start:end]
+        offsets = self.tokenizer(piece, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        out, at = [], 0
+        while at < len(offsets):
+            stop = min(at + self.max_tokens, len(offsets))
+            if stop < len(offsets):
+                # back off to the last token that starts a word, if there is one in the window
+                for j in range(stop, at, -1):
+                    if offsets[j][0] > 0 and piece[offsets[j][0] - 1].isspace():
+                        stop = j
+                        break
+            s = offsets[at][0]
+            e = offsets[stop][0] if stop < len(offsets) else len(piece)
+            out.append((start + s, start + len(piece[:e].rstrip()), stop - at))
+            at = stop
+        return out
+
+    def _units(self, text: str) -> List[Tuple[int, int, int, bool]]:
+        paragraphs, at = [], 0
+        for m in PARAGRAPH_RE.finditer(text):
+            paragraphs.append((at, m.start()))
+            at = m.end()
+        paragraphs.append((at, len(text)))
+
+        spans = []  # (start, end, starts_paragraph)
+        for para_start, para_end in paragraphs:
+            cuts = [(m.start(), m.end()) for m in SENTENCE_RE.finditer(text, para_start, para_end)]
+            first, s = True, para_start
+            for e, next_s in cuts + [(para_end, para_end)]:
+                piece = text[s:e]
+                if piece.strip():
+                    lead = len(piece) - len(piece.lstrip())
+                    spans.append((s + lead, s + len(piece.rstrip()), first))
+                    first = False
+                s = next_s
+        units = []
+        for (s, e, new_para), n in zip(spans, self.count_tokens([text[s:e] for s, e, _ in spans])):
+            if n <= self.max_tokens:
+                units.append((s, e, n, new_para))
+            else:
+                for i, (ps, pe, pn) in enumerate(self._split_long(text, s, e)):
+                    units.append((ps, pe, pn, new_para and i == 0))
+        return units
+
+    def _pack(self, units: Sequence[Tuple], tokens_of: Callable = lambda u: u[2],
+              breaks_before: Callable = lambda prev, u: u[3]) -> Iterator[List]:
+        """Greedy: fill up to max_tokens, closing early at a break once past min_tokens."""
+        current, size = [], 0
+        for u in units:
+            n = tokens_of(u)
+            at_break = breaks_before(current[-1], u) if current else False
+            if current and (size + n > self.max_tokens or (at_break and size >= self.min_tokens)):
+                yield current
+                carry, carried = [], 0
+                for prev in ([] if at_break else reversed(current)):  # no overlap across a break
+                    if carried + tokens_of(prev) > self.overlap_tokens:
+                        break
+                    carry.insert(0, prev)
+                    carried += tokens_of(prev)
+                if carried + n > self.max_tokens:
+                    carry, carried = [], 0
+                current, size = carry, carried
+            current.append(u)
+            size += n
+        if current:
+            yield current
+
+    def chunk(self, text: str) -> Iterator[Span]:
+        if not text or not text.strip():
+            return
+        for group in self._pack(self._units(text)):
+            start, end = group[0][0], group[-1][1]
+            yield start, end, text[start:end]
+
+    def group_segments(self, segments: Sequence[Dict]) -> Iterator[Tuple[float, float, str]]:
+        segs = [(float(s.get("start", 0.0)), float(s.get("end", 0.0)), s.get("text", "").strip())
+                for s in segments if s.get("text", "").strip()]
+        lengths = self.count_tokens([t for _, _, t in segs])
+        units = [(start, end, text, n) for (start, end, text), n in zip(segs, lengths)]
+        for group in self._pack(units, tokens_of=lambda u: u[3],
+                                breaks_before=lambda prev, u: u[0] - prev[1] >= self.pause_seconds):
+            yield group[0][0], group[-1][1], " ".join(u[2] for u in group)
+
+
+CHUNKERS = {"fixed": FixedChunker, "structure": StructureChunker}
+_chunkers: Dict[str, object] = {}
+
+
+def get_chunker(name: str = CHUNKER):
+    if name not in CHUNKERS:
+        raise ValueError(f"Unknown chunker '{name}'. Choose from {sorted(CHUNKERS)}")
+    if name not in _chunkers:
+        _chunkers[name] = CHUNKERS[name]()
+    return _chunkers[name]
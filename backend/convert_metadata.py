@@ -0,0 +1,44 @@
+# backend/convert_metadata.py
+# Build the columnar metadata store (meta_store.py) in data/vectors from the
+# legacy metadatas.json or from data/ingested/*.jsonl.
+#   python convert_metadata.py                     # from metadatas.json
+#   python convert_metadata.py --source ingested   # from the ingested JSONL files
+import argparse
+import json
+import time
+from pathlib import Path
+
+import faiss
+
+from embed_faiss import INGESTED_DIR, load_ingested_items
+from index_service import FAISS_FILE, META_FILE, VECTOR_DIR
+from meta_store import write_store
+
+
+def iter_json_records(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        yield from json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert chunk metadata to the memory-mapped store")
+    parser.add_argument("--source", choices=("json", "ingested"), default="json")
+    parser.add_argument("--json", type=Path, default=META_FILE, help="legacy metadata file")
+    parser.add_argument("--out", type=Path, default=VECTOR_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.source == "json":
+        records = iter_json_records(args.json)
+    else:
+        # Same order embed_faiss.py used to add the vectors
+        records = iter(load_ingested_items(INGESTED_DIR))
+    count = write_store(args.out, records)
+    print(f"Wrote {count} records to {args.out} in {time.perf_counter() - start:.2f}s")
+
+    faiss_file = args.out / FAISS_FILE.name
+    if faiss_file.exists():
+        ntotal = faiss.read_index(str(faiss_file), faiss.IO_FLAG_MMAP).ntotal
+        if ntotal != count:
+            print(f"Warning: {faiss_file.name} holds {ntotal} vectors; rows will not line up "
+                  "until the index is rebuilt with embed_faiss.py")
@@ -0,0 +1,185 @@
+# backend/dedup.py
+# Ingest-time duplicate detection for chunks.
+#
+#   exact  SHA-1 of the normalized text (lowercased, whitespace collapsed)
+#   near   64-bit SimHash over word 3-shingles; two chunks are near-duplicates
+#          when their signatures differ in at most NEAR_DUP_BITS bits, which
+#          catches the same 800-char window in a lightly revised document
+#
+# Near-duplicate collapsing is off by default (NEAR_DUP_BITS=0). A chunk that
+# differs from another only by an invoice or ticket number is within a few
+# bits of it, and collapsing it would leave that number findable by neither
+# retriever: an alias keeps its own metadata but not a vector or BM25 row of
+# its own. When it is turned on, chunks only match if they carry the same
+# identifiers (tokens containing a digit), so the collapsed chunks are prose
+# revisions. `python -m bench.dedup` reports the size vs recall trade-off.
+#
+# Signatures are split into NEAR_DUP_BITS + 1 bands, so by pigeonhole any
+# signature within the threshold shares at least one exact band with its
+# match and lookups only compare against that band's bucket.
+#
+# Chunk ids are derived from (file name, normalized text, occurrence), so
+# re-ingesting a file yields the same ids and IndexService.upsert_file can
+# keep unchanged chunks, embed only new ones and drop the ones that
+# disappeared. The occurrence (how often the same text came earlier in the
+# file) keeps a repeated boilerplate chunk on several pages as separate
+# chunks without tying ids to offsets, which every edit would shift.
+import hashlib
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# ----------------- Config -----------------
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "1") == "1"
+NEAR_DUP_BITS = int(os.getenv("NEAR_DUP_BITS", "0"))  # 0 = exact duplicates only; 3 catches light revisions
+SHINGLE_WORDS = 3
+SIG_BITS = 64
+
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+IDENTIFIER_RE = re.compile(r"[\w-]*\d[\w-]*")
+
+
+def identifiers(text: str) -> frozenset:
+    """Tokens containing a digit (codes, numbers, dates): what a near-duplicate must not differ in."""
+    return frozenset(IDENTIFIER_RE.findall(normalize_text(text)))
+
+
+def chunk_id(file_name: str, text: str, occurrence: int = 0) -> str:
+    """Stable id for the `occurrence`-th (0-based) chunk with this text in the file."""
+    key = f"{file_name}\0{normalize_text(text)}" + (f"\0{occurrence}" if occurrence else "")
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:32]
+
+
+class ChunkIds:
+    """chunk_id for one file's chunks in order, counting repeats of the same text."""
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self._seen: Counter = Counter()
+
+    def __call__(self, text: str) -> str:
+        h = content_hash(text)
+        occurrence = self._seen[h]
+        self._seen[h] += 1
+        return chunk_id(self.file_name, text, occurrence)
+
+
+def simhash(text: str) -> int:
+    words = normalize_text(text).split()
+    if not words:
+        return 0
+    n = max(1, len(words) - SHINGLE_WORDS + 1)
+    shingles = (" ".join(words[i:i + SHINGLE_WORDS]) for i in range(n))
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+                       for s in shingles], dtype="uint64")
+    bits = np.unpackbits(hashes.view("uint8").reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype="int64") * 2 - len(hashes)
+    return int(np.packbits(votes > 0, bitorder="little").view("<u8")[0])
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class Deduplicator:
+    """Exact and near-duplicate lookup over the chunks currently in the index."""
+
+    def __init__(self, near_bits: int = NEAR_DUP_BITS):
+        self.near_bits = near_bits
+        self.n_bands = near_bits + 1
+        self._band_width = SIG_BITS // self.n_bands
+        self._exact: Dict[str, set] = {}                      # content hash -> chunk ids
+        # chunk id -> (content hash, simhash, file name, identifiers)
+        self._chunks: Dict[str, Tuple[str, int, str, frozenset]] = {}
+        self._bands: List[Dict[int, set]] = [dict() for _ in range(self.n_bands)]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def _band_keys(self, sig: int):
+        mask = (1 << self._band_width) - 1
+        return [(sig >> (i * self._band_width)) & mask for i in range(self.n_bands)]
+
+    def _add_locked(self, cid: str, text: str, file_name: str):
+        if cid in self._chunks:
+            return
+        h = content_hash(text)
+        sig, idents = (simhash(text), identifiers(text)) if self.near_bits else (0, frozenset())
+        self._chunks[cid] = (h, sig, file_name, idents)
+        self._exact.setdefault(h, set()).add(cid)
+        if self.near_bits:
+            for band, key in zip(self._bands, self._band_keys(sig)):
+                band.setdefault(key, set()).add(cid)
+
+    def add(self, metas: Iterable[Dict]):
+        with self._lock:
+            for m in metas:
+                if m.get("id"):
+                    self._add_locked(m["id"], m.get("text", ""), m.get("file_name"))
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for cid in ids:
+                entry = self._chunks.pop(cid, None)
+                if entry is None:
+                    continue
+                h, sig = entry[0], entry[1]
+                same_text = self._exact.get(h)
+                if same_text is not None:
+                    same_text.discard(cid)
+                    if not same_text:
+                        del self._exact[h]
+                if self.near_bits:
+                    for band, key in zip(self._bands, self._band_keys(sig)):
+                        bucket = band.get(key)
+                        if bucket is not None:
+                            bucket.discard(cid)
+                            if not bucket:
+                                del band[key]
+
+    def _find_locked(self, text: str, ignore_file: Optional[str]) -> Optional[str]:
+        for cid in self._exact.get(content_hash(text), ()):
+            if self._chunks[cid][2] != ignore_file:
+                return cid
+        if not self.near_bits:
+            return None
+        sig, idents = simhash(text), identifiers(text)
+        for band, key in zip(self._bands, self._band_keys(sig)):
+            for cid in band.get(key, ()):
+                _, other, file_name, other_idents = self._chunks[cid]
+                if file_name != ignore_file and other_idents == idents and hamming(sig, other) <= self.near_bits:
+                    return cid
+        return None
+
+    def filter(self, chunks: List[Dict], ignore_file: Optional[str] = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        (kept, duplicates): a chunk that duplicates an indexed chunk of another
+        file comes back in `duplicates` as {**chunk, "alias_of": that chunk's
+        id}, for IndexService to store as an alias instead of a vector. Chunks
+        of `ignore_file` never count as duplicates: they are the previous
+        version the upload is replacing, so near-repeats within one file are
+        kept. Nothing is registered here; IndexService.add registers chunks
+        once they are in the index, so a failed upload leaves no entries behind.
+        """
+        kept, dups = [], []
+        with self._lock:
+            for c in chunks:
+                owner = self._find_locked(c.get("text", ""), ignore_file)
+                if owner is None:
+                    kept.append(c)
+                else:
+                    dups.append({**c, "alias_of": owner})
+        return kept, dups
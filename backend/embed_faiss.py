@@ -1,69 +1,67 @@
 # backend/embed_faiss.py
-import os
 import json
 from pathlib import Path
 
-# OpenAI or SentenceTransformers for embeddings
-# Here we use sentence-transformers (offline-friendly)
-from sentence_transformers import SentenceTransformer
 import faiss
-import numpy as np
+
+from embedding import embed_into_index, EMBED_BATCH_SIZE
+from embedding_cache import get_embedding_cache
+from index_backends import INDEX_STORAGE, all_vectors, build_index as build_backend
+from index_service import IndexService, DIM
+from model_registry import get_embedder
 
 # ----------------- Config -----------------
 BASE_DIR = Path(__file__).resolve().parent.parent
 INGESTED_DIR = BASE_DIR / "data/ingested"
-VECTOR_DIR = BASE_DIR / "data/vectors"
-VECTOR_DIR.mkdir(parents=True, exist_ok=True)
-
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"  # English only
-DIM = 384  # embedding dimension for all-MiniLM-L6-v2
-
-# ----------------- Load model -----------------
-model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-# ----------------- FAISS index -----------------
-index = faiss.IndexFlatL2(DIM)  # L2 distance
-
-# Store metadata for each vector
-metadatas = []
 
 # ----------------- Process ingested files -----------------
-for jsonl_file in INGESTED_DIR.glob("*.jsonl"):
-    print(f"Processing {jsonl_file.name}...")
-    with open(jsonl_file, "r", encoding="utf-8") as f:
-        for line in f:
-            item = json.loads(line)
-            text = item.get("text", "")
-            if not text.strip():
-                continue
+def to_metadata(item):
+    return {
+        "id": item.get("id"),
+        "file_name": item.get("file_name"),
+        "source_type": item.get("source_type"),
+        "page": item.get("page", None),
+        "char_start": item.get("char_start", None),
+        "char_end": item.get("char_end", None),
+        "start_time": item.get("start_time", None),
+        "end_time": item.get("end_time", None),
+        "raw_path": item.get("raw_path"),
+        "text": item.get("text", "")  # <- THIS IS IMPORTANT
+    }
 
-            # Generate embedding (numpy array)
-            emb = model.encode(text)
-            emb = np.array([emb], dtype="float32")  # shape (1, DIM)
-            index.add(emb)
+def load_ingested_items(ingested_dir: Path = INGESTED_DIR):
+    items = []
+    for jsonl_file in sorted(ingested_dir.glob("*.jsonl")):
+        print(f"Processing {jsonl_file.name}...")
+        with open(jsonl_file, "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                if item.get("text", "").strip():
+                    items.append(to_metadata(item))
+    return items
 
-            # Keep metadata
-            metadatas.append({
-                "id": item.get("id"),
-                "file_name": item.get("file_name"),
-                "source_type": item.get("source_type"),
-                "page": item.get("page", None),
-                "char_start": item.get("char_start", None),
-                "char_end": item.get("char_end", None),
-                "start_time": item.get("start_time", None),
-                "end_time": item.get("end_time", None),
-                "raw_path": item.get("raw_path"),
-                "text": item.get("text", "")  # <- THIS IS IMPORTANT
-            })
+def build_index(batch_size: int = EMBED_BATCH_SIZE, use_cache: bool = True, items=None):
+    index = faiss.IndexFlatIP(DIM)  # cosine similarity over normalized vectors
+    metadatas = []
+    items = load_ingested_items() if items is None else items
+    # With a warm embedding cache a rebuild is pure I/O: the model isn't even loaded
+    cache = get_embedding_cache() if use_cache else None
+    missing = len(items) if cache is None else cache.missing([it["text"] for it in items])
+    model = get_embedder() if missing else None
+    print(f"Embedding {missing} of {len(items)} chunks ({len(items) - missing} cached)")
+    embed_into_index(model, items, index, metadatas, batch_size=batch_size, cache=cache)
+    if INDEX_STORAGE != "float32" and index.ntotal:
+        index = build_backend("flat", all_vectors(index), storage=INDEX_STORAGE)
+    return index, metadatas
 
 # ----------------- Save FAISS index & metadata -----------------
-faiss_file = VECTOR_DIR / "faiss_index.bin"
-faiss.write_index(index, str(faiss_file))
+if __name__ == "__main__":
+    index, metadatas = build_index()
 
-meta_file = VECTOR_DIR / "metadatas.json"
-with open(meta_file, "w", encoding="utf-8") as f:
-    json.dump(metadatas, f, ensure_ascii=False, indent=2)
+    # Writes faiss_index.bin + the metadata store and drops any pending upload log
+    service = IndexService()
+    service.replace(index, metadatas)
 
-print(f"FAISS index saved to {faiss_file}")
-print(f"Metadata saved to {meta_file}")
-print(f"Total vectors: {index.ntotal}")
+    print(f"FAISS index saved to {service.faiss_file}")
+    print(f"Metadata saved to {service.vector_dir}")
+    print(f"Total vectors: {index.ntotal}")
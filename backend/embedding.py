@@ -0,0 +1,129 @@
+# backend/embedding.py
+# Shared embedding stage used by /upload (main.embed_chain) and the offline
+# indexer (embed_faiss.py). Chunks are grouped into length buckets so that a
+# batch of short OCR fragments is never padded up to the length of an 800-char
+# PDF chunk, then each bucket is encoded with one forward pass and added to the
+# FAISS index with one bulk index.add(). Texts already in the persistent
+# embedding cache (embedding_cache.py) are not encoded again.
+import os
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+
+# ----------------- Config -----------------
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Upper bound on padded tokens per forward pass (batch rows * longest row)
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "8192"))
+# Rough chars-per-token ratio used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+# Unit-length vectors so the inner-product index scores cosine similarity
+NORMALIZE_EMBEDDINGS = True
+
+
+# ----------------- Token lengths -----------------
+def count_tokens(texts: Sequence[str], model=None) -> List[int]:
+    """Token length of each text, capped at the model's max sequence length."""
+    tokenizer = getattr(model, "tokenizer", None)
+    max_len = getattr(model, "max_seq_length", None) or 512
+    if tokenizer is not None:
+        ids = tokenizer(list(texts), add_special_tokens=True, truncation=False)["input_ids"]
+        return [min(len(x), max_len) for x in ids]
+    return [min(len(t) // CHARS_PER_TOKEN + 2, max_len) for t in texts]
+
+
+# ----------------- Bucketing -----------------
+def bucket_by_length(lengths: Sequence[int],
+                     batch_size: int = EMBED_BATCH_SIZE,
+                     max_batch_tokens: int = EMBED_MAX_BATCH_TOKENS) -> List[List[int]]:
+    """
+    Group item positions into batches of similar token length.
+
+    Items are sorted by length and a batch is closed once it holds
+    `batch_size` items or its padded size (rows * longest row) would exceed
+    `max_batch_tokens`.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets, current, longest = [], [], 0
+    for i in order:
+        n = max(int(lengths[i]), 1)
+        if current and (len(current) >= batch_size or (len(current) + 1) * max(longest, n) > max_batch_tokens):
+            buckets.append(current)
+            current, longest = [], 0
+        current.append(i)
+        longest = max(longest, n)
+    if current:
+        buckets.append(current)
+    return buckets
+
+
+# ----------------- Encoding -----------------
+def encode_texts(model, texts: Sequence[str],
+                 batch_size: int = EMBED_BATCH_SIZE,
+                 max_batch_tokens: int = EMBED_MAX_BATCH_TOKENS) -> np.ndarray:
+    """Encode texts bucket by bucket; rows are returned in input order."""
+    dim = model.get_sentence_embedding_dimension()
+    out = np.empty((len(texts), dim), dtype="float32")
+    for bucket in bucket_by_length(count_tokens(texts, model), batch_size, max_batch_tokens):
+        vecs = model.encode([texts[i] for i in bucket], batch_size=len(bucket), convert_to_numpy=True,
+                            normalize_embeddings=NORMALIZE_EMBEDDINGS)
+        out[bucket] = vecs
+    return out
+
+
+def iter_embedded_batches(model, chunks: Sequence[Dict],
+                          batch_size: int = EMBED_BATCH_SIZE,
+                          max_batch_tokens: int = EMBED_MAX_BATCH_TOKENS,
+                          cache=None) -> Iterator[Tuple[np.ndarray, List[Dict]]]:
+    """
+    Yield (vectors, chunks) per length bucket, skipping chunks with empty text.
+
+    With an EmbeddingCache, cached texts are yielded first in batch_size
+    slices without touching the model (which may then be None if nothing is
+    missing), and freshly encoded vectors are added to the cache.
+    """
+    items = [c for c in chunks if c.get("text", "").strip()]
+    if not items:
+        return
+    texts = [c["text"].strip() for c in items]
+    todo = list(range(len(items)))
+    if cache is not None:
+        cached, todo = cache.lookup(texts)
+        missing = set(todo)
+        hits = [i for i in range(len(items)) if i not in missing]
+        for at in range(0, len(hits), batch_size):
+            yield cached[at:at + batch_size], [items[i] for i in hits[at:at + batch_size]]
+    if not todo:
+        return
+    todo_texts = [texts[i] for i in todo]
+    for bucket in bucket_by_length(count_tokens(todo_texts, model), batch_size, max_batch_tokens):
+        batch_texts = [todo_texts[i] for i in bucket]
+        metrics.observe("embed_batch_size", len(bucket), metrics.SIZE_BUCKETS)
+        with metrics.stage("embed"):
+            vecs = model.encode(batch_texts, batch_size=len(bucket), convert_to_numpy=True,
+                                normalize_embeddings=NORMALIZE_EMBEDDINGS)
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+        if cache is not None:
+            cache.put(batch_texts, vecs)
+        yield vecs, [items[todo[i]] for i in bucket]
+
+
+def embed_into_index(model, chunks: Sequence[Dict], index, metadata: List[Dict],
+                     batch_size: int = EMBED_BATCH_SIZE,
+                     max_batch_tokens: int = EMBED_MAX_BATCH_TOKENS,
+                     cache=None) -> int:
+    """
+    Embed chunks with non-empty text and append them to `index` and `metadata`.
+
+    Each bucket is encoded in a single call and added with one index.add(), and
+    its chunks are appended to `metadata` in the same order so that FAISS row
+    ids keep lining up with metadata positions. Returns the number of vectors
+    added.
+    """
+    added = 0
+    for vecs, items in iter_embedded_batches(model, chunks, batch_size, max_batch_tokens, cache):
+        index.add(vecs)
+        metadata.extend(items)
+        added += len(items)
+    return added
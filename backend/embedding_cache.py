@@ -0,0 +1,128 @@
+# backend/embedding_cache.py
+# Persistent text -> vector store for one embedding model, so re-indexing
+# only encodes text it has never seen.
+#
+#   data/cache/embeddings/<model>/vectors.f32   float32 rows, append-only, memory-mapped
+#   data/cache/embeddings/<model>/keys.txt      one key per row, written after its vector
+#
+# A key is the SHA-1 of the exact text the embedder sees (stripped), and
+# normalization is part of the directory, so a different model or setting
+# never reads another's vectors. On open, a vector row without a key (a crash
+# between the two appends) is ignored and overwritten by the next append.
+# Writers are serialized per process; run one indexing process at a time.
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from model_registry import EMBEDDING_MODEL_NAME
+
+# ----------------- Config -----------------
+BASE_DIR = Path(__file__).resolve().parent.parent
+EMBED_CACHE_DIR = BASE_DIR / "data" / "cache" / "embeddings"
+EMBED_CACHE = os.getenv("EMBED_CACHE", "1") == "1"
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.txt"
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.strip().encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, directory: Path, dim: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.vectors_path = self.directory / VECTORS_FILE
+        self.keys_path = self.directory / KEYS_FILE
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}  # key -> row in vectors.f32
+        self._n = 0  # rows on disk
+        if self.keys_path.exists():
+            with open(self.keys_path, "r", encoding="ascii") as f:
+                lines = f.read().split("\n")
+            if lines.pop():  # "" after the final newline; anything else is a torn write
+                with open(self.keys_path, "w", encoding="ascii") as f:
+                    f.write("".join(k + "\n" for k in lines))
+            for row, key in enumerate(lines):
+                self._rows.setdefault(key, row)
+            self._n = len(lines)
+        row_bytes = 4 * dim
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        if size // row_bytes < self._n:
+            raise RuntimeError(f"{self.keys_path} lists {self._n} keys but {self.vectors_path} "
+                               f"has {size // row_bytes} vectors; delete {self.directory} to start over")
+        if size != self._n * row_bytes:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(self._n * row_bytes)
+        self._mm: Optional[np.ndarray] = None
+        self.counters = {"hits": 0, "misses": 0}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _mapped(self) -> np.ndarray:
+        if self._mm is None or len(self._mm) < self._n:
+            self._mm = (np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(self._n, self.dim))
+                        if self._n else np.zeros((0, self.dim), dtype="float32"))
+        return self._mm
+
+    def lookup(self, texts: Sequence[str]) -> Tuple[np.ndarray, List[int]]:
+        """(vectors of the cached texts in order, positions of the texts that are not cached)."""
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            rows = [self._rows.get(k) for k in keys]
+            hits = [r for r in rows if r is not None]
+            vecs = np.asarray(self._mapped()[hits], dtype="float32") if hits else np.zeros((0, self.dim), "float32")
+        missing = [i for i, r in enumerate(rows) if r is None]
+        self.counters["hits"] += len(hits)
+        self.counters["misses"] += len(missing)
+        return vecs, missing
+
+    def missing(self, texts: Sequence[str]) -> int:
+        with self._lock:
+            return sum(1 for t in texts if text_key(t) not in self._rows)
+
+    def put(self, texts: Sequence[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(-1, self.dim)
+        with self._lock:
+            new = {}
+            for text, vec in zip(texts, vectors):
+                key = text_key(text)
+                if key not in self._rows and key not in new:
+                    new[key] = vec
+            if not new:
+                return
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack(list(new.values())).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, "a", encoding="ascii") as f:
+                f.write("".join(k + "\n" for k in new))
+            for key in new:
+                self._rows[key] = self._n
+                self._n += 1
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._rows), "mb": round(self._n * self.dim * 4 / 1e6, 2), **self.counters}
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str = EMBEDDING_MODEL_NAME, dim: int = 384,
+                        normalized: bool = True) -> Optional[EmbeddingCache]:
+    """Shared cache for a model, or None with EMBED_CACHE=0."""
+    if not EMBED_CACHE:
+        return None
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name) + ("" if normalized else "_raw")
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = EmbeddingCache(EMBED_CACHE_DIR / name, dim)
+        return _caches[name]
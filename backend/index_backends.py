@@ -0,0 +1,323 @@
+# backend/index_backends.py
+# FAISS index types the vector store can run on, and the policy that picks one.
+#
+#   flat      exact scan; best up to ~50k vectors
+#   ivf_flat  inverted lists over full vectors; tune with nprobe
+#   ivf_pq    inverted lists over product-quantized codes; smallest memory
+#   hnsw      graph index; best latency/recall while it fits in memory
+#
+# Vectors are L2-normalized and searched by inner product, so scores are
+# cosine similarities (higher is better). flat, ivf_flat and hnsw can store
+# vectors as float32, float16 or scalar-quantized int8 (STORAGES).
+import math
+import os
+from typing import Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+# ----------------- Config -----------------
+BACKENDS = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+STORAGES = ("float32", "float16", "int8")
+DEFAULT_METRIC = faiss.METRIC_INNER_PRODUCT
+INDEX_STORAGE = os.getenv("INDEX_STORAGE", "float32")
+FLAT_MAX_VECTORS = 50_000  # below this an exhaustive scan is already fast
+INDEX_MEMORY_BUDGET_MB = float(os.getenv("INDEX_MEMORY_BUDGET_MB", "0"))  # 0 = unlimited
+
+DEFAULT_NPROBE = int(os.getenv("INDEX_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", "64"))
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+PQ_M = 48          # sub-quantizers; must divide the dimension (384 / 48 = 8 dims each)
+PQ_NBITS = 8
+TRAIN_POINTS_PER_LIST = 64  # FAISS wants >= 39 points per centroid
+SQ_TRAIN_POINTS = 100_000   # enough to learn per-dimension int8 ranges
+
+BYTES_PER_DIM = {"float32": 4, "float16": 2, "int8": 1}
+
+
+def _sq_type(storage: str):
+    if storage == "float16":
+        return faiss.ScalarQuantizer.QT_fp16
+    if storage == "int8":
+        return faiss.ScalarQuantizer.QT_8bit
+    raise ValueError(f"Unknown vector storage '{storage}'. Choose from {STORAGES}")
+
+
+# ----------------- Sizing -----------------
+def default_nlist(n_vectors: int) -> int:
+    nlist = int(4 * math.sqrt(max(n_vectors, 1)))
+    return max(1, min(nlist, n_vectors // 39 or 1, 65536))
+
+
+def estimate_memory_bytes(kind: str, n_vectors: int, dim: int, params: Optional[Dict] = None) -> int:
+    params = params or {}
+    vec_bytes = dim * BYTES_PER_DIM[params.get("storage", "float32")]
+    if kind == "flat":
+        return n_vectors * vec_bytes
+    if kind == "hnsw":
+        m = params.get("hnsw_m", HNSW_M)
+        # vectors + ~2*M neighbour ids on layer 0 (upper layers add ~1/M more)
+        return n_vectors * (vec_bytes + int(2 * m * 4 * 1.1))
+    if kind == "ivf_flat":
+        return n_vectors * (vec_bytes + 8)
+    if kind == "ivf_pq":
+        m = params.get("pq_m", PQ_M)
+        return n_vectors * (m * PQ_NBITS // 8 + 8)
+    raise ValueError(f"Unknown index backend '{kind}'. Choose from {BACKENDS}")
+
+
+def choose_backend(n_vectors: int, dim: int,
+                   memory_budget_mb: float = INDEX_MEMORY_BUDGET_MB,
+                   storage: str = INDEX_STORAGE) -> Tuple[str, Dict]:
+    """Pick a backend (and its build params) from corpus size and memory budget."""
+    budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else float("inf")
+    if n_vectors <= FLAT_MAX_VECTORS and estimate_memory_bytes("flat", n_vectors, dim, {"storage": storage}) <= budget:
+        return "flat", {"storage": storage}
+    nlist = default_nlist(n_vectors)
+    for kind in ("hnsw", "ivf_flat"):
+        params = {"storage": storage} if kind == "hnsw" else {"storage": storage, "nlist": nlist}
+        if estimate_memory_bytes(kind, n_vectors, dim, params) <= budget:
+            return kind, params
+    return "ivf_pq", {"nlist": nlist}
+
+
+# ----------------- Building -----------------
+def new_index(kind: str, dim: int, n_vectors: int = 0, metric: int = DEFAULT_METRIC,
+              nlist: Optional[int] = None, pq_m: int = PQ_M, hnsw_m: int = HNSW_M,
+              storage: str = "float32"):
+    """Untrained, empty index of the given kind."""
+    if kind == "flat":
+        if storage == "float32":
+            return faiss.IndexFlat(dim, metric)
+        return faiss.IndexScalarQuantizer(dim, _sq_type(storage), metric)
+    if kind == "hnsw":
+        if storage == "float32":
+            index = faiss.IndexHNSWFlat(dim, hnsw_m, metric)
+        else:
+            index = faiss.IndexHNSWSQ(dim, _sq_type(storage), hnsw_m, metric)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = DEFAULT_EF_SEARCH
+        return index
+    nlist = nlist or default_nlist(n_vectors)
+    quantizer = faiss.IndexFlat(dim, metric)
+    if kind == "ivf_flat":
+        if storage == "float32":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _sq_type(storage), metric)
+    elif kind == "ivf_pq":
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, PQ_NBITS, metric)
+    else:
+        raise ValueError(f"Unknown index backend '{kind}'. Choose from {BACKENDS}")
+    index.nprobe = min(DEFAULT_NPROBE, nlist)
+    return index
+
+
+def build_index(kind: str, vectors: np.ndarray, metric: int = DEFAULT_METRIC, **params):
+    """Build, train (if needed) and fill an index of `kind` from `vectors`."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    index = new_index(kind, dim, n, metric, **params)
+    if not index.is_trained:
+        if isinstance(index, faiss.IndexIVF):
+            nlist = index.nlist
+            train_n = min(n, nlist * TRAIN_POINTS_PER_LIST)
+            if train_n < nlist:
+                raise ValueError(f"{kind} with nlist={nlist} needs at least {nlist} vectors, got {n}")
+        else:
+            train_n = min(n, SQ_TRAIN_POINTS)
+            if not train_n:
+                raise ValueError(f"{kind} with {params.get('storage')} storage needs training vectors")
+        sample = vectors[np.random.default_rng(0).choice(n, train_n, replace=False)] if train_n < n else vectors
+        index.train(sample)
+    ensure_direct_map(index)
+    if n:
+        index.add(vectors)
+    return index
+
+
+def ensure_direct_map(index):
+    """
+    Give an IVF index the row -> inverted-list map that reconstruct needs; add()
+    keeps it current from then on. This mutates the index, so call it where
+    writes are serialized (build, load, snapshot swap), never on the search path.
+    """
+    if isinstance(index, faiss.IndexIVF) and index.direct_map.no():
+        index.make_direct_map()
+    return index
+
+
+def _check_direct_map(index):
+    if isinstance(index, faiss.IndexIVF) and index.direct_map.no():
+        raise RuntimeError("IVF index has no direct map; call ensure_direct_map() under the write lock first")
+
+
+def backend_of(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def storage_of(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "float32"
+
+
+def index_nbytes(index) -> int:
+    """Serialized size of the index, a close proxy for its resident memory."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.array(vectors, dtype="float32", copy=True, order="C")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def all_vectors(index) -> np.ndarray:
+    """Every stored vector in row order (approximate for ivf_pq, whose codes are lossy)."""
+    if index.ntotal == 0:
+        return np.empty((0, index.d), dtype="float32")
+    _check_direct_map(index)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def rebuild_like(index, vectors: np.ndarray, metric: Optional[int] = None, storage: Optional[str] = None):
+    """
+    New index of the same backend and shape holding `vectors`, retrained;
+    metric/storage may be overridden. Feed it exact vectors (e.g.
+    IndexService.export), not reconstructions of lossy codes.
+    """
+    metric = index.metric_type if metric is None else metric
+    if not len(vectors):
+        return new_index("flat", index.d, metric=metric)
+    kind = backend_of(index)
+    params = {} if kind == "ivf_pq" else {"storage": storage or storage_of(index)}
+    if kind in ("ivf_flat", "ivf_pq"):
+        ivf = faiss.extract_index_ivf(index)
+        params["nlist"] = ivf.nlist
+        if kind == "ivf_pq":
+            params["pq_m"] = faiss.downcast_index(index).pq.M
+        if len(vectors) < ivf.nlist:
+            # too few vectors left to train the coarse quantizer
+            kind, params = "flat", {"storage": params.get("storage", "float32")}
+    elif kind == "hnsw":
+        params["hnsw_m"] = faiss.downcast_index(index).hnsw.nb_neighbors(1)
+    return build_index(kind, vectors, metric, **params)
+
+
+def remove_rows(index, rows: np.ndarray):
+    """
+    Copy of a flat or IVF index without `rows`, the rest renumbered so ids
+    stay row positions. Codes and trained quantizers are kept as they are:
+    unlike rebuilding from reconstruct_n output, nothing is retrained on
+    lossy codes, so repeated compactions do not degrade ivf_pq / int8.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        raise ValueError("HNSW graphs cannot drop vectors; rebuild with same_codec()")
+    rows = np.asarray(rows, dtype="int64")
+    ntotal = index.ntotal
+    index = faiss.clone_index(index)
+    ivf = faiss.extract_index_ivf(index) if isinstance(index, faiss.IndexIVF) else None
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)  # the Array map cannot remove ids
+    index.remove_ids(faiss.IDSelectorBatch(rows))
+    if ivf is not None:
+        # Flat indexes shift the remaining rows down; inverted lists keep explicit ids, renumber them
+        new_row = np.full(ntotal, -1, dtype="int64")
+        keep = np.setdiff1d(np.arange(ntotal, dtype="int64"), rows)
+        new_row[keep] = np.arange(len(keep), dtype="int64")
+        invlists = ivf.invlists
+        for lst in range(ivf.nlist):
+            size = invlists.list_size(lst)
+            if size:
+                ptr = invlists.get_ids(lst)
+                ids = faiss.rev_swig_ptr(ptr, size)
+                ids[:] = new_row[ids]
+                invlists.release_ids(lst, ptr)
+        ensure_direct_map(index)
+    return index
+
+
+def same_codec(index):
+    """
+    Empty index of the same backend, shape and search settings, sharing the
+    trained scalar quantizer (if any) instead of retraining it. Vectors
+    reconstructed from `index` re-encode to exactly the codes they came from.
+    """
+    kind = backend_of(index)
+    if kind != "hnsw":
+        raise ValueError(f"same_codec() supports hnsw, not {kind}; use remove_rows()")
+    hnsw = faiss.downcast_index(index)
+    out = new_index("hnsw", index.d, metric=index.metric_type, hnsw_m=hnsw.hnsw.nb_neighbors(1),
+                    storage=storage_of(index))
+    out.hnsw.efSearch = hnsw.hnsw.efSearch
+    out.hnsw.efConstruction = hnsw.hnsw.efConstruction
+    storage = faiss.downcast_index(hnsw.storage)
+    if isinstance(storage, faiss.IndexScalarQuantizer):
+        faiss.downcast_index(out.storage).sq.trained = storage.sq.trained
+        out.storage.is_trained = out.is_trained = True
+    return out
+
+
+# ----------------- Search tuning -----------------
+def search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None, selector=None):
+    """
+    Per-request FAISS SearchParameters, or None for the index defaults.
+
+    Passing parameters per call (instead of setting index.nprobe) keeps
+    concurrent queries with different settings from racing each other.
+    `selector` (a faiss.IDSelector) restricts the search to those ids.
+    """
+    kind = backend_of(index)
+    if kind in ("ivf_flat", "ivf_pq") and (nprobe or selector is not None):
+        nprobe = nprobe or faiss.extract_index_ivf(index).nprobe
+        return faiss.SearchParametersIVF(nprobe=int(nprobe), sel=selector)
+    if kind == "hnsw" and (ef_search or selector is not None):
+        ef_search = ef_search or faiss.downcast_index(index).hnsw.efSearch
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search), sel=selector)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def bitmap_selector(rows: np.ndarray, ntotal: int):
+    """(selector, bitmap) over `rows`; keep the bitmap alive while the selector is used."""
+    mask = np.zeros(ntotal, dtype=bool)
+    mask[rows] = True
+    bitmap = np.packbits(mask, bitorder="little")
+    return faiss.IDSelectorBitmap(ntotal, faiss.swig_ptr(bitmap)), bitmap
+
+
+def search_subset(index, query_vecs: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact search restricted to `rows`, reading only those vectors: cost grows
+    with len(rows), not index.ntotal. Same (distances, ids) layout as
+    index.search, padded with -1 ids.
+    """
+    _check_direct_map(index)
+    rows = np.asarray(rows, dtype="int64")
+    vecs = index.reconstruct_batch(rows)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        scores = query_vecs @ vecs.T
+    else:
+        scores = -(np.sum(query_vecs ** 2, axis=1)[:, None] - 2 * query_vecs @ vecs.T + np.sum(vecs ** 2, axis=1))
+    k_found = min(k, len(rows))
+    distances = np.full((len(query_vecs), k), -np.inf, dtype="float32")
+    ids = np.full((len(query_vecs), k), -1, dtype="int64")
+    if k_found:
+        top = np.argpartition(-scores, k_found - 1, axis=1)[:, :k_found]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        ids[:, :k_found] = rows[top]
+        distances[:, :k_found] = top_scores if index.metric_type == faiss.METRIC_INNER_PRODUCT else -top_scores
+    return distances, ids
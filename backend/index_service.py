@@ -0,0 +1,743 @@
+# backend/index_service.py
+# One FAISS index + chunk metadata shared by /upload and /query.
+#
+# On disk the index is a snapshot (faiss_index.bin + the memory-mapped
+# meta_store files) plus an append-only log written since that snapshot:
+#   vectors.log   raw float32 rows, one per added chunk
+#   metadata.log  one JSON op per line: {"op": "add", "meta": {...}} (paired
+#                 in order with the rows of vectors.log) or
+#                 {"op": "delete", "rows": [...]}
+# A BM25 keyword index (bm25_index.py) covers the same rows and is
+# snapshotted and replayed together with them.
+# A snapshot is written as .tmp files and committed by one os.replace of
+# snapshot.pending.json, which lists them; the renames, snapshot.json (the
+# committed generation) and clearing the log follow, and load() redoes them
+# if the process died in between. Log ops carry the generation of the
+# snapshot that will contain them, so ops already in the snapshot are skipped.
+# One process owns a vector directory at a time (index.lock): the server and
+# ingest_dir.py / rebuild scripts would otherwise append to the same log from
+# two in-memory views of the index.
+# Uploads only append to the log, so an ingest costs O(new chunks) instead of
+# rewriting the whole corpus. The log is folded back into a fresh snapshot
+# once it grows past COMPACT_EVERY ops or too many rows are tombstoned.
+# Compaction never retrains on reconstructed vectors (lossy for ivf_pq and
+# int8, so the error would compound): flat and IVF indexes drop tombstoned
+# rows in place, keeping their codes and quantizers. An HNSW graph cannot drop
+# nodes, so its tombstones are kept in the snapshot (snapshot.json) and the
+# graph is rebuilt in a background thread, with the same codec, while
+# queries keep running; the result is swapped in under the write lock.
+# upsert_file re-ingests a file in place: chunk ids are content-derived
+# (dedup.py), so unchanged chunks are kept, new ones are embedded unless they
+# duplicate a chunk of another file, and chunks that disappeared are deleted.
+# A skipped duplicate is kept as an alias (aliases.json, plus "alias" /
+# "unalias" log ops): its own metadata pointing at the chunk that holds the
+# vector, so filters on its file or page still find it. When that chunk is
+# deleted, its aliases are promoted: embedded (usually from the embedding
+# cache) and added as rows of their own.
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+import metrics
+from bm25_index import BM25_FILES, BM25Index, BM25Writer, write_bm25
+from dedup import INGEST_DEDUP, NEAR_DUP_BITS, Deduplicator
+from embedding import iter_embedded_batches
+from embedding_cache import get_embedding_cache
+from meta_store import (STORE_FILES, ChunkMetadata, MetaStore, matches_filters, normalize_filters, store_exists,
+                        write_store)
+from index_backends import (INDEX_STORAGE, backend_of, bitmap_selector, ensure_direct_map, index_nbytes,
+                            new_index, remove_rows, same_codec, search_params, search_subset, storage_of)
+
+# ----------------- Config -----------------
+BASE_DIR = Path(__file__).resolve().parent.parent
+VECTOR_DIR = BASE_DIR / "data" / "vectors"
+VECTOR_DIR.mkdir(parents=True, exist_ok=True)
+FAISS_FILE = VECTOR_DIR / "faiss_index.bin"
+META_FILE = VECTOR_DIR / "metadatas.json"  # legacy; converted to meta_store on first load
+VECTOR_LOG = VECTOR_DIR / "vectors.log"
+META_LOG = VECTOR_DIR / "metadata.log"
+SNAPSHOT_FILE = VECTOR_DIR / "snapshot.json"  # {"generation": n, "deleted": [rows]} of the committed snapshot
+PENDING_FILE = VECTOR_DIR / "snapshot.pending.json"  # a snapshot committed but not yet in place
+LOCK_FILE = VECTOR_DIR / "index.lock"
+ALIAS_FILE = VECTOR_DIR / "aliases.json"  # skipped duplicates: [{...chunk, "alias_of": id}]
+
+DIM = 384  # all-MiniLM-L6-v2
+COMPACT_EVERY = int(os.getenv("INDEX_COMPACT_EVERY", "5000"))  # logged ops between compactions
+COMPACT_DELETED_RATIO = 0.2  # compact early once this share of rows is tombstoned
+# Filtered searches over at most this many eligible rows read just those
+# vectors; larger subsets go through FAISS with an ID selector
+FILTER_BRUTE_FORCE_MAX = int(os.getenv("FILTER_BRUTE_FORCE_MAX", "50000"))
+
+
+# ----------------- Readers-writer lock -----------------
+class RWLock:
+    """Many concurrent readers or one writer. Waiting writers block new readers."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class IndexLocked(RuntimeError):
+    pass
+
+
+def _lock_exclusive(path: Path):
+    """Open and lock `path` for this process's lifetime; raises IndexLocked if another process holds it."""
+    f = open(path, "a+")
+    try:
+        try:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except ImportError:  # Windows
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        try:
+            f.seek(0)
+            owner = f.read().strip() or "unknown"
+        except OSError:
+            owner = "unknown"
+        f.close()
+        raise IndexLocked(f"{path.parent} is in use by another process (pid {owner}); stop the API server "
+                          "(or the other indexing run) first")
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    return f
+
+
+def _write_json_atomic(path: Path, obj):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ----------------- Index service -----------------
+class IndexService:
+    def __init__(self, vector_dir: Path = VECTOR_DIR, dim: int = DIM, compact_every: int = COMPACT_EVERY):
+        self.vector_dir = Path(vector_dir)
+        self.faiss_file = self.vector_dir / FAISS_FILE.name
+        self.meta_file = self.vector_dir / META_FILE.name
+        self.vector_log = self.vector_dir / VECTOR_LOG.name
+        self.meta_log = self.vector_dir / META_LOG.name
+        self.snapshot_file = self.vector_dir / SNAPSHOT_FILE.name
+        self.pending_file = self.vector_dir / PENDING_FILE.name
+        self.alias_file = self.vector_dir / ALIAS_FILE.name
+        self.generation = 0  # of the snapshot on disk
+        self._lock_file = _lock_exclusive(self.vector_dir / LOCK_FILE.name)
+        self.dim = dim
+        self.compact_every = compact_every
+        self.lock = RWLock()
+        self.version = 0  # bumped on every mutation; lets caches detect index changes
+        self._log_ops = 0
+        self._dedup: Optional[Deduplicator] = None  # built on the first upsert_file
+        self.near_dup_bits = NEAR_DUP_BITS
+        self._dedup_lock = threading.Lock()
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._rebuild_lock = threading.Lock()  # one graph rebuild at a time
+        self.load()
+
+    # ---------- loading ----------
+    def load(self):
+        with self.lock.write():
+            if self.pending_file.exists():
+                self._finish_snapshot()  # the process died while putting a snapshot in place
+            snapshot = {"generation": 0}
+            if self.snapshot_file.exists():
+                with open(self.snapshot_file, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            self.generation = snapshot["generation"]
+            if not store_exists(self.vector_dir) and self.meta_file.exists():
+                self._convert_legacy_metadata()
+            if self.faiss_file.exists() and store_exists(self.vector_dir):
+                self.index = ensure_direct_map(faiss.read_index(str(self.faiss_file)))
+            else:
+                # int8 storage has to be trained, so an empty store starts as float32
+                # until rebuild_index.py / migrate_index.py is run over real vectors
+                storage = "float32" if INDEX_STORAGE == "int8" else INDEX_STORAGE
+                self.index = new_index("flat", self.dim, storage=storage)
+            self.metadata = ChunkMetadata(MetaStore(self.vector_dir))
+            self.bm25 = BM25Index(self.vector_dir)
+            if len(self.bm25) != len(self.metadata):
+                # first run with keyword search, or a crash between snapshot files
+                n = write_bm25(self.vector_dir, self.metadata)
+                self.bm25 = BM25Index(self.vector_dir)
+                print(f"Built the BM25 keyword index over {n} chunks")
+            if self.index.ntotal != len(self.metadata):
+                raise RuntimeError(f"{self.faiss_file.name} has {self.index.ntotal} vectors but the "
+                                   f"metadata store has {len(self.metadata)} rows")
+            if self.index.metric_type != faiss.METRIC_INNER_PRODUCT:
+                print(f"Warning: {self.faiss_file.name} uses L2 over unnormalized vectors; "
+                      "run `python migrate_index.py` to convert it to cosine similarity")
+            self.deleted = set(snapshot.get("deleted", ()))  # HNSW tombstones awaiting a graph rebuild
+            self._log_ops = 0
+            self._dedup = None
+            self._reset_aliases([])
+            if self.alias_file.exists():
+                with open(self.alias_file, "r", encoding="utf-8") as f:
+                    self._reset_aliases(json.load(f))
+            self._replay_log()
+            self.version += 1
+
+    def _convert_legacy_metadata(self):
+        with open(self.meta_file, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        write_store(self.vector_dir, records)
+        # metadatas.json is left in place (it is tracked sample data); the store takes precedence from now on
+        print(f"Converted {len(records)} records from {self.meta_file.name} to the columnar metadata store")
+
+    def _replay_log(self):
+        if not self.meta_log.exists():
+            return
+        vecs = np.empty((0, self.dim), dtype="float32")
+        if self.vector_log.exists():
+            vecs = np.fromfile(self.vector_log, dtype="float32")
+            vecs = vecs[: len(vecs) // self.dim * self.dim].reshape(-1, self.dim)
+        metas, rows, torn, stale = [], [], False, False
+        n_vecs = 0  # vectors.log rows consumed by add ops so far
+        with open(self.meta_log, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    torn = True  # partial final line from a crash mid-write
+                    break
+                if op["op"] == "add" and n_vecs >= len(vecs):
+                    torn = True  # metadata written without its vector
+                    break
+                if op.get("gen", self.generation + 1) <= self.generation:
+                    stale = True  # already in the snapshot
+                    n_vecs += op["op"] == "add"
+                    continue
+                if op["op"] == "add":
+                    metas.append(op["meta"])
+                    rows.append(n_vecs)
+                    n_vecs += 1
+                elif op["op"] == "delete":
+                    self.deleted.update(op["rows"])
+                elif op["op"] == "alias":
+                    self._set_aliases(op["metas"])
+                elif op["op"] == "unalias":
+                    self._drop_aliases(op["ids"])
+                self._log_ops += 1
+        if metas:
+            self.index.add(np.ascontiguousarray(vecs[rows]))
+            self.metadata.extend(metas)
+            self.bm25.add(m.get("text") for m in metas)
+        self.deleted = {r for r in self.deleted if r < len(self.metadata)}
+        if torn or stale or len(vecs) != n_vecs:
+            # Fold what was recovered into a snapshot so new appends start from clean logs
+            self._compact_locked()
+
+    # ---------- persistence ----------
+    def _append_log(self, vecs: Optional[np.ndarray], ops: List[Dict]):
+        if vecs is not None and len(vecs):
+            with open(self.vector_log, "ab") as f:
+                f.write(np.ascontiguousarray(vecs, dtype="float32").tobytes())
+        with open(self.meta_log, "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps({**op, "gen": self.generation + 1}, ensure_ascii=False) + "\n")
+        self._log_ops += len(ops)
+
+    def _write_snapshot(self, index, records: Iterable[Dict], aliases: Sequence[Dict] = (),
+                        deleted: Iterable[int] = ()):
+        """Persist index + records + aliases (+ tombstones) as the new snapshot, clear the log and reopen the store."""
+        tmp_index = self.faiss_file.with_suffix(".bin.tmp")
+        ensure_direct_map(index)  # persisted with the index, so searches never build it
+        faiss.write_index(index, str(tmp_index))
+        bm25 = BM25Writer()
+        write_store(self.vector_dir, bm25.tap(records), commit=False)
+        bm25.write(self.vector_dir, commit=False)
+        tmp_aliases = self.alias_file.with_suffix(".json.tmp")
+        with open(tmp_aliases, "w", encoding="utf-8") as f:
+            json.dump(list(aliases), f, ensure_ascii=False)
+        staged = {name + ".tmp": name for name in STORE_FILES + BM25_FILES}
+        staged[tmp_index.name] = self.faiss_file.name
+        staged[tmp_aliases.name] = self.alias_file.name
+        # The commit point: from here on, load() finishes this snapshot rather
+        # than pairing old and new files
+        deleted = sorted(int(r) for r in deleted)
+        _write_json_atomic(self.pending_file, {"generation": self.generation + 1, "files": staged,
+                                               "deleted": deleted})
+        self._finish_snapshot()
+        self._log_ops = 0
+        old = getattr(self, "metadata", None)
+        self.index = index
+        self.metadata = ChunkMetadata(MetaStore(self.vector_dir))
+        self.bm25 = BM25Index(self.vector_dir)
+        self.deleted = set(deleted)
+        self._reset_aliases(aliases)
+        if old is not None:
+            old.close()
+
+    def _finish_snapshot(self):
+        """Move a committed snapshot's staged files into place and clear the log it folded in."""
+        with open(self.pending_file, "r", encoding="utf-8") as f:
+            pending = json.load(f)
+        for tmp, name in pending["files"].items():
+            if (self.vector_dir / tmp).exists():  # else already moved before a crash
+                os.replace(self.vector_dir / tmp, self.vector_dir / name)
+        _write_json_atomic(self.snapshot_file, {"generation": pending["generation"],
+                                                "deleted": pending.get("deleted", [])})
+        for log in (self.vector_log, self.meta_log):
+            if log.exists():
+                log.unlink()
+        self.pending_file.unlink()
+        self.generation = pending["generation"]
+
+    def _too_many_deleted(self) -> bool:
+        total = len(self.metadata)
+        return bool(total and len(self.deleted) / total >= COMPACT_DELETED_RATIO)
+
+    def _is_graph(self) -> bool:
+        return backend_of(self.index) == "hnsw"
+
+    def _maybe_compact_locked(self):
+        """After a write: fold the log when due; start a graph rebuild when an HNSW index is too tombstoned."""
+        if self._log_ops >= self.compact_every or (self._too_many_deleted() and not self._is_graph()):
+            self._compact_locked()
+        if self._too_many_deleted() and self._is_graph():
+            self._start_graph_rebuild()
+
+    def _live_rows(self) -> List[int]:
+        return [i for i in range(len(self.metadata)) if i not in self.deleted]
+
+    def _compact_locked(self):
+        with metrics.stage("index_compact"):
+            index, records, deleted = self.index, iter(self.metadata), ()
+            if self.deleted and self._is_graph():
+                deleted = self.deleted  # dropped by rebuild_graph, off the lock
+            elif self.deleted:
+                keep = self._live_rows()
+                index = remove_rows(self.index, sorted(self.deleted))
+                records = (self.metadata[i] for i in keep)
+            self._write_snapshot(index, records, list(self.aliases.values()), deleted)
+            self.version += 1
+
+    def compact(self):
+        """Fold the log into a fresh snapshot; a no-op when nothing changed since the last one."""
+        with self.lock.write():
+            if self._log_ops or (self.deleted and not self._is_graph()):
+                self._compact_locked()
+
+    def _start_graph_rebuild(self):
+        if self._rebuild_thread is None or not self._rebuild_thread.is_alive():
+            self._rebuild_thread = threading.Thread(target=self.rebuild_graph, name="hnsw-rebuild", daemon=True)
+            self._rebuild_thread.start()
+
+    def rebuild_graph(self) -> bool:
+        """
+        Drop an HNSW index's tombstoned rows by building a new graph over the
+        live ones. The build runs without the lock; rows added or deleted
+        meanwhile are carried over when the result is swapped in. Returns
+        False if there was nothing to do or the index was replaced meanwhile.
+        """
+        with self._rebuild_lock:
+            with self.lock.read():
+                base, n, dead = self.index, len(self.metadata), set(self.deleted)
+                if not dead or backend_of(base) != "hnsw":
+                    return False
+                keep = np.array([r for r in range(n) if r not in dead], dtype="int64")
+                vectors = base.reconstruct_batch(keep) if len(keep) else np.zeros((0, base.d), "float32")
+            with metrics.stage("index_graph_rebuild"):
+                index = same_codec(base)  # reconstructions re-encode to the same codes
+                if len(vectors):
+                    index.add(vectors)
+            with self.lock.write():
+                if self.index is not base:
+                    return False  # replace() swapped in another index
+                n_now = len(self.metadata)
+                if n_now > n:
+                    index.add(base.reconstruct_batch(np.arange(n, n_now, dtype="int64")))
+                rows = keep.tolist() + list(range(n, n_now))
+                new_row = {r: i for i, r in enumerate(rows)}
+                deleted = [new_row[r] for r in self.deleted if r not in dead]
+                self._write_snapshot(index, (self.metadata[r] for r in rows), list(self.aliases.values()), deleted)
+                self.version += 1
+            return True
+
+    def _exact_vectors(self, rows: Sequence[int]) -> Tuple[np.ndarray, int]:
+        """
+        (vectors of `rows`, how many are reconstructions of lossy codes). With
+        lossy storage the embedding cache supplies the exact vector of any
+        chunk text it has seen, so a rebuild on another backend starts from
+        the embedder's output rather than from ivf_pq / int8 codes.
+        """
+        rows = np.asarray(rows, dtype="int64")
+        if not len(rows):
+            return np.zeros((0, self.dim), dtype="float32"), 0
+        lossless = storage_of(self.index) == "float32" and backend_of(self.index) != "ivf_pq"
+        cache = None if lossless else get_embedding_cache(dim=self.dim)
+        if cache is None:
+            return self.index.reconstruct_batch(rows), 0 if lossless else len(rows)
+        cached, missing = cache.lookup([self.metadata[r].get("text") or "" for r in rows])
+        vectors = np.empty((len(rows), self.dim), dtype="float32")
+        is_missing = np.zeros(len(rows), dtype=bool)
+        is_missing[missing] = True
+        vectors[~is_missing] = cached
+        if missing:
+            vectors[is_missing] = self.index.reconstruct_batch(rows[is_missing])
+        return vectors, len(missing)
+
+    def export(self):
+        """
+        (vectors, metadata) of all live rows, e.g. to rebuild on another
+        backend; vectors are exact where the embedding cache has them.
+        """
+        with self.lock.read():
+            keep = self._live_rows()
+            vectors, lossy = self._exact_vectors(keep)
+            if lossy:
+                print(f"Warning: {lossy} of {len(keep)} vectors are not in the embedding cache and come from "
+                      f"{backend_of(self.index)}/{storage_of(self.index)} codes; re-embed for exact vectors")
+            return vectors, [self.metadata[i] for i in keep]
+
+    def replace(self, index, metadata: Iterable[Dict]):
+        """
+        Swap in a freshly built index (e.g. from embed_faiss.py) and persist it
+        as the snapshot. It holds every chunk itself, so no aliases carry over.
+        """
+        with self.lock.write():
+            self._write_snapshot(index, metadata)
+            self._dedup = None
+            self.version += 1
+
+    # ---------- mutations ----------
+    def add(self, vectors: np.ndarray, metas: Sequence[Dict]) -> int:
+        vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(-1, self.dim)
+        if len(vectors) != len(metas):
+            raise ValueError(f"{len(vectors)} vectors but {len(metas)} metadata records")
+        if not len(metas):
+            return 0
+        with self.lock.write(), metrics.stage("index_add"):
+            self._append_log(vectors, [{"op": "add", "meta": m} for m in metas])
+            self.index.add(vectors)
+            self.metadata.extend(metas)
+            self.bm25.add(m.get("text") for m in metas)
+            if self._dedup is not None:
+                self._dedup.add(metas)
+            self.version += 1
+            self._maybe_compact_locked()
+        return len(metas)
+
+    def add_chunks(self, chunks: Sequence[Dict], model) -> int:
+        """Embed chunks batch by batch (cached texts first) and append each batch as it is ready."""
+        added = 0
+        for vecs, items in iter_embedded_batches(model, chunks, cache=get_embedding_cache()):
+            added += self.add(vecs, items)
+        return added
+
+    def _delete_locked(self, rows: Iterable[int], alias_ids: Iterable[str] = ()) -> Tuple[int, List[Dict]]:
+        """Tombstone rows and drop aliases; returns (count, aliases left without a row to point at)."""
+        rows = sorted(set(r for r in rows if r not in self.deleted))
+        alias_ids = [i for i in alias_ids if i in self.aliases]
+        if not rows and not alias_ids:
+            return 0, []
+        ops = [{"op": "unalias", "ids": alias_ids}] if alias_ids else []
+        if rows:
+            ops.append({"op": "delete", "rows": rows})
+        self._append_log(None, ops)
+        self._drop_aliases(alias_ids)
+        self.deleted.update(rows)
+        ids = [self.metadata[r]["id"] for r in rows]
+        if self._dedup is not None:
+            self._dedup.remove(ids)
+        orphans = [self.aliases[a] for i in ids for a in sorted(self._aliases_of.get(i, ()))]
+        self.version += 1
+        self._maybe_compact_locked()
+        return len(rows) + len(alias_ids), orphans
+
+    def delete(self, ids: Iterable[str], model=None) -> int:
+        """Delete chunks (rows or aliases) by id; aliases of deleted rows are promoted with `model`."""
+        ids = list(ids)
+        with self.lock.write():
+            removed, orphans = self._delete_locked(self.metadata.rows_where("id", ids), ids)
+        self._promote(orphans, model)
+        return removed
+
+    def delete_file(self, file_name: str, model=None) -> int:
+        with self.lock.write():
+            rows = self.metadata.rows_where("file_name", [file_name])
+            alias_ids = [i for i, m in self.aliases.items() if m.get("file_name") == file_name]
+            removed, orphans = self._delete_locked(rows, alias_ids)
+        self._promote(orphans, model)
+        return removed
+
+    # ---------- aliases ----------
+    def _reset_aliases(self, metas: Iterable[Dict]):
+        self.aliases: Dict[str, Dict] = {}       # alias id -> its metadata, with "alias_of"
+        self._aliases_of: Dict[str, set] = {}    # chunk id -> ids of its aliases
+        self._set_aliases(metas)
+
+    def _set_aliases(self, metas: Iterable[Dict]):
+        self._drop_aliases([m["id"] for m in metas])  # re-pointing replaces the old entry
+        for m in metas:
+            self.aliases[m["id"]] = m
+            self._aliases_of.setdefault(m["alias_of"], set()).add(m["id"])
+
+    def _drop_aliases(self, ids: Iterable[str]):
+        for i in ids:
+            m = self.aliases.pop(i, None)
+            if m is not None:
+                siblings = self._aliases_of.get(m["alias_of"])
+                siblings.discard(i)
+                if not siblings:
+                    del self._aliases_of[m["alias_of"]]
+
+    def add_aliases(self, metas: Sequence[Dict]) -> int:
+        """Record chunks ({..., "alias_of": id}) as aliases of an indexed chunk instead of embedding them."""
+        if not metas:
+            return 0
+        metas = list(metas)
+        with self.lock.write():
+            self._append_log(None, [{"op": "alias", "metas": metas}])
+            self._set_aliases(metas)
+            self.version += 1
+            self._maybe_compact_locked()
+        return len(metas)
+
+    def _promote(self, orphans: List[Dict], model=None):
+        """
+        Give aliases whose chunk was deleted a row of their own, or re-point
+        them at another copy of their text, file by file. New rows go in
+        before the aliases are dropped, so a failure leaves them in place.
+        """
+        if not orphans:
+            return
+        if model is None:
+            from model_registry import get_embedder
+            model = get_embedder()
+        by_file: Dict[str, List[Dict]] = {}
+        for m in orphans:
+            chunk = {k: v for k, v in m.items() if k != "alias_of"}
+            by_file.setdefault(m.get("file_name"), []).append(chunk)
+        for file_name, chunks in by_file.items():
+            kept, dups = self.deduplicator().filter(chunks, ignore_file=file_name)
+            self.add_chunks(kept, model)
+            self.add_aliases(dups)
+            if kept:
+                with self.lock.write():
+                    ids = [c["id"] for c in kept]
+                    self._append_log(None, [{"op": "unalias", "ids": ids}])
+                    self._drop_aliases(ids)
+                    self.version += 1
+
+    # ---------- re-ingest with dedup ----------
+    def deduplicator(self) -> Deduplicator:
+        """Duplicate lookup over the live chunks, built on first use and kept in step with add/delete."""
+        if self._dedup is None:
+            with self._dedup_lock:
+                if self._dedup is None:
+                    with self.lock.read():
+                        dedup = Deduplicator(self.near_dup_bits)
+                        dedup.add(self.metadata[r] for r in self._live_rows())
+                        self._dedup = dedup
+        return self._dedup
+
+    def file_ids(self, file_name: str) -> Dict[str, int]:
+        """chunk id -> row (-1 for an alias) for the live chunks of one file."""
+        with self.lock.read():
+            ids = {i: -1 for i, m in self.aliases.items() if m.get("file_name") == file_name}
+            ids.update((self.metadata[r]["id"], r) for r in self.metadata.rows_where("file_name", [file_name])
+                       if r not in self.deleted)
+            return ids
+
+    def upsert_file(self, file_name: str, batches: Iterable[Sequence[Dict]], model,
+                    dedup: bool = INGEST_DEDUP, on_batch=None) -> Dict[str, int]:
+        """
+        Make the index hold exactly the chunks in `batches` for `file_name`.
+        Chunks whose id is already indexed are kept as they are; with `dedup`,
+        new chunks that duplicate another file's chunk are stored as its
+        aliases instead of being embedded; indexed chunks of the file that no
+        longer occur are deleted once every batch is in, so the old version
+        stays searchable meanwhile (aliases of other files pointing at them
+        are promoted). `on_batch(chunks_seen)` is called after each batch.
+        """
+        existing = self.file_ids(file_name)
+        seen = set()
+        counts = {"chunks": 0, "added": 0, "unchanged": 0, "duplicates": 0, "removed": 0}
+        for batch in batches:
+            fresh = []
+            for chunk in batch:
+                if chunk["id"] in seen:  # the same chunk listed twice
+                    counts["duplicates"] += 1
+                    continue
+                seen.add(chunk["id"])
+                if chunk["id"] in existing:
+                    counts["unchanged"] += 1
+                else:
+                    fresh.append(chunk)
+            if dedup and fresh:
+                fresh, dups = self.deduplicator().filter(fresh, ignore_file=file_name)
+                counts["duplicates"] += self.add_aliases(dups)
+            counts["added"] += self.add_chunks(fresh, model)
+            counts["chunks"] += len(batch)
+            if on_batch is not None:
+                on_batch(counts["chunks"])
+        counts["removed"] = self.delete((i for i in existing if i not in seen), model)
+        return counts
+
+    # ---------- queries ----------
+    def _eligible_rows(self, filters) -> Tuple[np.ndarray, Dict[int, Dict]]:
+        """
+        Live rows matching normalized filters (see meta_store.normalize_filters),
+        plus {row: alias} for rows that only qualify through a matching alias;
+        hits on those rows are reported as the alias.
+        """
+        rows = self.metadata.filter_rows(filters)
+        via: Dict[int, Dict] = {}
+        matching = [m for m in self.aliases.values() if matches_filters(m, filters)]
+        if matching:
+            owners = self.metadata.rows_where("id", [m["alias_of"] for m in matching])
+            row_of = {self.metadata[r]["id"]: r for r in owners}
+            for m in matching:
+                r = row_of.get(m["alias_of"])
+                if r is not None:
+                    via.setdefault(int(r), m)
+            extra = np.setdiff1d(np.fromiter(via, dtype="int64", count=len(via)), rows)
+            via = {int(r): via[int(r)] for r in extra}
+            rows = np.union1d(rows, extra)
+        if self.deleted and len(rows):
+            rows = rows[~np.isin(rows, np.fromiter(self.deleted, dtype="int64", count=len(self.deleted)))]
+        return rows, via
+
+    def search(self, query_vecs: np.ndarray, top_k: int,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               filters=None) -> List[List[Dict]]:
+        """
+        Top-k live chunks for each query row.
+
+        Each hit is the chunk's metadata dict plus "score" (cosine similarity) and
+        "row". Tombstoned rows are over-fetched and skipped. `nprobe` (IVF) and
+        `ef_search` (HNSW) override the index defaults for this call only.
+        `filters` restricts the search to matching chunks before ranking: small
+        subsets are scanned directly, larger ones via a FAISS ID selector.
+        """
+        query_vecs = np.ascontiguousarray(query_vecs, dtype="float32").reshape(-1, self.dim)
+        filters = normalize_filters(filters)
+        with self.lock.read():
+            if self.index.ntotal == 0:
+                return [[] for _ in range(len(query_vecs))]
+            via = {}
+            if filters is None:
+                k = min(top_k + len(self.deleted), self.index.ntotal)
+                params = search_params(self.index, nprobe, ef_search)
+                distances, indices = self.index.search(query_vecs, k, params=params)
+            else:
+                rows, via = self._eligible_rows(filters)
+                if not len(rows):
+                    return [[] for _ in range(len(query_vecs))]
+                if len(rows) <= FILTER_BRUTE_FORCE_MAX:
+                    distances, indices = search_subset(self.index, query_vecs, rows, top_k)
+                else:
+                    selector, _bitmap = bitmap_selector(rows, self.index.ntotal)
+                    params = search_params(self.index, nprobe, ef_search, selector)
+                    distances, indices = self.index.search(query_vecs, min(top_k, len(rows)), params=params)
+            results = []
+            for dists, rows in zip(distances, indices):
+                hits = []
+                for dist, row in zip(dists, rows):
+                    if row == -1 or row in self.deleted:
+                        continue
+                    hits.append({**(via.get(int(row)) or self.metadata[row]), "score": float(dist), "row": int(row)})
+                    if len(hits) == top_k:
+                        break
+                results.append(hits)
+            return results
+
+    def fingerprint(self) -> str:
+        """
+        Identifies the persisted index state across restarts (snapshot mtime +
+        log sizes). Changes with every mutation, and also on compaction.
+        """
+        with self.lock.read():
+            parts = []
+            for path in (self.faiss_file, self.vector_log, self.meta_log):
+                st = path.stat() if path.exists() else None
+                parts.append(f"{st.st_mtime_ns}:{st.st_size}" if st else "-")
+            return "|".join(parts)
+
+    def search_sparse(self, query: str, top_k: int, filters=None) -> List[Dict]:
+        """Top-k live chunks by BM25 keyword score; hits shaped like search()."""
+        filters = normalize_filters(filters)
+        with self.lock.read():
+            allowed, via = (None, {}) if filters is None else self._eligible_rows(filters)
+            return [{**(via.get(row) or self.metadata[row]), "score": score, "row": row}
+                    for row, score in self.bm25.search(query, top_k, self.deleted, allowed)]
+
+    def __len__(self) -> int:
+        return len(self.metadata) - len(self.deleted)
+
+    def stats(self) -> Dict:
+        with self.lock.read():
+            return {
+                "vectors": len(self),
+                "deleted": len(self.deleted),
+                "aliases": len(self.aliases),
+                "log_ops": self._log_ops,
+                "version": self.version,
+                "backend": backend_of(self.index),
+                "storage": storage_of(self.index),
+                "index_mb": round(index_nbytes(self.index) / 1e6, 2),
+                "bm25": self.bm25.stats(),
+            }
+
+
+# ----------------- Shared instance -----------------
+_service = None
+_service_lock = threading.Lock()
+
+def get_index_service() -> IndexService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = IndexService()
+    return _service
+
+def loaded_index_service() -> Optional[IndexService]:
+    """The shared instance if something has opened it already, without loading it."""
+    return _service
@@ -1,22 +1,27 @@
 # backend/ingest.py
 import os
+import re
 import json
-import uuid
+import importlib.util
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterator
 
 # Extraction libraries
 import fitz  # PyMuPDF
-import docx
-from PIL import Image
-import easyocr
 
-# Whisper (OpenAI) - ensure installed via pip
-try:
-    import whisper
-    WHISPER_AVAILABLE = True
-except Exception:
-    WHISPER_AVAILABLE = False
+import metrics
+from chunking import CHUNKER, get_chunker
+from dedup import ChunkIds
+from model_registry import get_ocr_reader
+from ocr import OCR_MIN_PAGE_CHARS, iter_ocr_pdf_pages, ocr_image_file
+from transcribe import iter_transcribed_windows
+
+# Whisper (OpenAI) - ensure installed via pip. Only checked here: importing
+# it pulls in torch, so transcribe.py imports it when audio arrives.
+WHISPER_AVAILABLE = importlib.util.find_spec("whisper") is not None
 
 # ----------------- Config -----------------
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -24,79 +29,123 @@ UPLOADS_DIR = BASE_DIR / "data" / "uploads"
 INGESTED_DIR = BASE_DIR / "data" / "ingested"
 INGESTED_DIR.mkdir(parents=True, exist_ok=True)
 
-# Chunking parameters
-CHUNK_CHARS = 800
-CHUNK_OVERLAP = 200
+# Chunking: see chunking.py (CHUNKER=structure|fixed)
+HYPHEN_BREAK_RE = re.compile(r"(?<=\w)-\n(?=\w)")
+
+# Streaming: chunks handed to the embedder per batch, and optional
+# multiprocess PDF extraction (1 = extract pages in this process)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "64"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "1"))
+PDF_PAGES_PER_TASK = 50
+
+# File types routed to OCR / Whisper (everything else is parsed as text)
+IMAGE_EXTS = [".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".webp"]
+AUDIO_EXTS = [".mp3", ".wav", ".m4a", ".flac", ".ogg"]
 
 # ----------------- EasyOCR -----------------
-_reader = None
-def get_easyocr_reader(langs: list = ["en"], gpu: bool = False):
-    global _reader
-    if _reader is None:
-        _reader = easyocr.Reader(langs, gpu=gpu)  # English only
-    return _reader
+def get_easyocr_reader():
+    # Shared with main.py's /ocr endpoint via model_registry
+    return get_ocr_reader()
 
 def ocr_image(path: str) -> dict:
-    reader = get_easyocr_reader()
-    results = reader.readtext(path)  # list of (bbox, text, prob)
-    texts = []
-    for bbox, text, prob in results:
-        # Convert bbox coordinates to native Python floats/ints
-        bbox_native = [[float(coord) for coord in point] for point in bbox]
-        texts.append({"text": text, "prob": float(prob), "bbox": bbox_native})
-    full_text = "\n".join([t["text"] for t in texts])
-    return {"type": "image", "ocr": texts, "full_text": full_text}
+    # Downsized, batched and cached by content (see ocr.py)
+    info = ocr_image_file(path)
+    return {"type": "image", "ocr": info["ocr"], "full_text": info["full_text"], "ocr_key": info["ocr_key"]}
 
 # ----------------- Whisper -----------------
 def transcribe_audio(path: str, model_size: str="tiny") -> Dict:
     if not WHISPER_AVAILABLE:
         raise RuntimeError("Whisper not installed. Install via: pip install git+https://github.com/openai/whisper.git")
-    model = whisper.load_model(model_size)
-    # force English transcription
-    res = model.transcribe(path, language="en")
-    return {"type": "audio", "text": res.get("text",""), "segments": res.get("segments", [])}
+    # Windows split on silence, transcribed in order (see transcribe.py)
+    segments = [seg for window in iter_transcribed_windows(path, model_size) for seg in window]
+    return {"type": "audio", "text": " ".join(seg["text"].strip() for seg in segments), "segments": segments}
 
 # ----------------- PDF / DOCX -----------------
-def extract_text_from_pdf(path: str) -> Dict:
+def page_text(page) -> str:
+    # Layout blocks in reading order, one paragraph each, so the chunker can cut between them
+    paragraphs = []
+    for block in page.get_text("blocks", sort=True):
+        if block[6] != 0:  # image block
+            continue
+        text = " ".join(HYPHEN_BREAK_RE.sub("", block[4]).split())
+        if text:
+            paragraphs.append(text)
+    return "\n\n".join(paragraphs)
+
+def extract_pdf_range(path: str, start: int, end: int) -> List[Dict]:
+    # Top-level so it can run in a worker process
+    doc = fitz.open(path)
+    try:
+        return [{"page": pno + 1, "text": page_text(doc[pno])} for pno in range(start, end)]
+    finally:
+        doc.close()
+
+def iter_pdf_pages(path: str, workers: int = PDF_EXTRACT_WORKERS,
+                   pages_per_task: int = PDF_PAGES_PER_TASK) -> Iterator[Dict]:
+    """Yield {"page", "text"} one page at a time, in order, without holding the whole document's text."""
     doc = fitz.open(path)
-    pages = []
-    for pno, page in enumerate(doc, start=1):
-        txt = page.get_text("text") or ""
-        pages.append({"page": pno, "text": txt})
-    return {"type": "pdf", "pages": pages}
+    n_pages = doc.page_count
+    if workers <= 1 or n_pages <= pages_per_task:
+        try:
+            for pno in range(n_pages):
+                with metrics.stage("extract_pdf"):
+                    text = page_text(doc[pno])
+                yield {"page": pno + 1, "text": text}
+        finally:
+            doc.close()
+        return
+    doc.close()
+
+    # Page ranges go to worker processes; at most 2 ranges per worker are in
+    # flight so memory stays bounded however long the document is.
+    ranges = iter([(s, min(s + pages_per_task, n_pages)) for s in range(0, n_pages, pages_per_task)])
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(extract_pdf_range, path, start, end))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            nxt = next(ranges, None)
+            if nxt is not None:
+                pending.append(pool.submit(extract_pdf_range, path, *nxt))
+            yield from pages
+
+def extract_text_from_pdf(path: str) -> Dict:
+    return {"type": "pdf", "pages": list(iter_pdf_pages(path, workers=1))}
 
 def extract_text_from_docx(path: str) -> Dict:
-    d = docx.Document(path)
-    paragraphs = [p.text for p in d.paragraphs if p.text.strip()]
+    import docx
+    with metrics.stage("extract_docx"):
+        d = docx.Document(path)
+        paragraphs = [p.text for p in d.paragraphs if p.text.strip()]
     return {"type": "docx", "text": "\n\n".join(paragraphs)}
 
 # ----------------- Chunking -----------------
-def chunk_text(text: str, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP):
-    n = len(text)
-    start = 0
-    while start < n:
-        end = min(start + chunk_chars, n)
-        yield start, end, text[start:end]
-        if end == n:
-            break
-        start = max(0, end - overlap)
+def chunk_text(text: str, chunker: str = CHUNKER):
+    """(char_start, char_end, text) spans of `text` from the named chunker."""
+    with metrics.stage("chunk"):
+        return list(get_chunker(chunker).chunk(text))
 
 # ----------------- Ingestion -----------------
-def ingest_file(filepath: str) -> List[Dict]:
+def iter_chunks(filepath) -> Iterator[Dict]:
+    """Chunk dicts for one file, produced lazily (PDFs page by page)."""
     filepath = Path(filepath)
     ext = filepath.suffix.lower()
     file_stem = filepath.name
-    out_items = []
+    chunk_id = ChunkIds(file_stem)
 
     if ext == ".pdf":
-        info = extract_text_from_pdf(str(filepath))
-        for page in info["pages"]:
+        scanned = []  # pages without a text layer, OCR'd in batches afterwards
+        for page in iter_pdf_pages(str(filepath)):
             txt = page["text"] or ""
-            if not txt.strip():
+            if len(txt.strip()) < OCR_MIN_PAGE_CHARS:
+                scanned.append(page["page"])
                 continue
             for s,e,chunk in chunk_text(txt):
-                out_items.append({
-                    "id": str(uuid.uuid4()),
+                yield {
+                    "id": chunk_id(chunk),
                     "file_name": file_stem,
                     "source_type": "pdf",
                     "page": page["page"],
@@ -104,88 +153,116 @@ def ingest_file(filepath: str) -> List[Dict]:
                     "char_end": int(e),
                     "text": chunk.strip(),
                     "raw_path": str(filepath)
-                })
+                }
+        for page in iter_ocr_pdf_pages(str(filepath), scanned):
+            for s,e,chunk in chunk_text(page["full_text"]):
+                yield {
+                    "id": chunk_id(chunk),
+                    "file_name": file_stem,
+                    "source_type": "pdf",
+                    "page": page["page"],
+                    "char_start": int(s),
+                    "char_end": int(e),
+                    "text": chunk.strip(),
+                    "ocr_key": page["ocr_key"],
+                    "raw_path": str(filepath)
+                }
 
     elif ext in [".docx", ".doc"]:
         info = extract_text_from_docx(str(filepath))
         txt = info.get("text","")
         for s,e,chunk in chunk_text(txt):
-            out_items.append({
-                "id": str(uuid.uuid4()),
+            yield {
+                "id": chunk_id(chunk),
                 "file_name": file_stem,
                 "source_type": "docx",
                 "char_start": int(s),
                 "char_end": int(e),
                 "text": chunk.strip(),
                 "raw_path": str(filepath)
-            })
+            }
 
-    elif ext in [".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".webp"]:
+    elif ext in IMAGE_EXTS:
         info = ocr_image(str(filepath))
         full = info.get("full_text","")
         for s,e,chunk in chunk_text(full):
-            out_items.append({
-                "id": str(uuid.uuid4()),
+            yield {
+                "id": chunk_id(chunk),
                 "file_name": file_stem,
                 "source_type": "image",
                 "char_start": int(s),
                 "char_end": int(e),
                 "text": chunk.strip(),
-                "ocr_details": info["ocr"],
+                "ocr_key": info["ocr_key"],  # boxes: ocr.get_ocr_details(key), stored once per image
                 "raw_path": str(filepath)
-            })
-
-    elif ext in [".mp3", ".wav", ".m4a", ".flac", ".ogg"]:
-        info = transcribe_audio(str(filepath), model_size="tiny")
-        segments = info.get("segments", [])
-        if segments:
-            for seg in segments:
-                text = seg.get("text","").strip()
-                if not text:
-                    continue
-                out_items.append({
-                    "id": str(uuid.uuid4()),
+            }
+
+    elif ext in AUDIO_EXTS:
+        if not WHISPER_AVAILABLE:
+            raise RuntimeError("Whisper not installed. Install via: pip install git+https://github.com/openai/whisper.git")
+        # Windows end on a pause, so grouping segments per window loses no chunk boundary
+        for segments in iter_transcribed_windows(str(filepath), model_size="tiny"):
+            for start, end, text in get_chunker().group_segments(segments):
+                yield {
+                    "id": chunk_id(text),
                     "file_name": file_stem,
                     "source_type": "audio",
-                    "start_time": float(seg.get("start",0.0)),
-                    "end_time": float(seg.get("end",0.0)),
+                    "start_time": start,
+                    "end_time": end,
                     "text": text,
                     "raw_path": str(filepath)
-                })
-        else:
-            text = info.get("text","")
-            for s,e,chunk in chunk_text(text):
-                out_items.append({
-                    "id": str(uuid.uuid4()),
-                    "file_name": file_stem,
-                    "source_type": "audio",
-                    "char_start": int(s),
-                    "char_end": int(e),
-                    "text": chunk.strip(),
-                    "raw_path": str(filepath)
-                })
+                }
 
     else:
         try:
             txt = filepath.read_text(encoding="utf-8")
-            for s,e,chunk in chunk_text(txt):
-                out_items.append({
-                    "id": str(uuid.uuid4()),
-                    "file_name": file_stem,
-                    "source_type": "text",
-                    "char_start": int(s),
-                    "char_end": int(e),
-                    "text": chunk.strip(),
-                    "raw_path": str(filepath)
-                })
-        except Exception:
-            print(f"Skipping unsupported file type: {filepath}")
-            return []
-
-    # Save chunks to JSONL
-    out_path = INGESTED_DIR / f"{file_stem}.jsonl"
-    with open(out_path, "w", encoding="utf-8") as fh:
-        for it in out_items:
-            fh.write(json.dumps(it, ensure_ascii=False) + "\n")
-    print(f"Ingested {len(out_items)} chunks from {file_stem} -> {out_path}")
+        except UnicodeDecodeError:
+            txt = None
+        if txt is None or "\x00" in txt:  # binary
+            raise ValueError(f"Unsupported file type: {filepath.name} is neither PDF, DOCX, an image, "
+                             "audio nor UTF-8 text")
+        for s,e,chunk in chunk_text(txt):
+            yield {
+                "id": chunk_id(chunk),
+                "file_name": file_stem,
+                "source_type": "text",
+                "char_start": int(s),
+                "char_end": int(e),
+                "text": chunk.strip(),
+                "raw_path": str(filepath)
+            }
+
+def ingest_file_stream(filepath: str, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[List[Dict]]:
+    """
+    Ingest a file as a stream of chunk batches.
+
+    Each chunk is written to the file's JSONL as soon as it is produced and
+    handed out in batches of `batch_size`, so memory stays bounded by one
+    page plus one batch regardless of document size.
+    """
+    filepath = Path(filepath)
+    out_path = INGESTED_DIR / f"{filepath.name}.jsonl"
+    tmp_path = out_path.with_suffix(".jsonl.tmp")
+    count, batch = 0, []
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            for it in iter_chunks(filepath):
+                fh.write(json.dumps(it, ensure_ascii=False) + "\n")
+                batch.append(it)
+                count += 1
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)  # a failed file leaves no JSONL behind, not even an empty one
+        raise
+    os.replace(tmp_path, out_path)
+    print(f"Ingested {count} chunks from {filepath.name} -> {out_path}")
+
+def ingest_file(filepath: str) -> List[Dict]:
+    out_items = []
+    for batch in ingest_file_stream(filepath):
+        out_items.extend(batch)
     return out_items
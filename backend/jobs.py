@@ -0,0 +1,130 @@
+# backend/jobs.py
+# SQLite-backed ingestion job queue. /upload saves the file, enqueues a job and
+# returns its id; background workers (started by main.py) claim jobs and run
+# them stage by stage, recording per-stage status and timings that /jobs/{id}
+# reports. Jobs that were running when the process died are re-queued on
+# startup, so nothing is lost across restarts.
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# ----------------- Config -----------------
+BASE_DIR = Path(__file__).resolve().parent.parent
+JOBS_DB = Path(os.getenv("JOBS_DB", str(BASE_DIR / "data" / "jobs.sqlite3")))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))  # jobs processed concurrently
+MAX_ATTEMPTS = 3  # a job that keeps killing the worker is failed after this many starts
+
+STAGES = ("upload", "extract", "embed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    file_name   TEXT NOT NULL,
+    file_path   TEXT NOT NULL,
+    status      TEXT NOT NULL,          -- queued | running | done | failed
+    stage       TEXT,
+    stages      TEXT NOT NULL,          -- JSON: stage -> {status, seconds, ...}
+    chunks      INTEGER,
+    error       TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    def __init__(self, db_path: Path = JOBS_DB):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    # ---------- producer side ----------
+    def enqueue(self, file_path: str, file_name: str, upload_seconds: float = None) -> str:
+        job_id = uuid.uuid4().hex
+        stages = {s: {"status": "pending"} for s in STAGES}
+        if upload_seconds is not None:
+            stages["upload"] = {"status": "done", "seconds": round(upload_seconds, 3)}
+        self._execute(
+            "INSERT INTO jobs (id, file_name, file_path, status, stages, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, file_name, str(file_path), json.dumps(stages), time.time()))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        rows = self._execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    # ---------- worker side ----------
+    def requeue_interrupted(self) -> int:
+        """Put jobs left 'running' by a previous process back in the queue."""
+        cur = self._execute(
+            "UPDATE jobs SET status = 'queued', stage = NULL WHERE status = 'running' AND attempts < ?",
+            (MAX_ATTEMPTS,))
+        self._execute(
+            "UPDATE jobs SET status = 'failed', error = 'worker died repeatedly', finished_at = ? "
+            "WHERE status = 'running'", (time.time(),))
+        return cur.rowcount
+
+    def claim(self) -> Optional[Dict]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                        (time.time(), row["id"]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row) if row else None
+
+    def update_stage(self, job_id: str, stage: str, **info):
+        with self._lock:
+            row = self._conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            stages = json.loads(row["stages"])
+            stages.setdefault(stage, {}).update(info)
+            self._conn.execute("UPDATE jobs SET stage = ?, stages = ? WHERE id = ?",
+                               (stage, json.dumps(stages), job_id))
+
+    def start_stage(self, job_id: str, stage: str):
+        self.update_stage(job_id, stage, status="running", started_at=time.time())
+
+    def finish_stage(self, job_id: str, stage: str, seconds: float, **info):
+        self.update_stage(job_id, stage, status="done", seconds=round(seconds, 3), **info)
+
+    def complete(self, job_id: str, chunks: int):
+        self._execute("UPDATE jobs SET status = 'done', stage = NULL, chunks = ?, finished_at = ? WHERE id = ?",
+                      (chunks, time.time(), job_id))
+
+    def fail(self, job_id: str, error: str):
+        self._execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                      (error, time.time(), job_id))
+
+    @staticmethod
+    def _to_dict(row) -> Dict:
+        job = dict(row)
+        job["stages"] = json.loads(job["stages"])
+        done = sum(1 for s in job["stages"].values() if s.get("status") == "done")
+        job["progress"] = round(done / len(job["stages"]), 2) if job["stages"] else 0.0
+        return job
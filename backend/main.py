@@ -1,28 +1,32 @@
 # backend/main.py
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from starlette.routing import Match
+from fastapi import HTTPException
 from pathlib import Path
-import shutil
+import asyncio
 import json
-import faiss
-import torch
-import numpy as np
+import threading
+import time
 import uvicorn
 from fastapi import UploadFile, File
-import whisper
-from PIL import Image
-import easyocr
-
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 
 # Import your existing modules
-from ingest import ingest_file
-from embed_faiss import VECTOR_DIR, model as embed_model
-from rag_generate import generate_answer
+import metrics
+from ingest import ingest_file, ingest_file_stream, IMAGE_EXTS, AUDIO_EXTS, STREAM_BATCH_SIZE
+from index_service import get_index_service, loaded_index_service
+from batcher import QueryBatcher, QUERY_BATCHING
+from jobs import JobQueue, INGEST_WORKERS
+from query_cache import get_query_cache
+import reranker
+from model_registry import registry, PRELOAD_MODELS, get_embedder, get_whisper
+from ocr import get_ocr_cache, get_ocr_details, ocr_image_file
+from rag_generate import generate_answer, stream_answer, decoding_config, MAX_NEW_TOKENS
+from workers import WorkerPools, PoolSaturated, save_upload
 
 app = FastAPI(title="Multimodal RAG API", version="2.0")
-ocr_reader = easyocr.Reader(['en'], gpu=torch.cuda.is_available())
-whisper_model = whisper.load_model("tiny") 
 
 
 origins = [
@@ -43,56 +47,207 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_DIR = BASE_DIR / "data/uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-FAISS_FILE = VECTOR_DIR / "faiss_index.bin"
-META_FILE = VECTOR_DIR / "metadatas.json"
-
-LLM_MODEL = "google/flan-t5-small"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+from typing import List, Literal, Optional, Tuple
+from pydantic import BaseModel, Field
 
-tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL)
-llm_model = AutoModelForSeq2SeqLM.from_pretrained(LLM_MODEL).to(DEVICE)
-llm_model.eval()
+class QueryFilters(BaseModel):
+    file_name: Optional[List[str]] = None
+    source_type: Optional[List[str]] = None   # text / pdf / docx / image / audio
+    page_from: Optional[int] = None           # inclusive page range
+    page_to: Optional[int] = None
+    time_from: Optional[float] = None         # audio seconds; chunks overlapping the window
+    time_to: Optional[float] = None
 
-from pydantic import BaseModel
+    def to_dict(self):
+        return {"file_name": self.file_name, "source_type": self.source_type,
+                "page": (self.page_from, self.page_to), "time": (self.time_from, self.time_to)}
 
 class QueryRequest(BaseModel):
     query: str
+    nprobe: Optional[int] = None      # IVF lists to scan (ivf_flat / ivf_pq backends)
+    ef_search: Optional[int] = None   # HNSW candidate list size
+    decoding: Optional[Literal["greedy", "beam", "sampling"]] = None  # default: DECODING_MODE
+    max_new_tokens: int = Field(MAX_NEW_TOKENS, ge=1, le=1024)
+    retrieval: Optional[Literal["dense", "sparse", "hybrid"]] = None  # default: RETRIEVAL_MODE
+    hybrid_weights: Optional[Tuple[float, float]] = None  # (dense, sparse) RRF weights
+    rerank: Optional[bool] = None               # cross-encoder rerank; default: RERANK
+    rerank_budget_ms: Optional[float] = None    # fall back to retrieval order past this
+    filters: Optional[QueryFilters] = None
+    timings: bool = False                       # add a per-stage "timings" (ms) breakdown to the response
 
-# ---------------- Load FAISS ----------------
-def load_index():
-    if FAISS_FILE.exists() and META_FILE.exists():
-        index = faiss.read_index(str(FAISS_FILE))
-        with open(META_FILE, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-    else:
-        index = faiss.IndexFlatL2(384)
-        metadata = []
-    return index, metadata
+    def answer_kwargs(self):
+        return dict(nprobe=self.nprobe, ef_search=self.ef_search,
+                    max_new_tokens=self.max_new_tokens, decoding=self.decoding,
+                    retrieval=self.retrieval, weights=self.hybrid_weights,
+                    rerank=self.rerank, rerank_budget_ms=self.rerank_budget_ms,
+                    filters=self.filters.to_dict() if self.filters else None)
+
+# ---------------- Vector index ----------------
+# Shared with rag_generate (get_index_service()): vectors appended here are
+# searchable by /query as soon as embed_chain returns. It is opened by the
+# startup warm-up, not at import, so the server can answer /health/live first.
+
+# ---------------- Worker pools ----------------
+# Extraction, OCR, Whisper, embedding and generation run off the event loop
+# with per-model concurrency limits (see workers.py).
+pools = WorkerPools()
+
+# Concurrent /query calls share batched embedding, search and generation
+# (see batcher.py); QUERY_BATCHING=0 serves each request on its own.
+batcher = QueryBatcher() if QUERY_BATCHING else None
+
+@app.exception_handler(PoolSaturated)
+async def saturated_handler(request: Request, exc: PoolSaturated):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+# ---------------- Metrics ----------------
+# Stage histograms are recorded where the work happens (see metrics.py);
+# gauges below are read from the existing /index, /models, /cache and
+# /workers stats at scrape time. METRICS=0 turns recording off.
+def _route_path(scope) -> str:
+    for route in app.router.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route.path  # the template, so /jobs/{job_id} is one series
+    return "unmatched"
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    if not metrics.METRICS:
+        return await call_next(request)
+    start = time.perf_counter()
+    response = await call_next(request)
+    labels = {"method": request.method, "path": _route_path(request.scope), "status": response.status_code}
+    body = response.body_iterator
+
+    async def timed_body():
+        # call_next returns at the headers; /query/stream keeps decoding after
+        # that, so the request ends when the last body chunk is sent (or the
+        # client goes away)
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            metrics.observe("http_request_seconds", time.perf_counter() - start, **labels)
+
+    response.body_iterator = timed_body()
+    return response
 
-index, metadata = load_index()
+def _service_gauges():
+    stats = get_index_service().stats()
+    return [("index_vectors", {}, stats["vectors"]), ("index_deleted", {}, stats["deleted"]),
+            ("index_mb", {}, stats["index_mb"]), ("bm25_rows", {}, stats["bm25"]["rows"]),
+            ("query_cache_entries", {}, get_query_cache().stats()["entries"])]
 
-def save_index():
-    faiss.write_index(index, str(FAISS_FILE))
-    with open(META_FILE, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+def _model_gauges():
+    stats = registry.stats()
+    gauges = [("process_rss_mb", {}, stats["process_rss_mb"]), ("models_resident_mb", {}, stats["models_resident_mb"])]
+    for name, m in stats["models"].items():
+        gauges.append(("model_loaded", {"model": name}, int(m["loaded"])))
+        gauges.append(("model_resident_mb", {"model": name}, m["resident_mb"]))
+    return gauges
+
+def _worker_gauges():
+    gauges = []
+    for name, s in pools.stats().items():
+        gauges.append(("pool_running", {"pool": name}, s["running"]))
+        gauges.append(("pool_waiting", {"pool": name}, s["waiting"]))
+    if batcher is not None:
+        gauges.append(("query_batcher_pending", {}, batcher.stats()["pending"]))
+    return gauges
+
+for _collector in (_service_gauges, _model_gauges, _worker_gauges):
+    metrics.registry.add_collector(_collector)
 
 # ---------------- LangChain Pipelines ----------------
 
 def ingest_chain(file_path: str):
     return ingest_file(file_path)
 
-def embed_chain(chunks):
-    global index, metadata
-    for c in chunks:
-        text = c.get("text", "").strip()
-        if not text:
+async def ingest_chain_async(file_path: str):
+    ext = Path(file_path).suffix.lower()
+    if ext in IMAGE_EXTS:
+        return await pools.run_model("ocr", ingest_chain, file_path)
+    if ext in AUDIO_EXTS:
+        return await pools.run_model("whisper", ingest_chain, file_path)
+    return await pools.run_model("extract", ingest_chain, file_path)
+
+def embed_chain(chunks, file_name: str):
+    # Re-uploading a file replaces its chunks; duplicates of other files are skipped
+    counts = get_index_service().upsert_file(file_name, [chunks], get_embedder())
+    return counts["chunks"]
+
+def stream_chain(file_path: str, on_batch=None, batch_size: int = STREAM_BATCH_SIZE):
+    # Extract -> JSONL -> embed in bounded batches, so a 5,000-page PDF never
+    # sits in memory as a whole
+    counts = get_index_service().upsert_file(Path(file_path).name, ingest_file_stream(file_path, batch_size),
+                                             get_embedder(), on_batch=on_batch)
+    return counts["chunks"]
+
+# ---------------- Background ingestion ----------------
+# /upload only saves the file and enqueues a job; these workers run the
+# extract -> embed stages and record progress in the SQLite job queue.
+job_queue = JobQueue()
+_job_wakeup = None
+_job_workers = []
+
+async def _when_free(fn, *args):
+    # Background jobs wait for pool capacity instead of failing with 429
+    while True:
+        try:
+            return await fn(*args)
+        except PoolSaturated:
+            await asyncio.sleep(1)
+
+async def run_ingest_job(job):
+    job_id = job["id"]
+    ext = Path(job["file_path"]).suffix.lower()
+    if ext not in IMAGE_EXTS:
+        # Documents and audio stream: extraction and embedding overlap batch by
+        # batch. Audio chunks trickle in one Whisper window at a time, so each
+        # is embedded as soon as it arrives.
+        await asyncio.to_thread(job_queue.start_stage, job_id, "extract")
+        await asyncio.to_thread(job_queue.start_stage, job_id, "embed")
+        start = time.perf_counter()
+        pool, batch_size = ("whisper", 1) if ext in AUDIO_EXTS else ("extract", STREAM_BATCH_SIZE)
+        chunk_count = await _when_free(
+            pools.run_model, pool, stream_chain, job["file_path"],
+            lambda n: job_queue.update_stage(job_id, "embed", chunks=n), batch_size)
+        seconds = time.perf_counter() - start
+        await asyncio.to_thread(job_queue.finish_stage, job_id, "extract", seconds, streamed=True)
+        await asyncio.to_thread(job_queue.finish_stage, job_id, "embed", seconds, chunks=chunk_count)
+        await asyncio.to_thread(job_queue.complete, job_id, chunk_count)
+        return
+
+    await asyncio.to_thread(job_queue.start_stage, job_id, "extract")
+    start = time.perf_counter()
+    chunks = await _when_free(ingest_chain_async, job["file_path"])
+    await asyncio.to_thread(job_queue.finish_stage, job_id, "extract", time.perf_counter() - start,
+                            chunks=len(chunks))
+
+    await asyncio.to_thread(job_queue.start_stage, job_id, "embed")
+    start = time.perf_counter()
+    chunk_count = await _when_free(pools.run_model, "embedder", embed_chain, chunks,
+                                     Path(job["file_path"]).name)
+    await asyncio.to_thread(job_queue.finish_stage, job_id, "embed", time.perf_counter() - start)
+    await asyncio.to_thread(job_queue.complete, job_id, chunk_count)
+
+async def ingest_worker():
+    while True:
+        job = await asyncio.to_thread(job_queue.claim)
+        if job is None:
+            try:
+                await asyncio.wait_for(_job_wakeup.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            _job_wakeup.clear()
             continue
-        emb = embed_model.encode(text, convert_to_numpy=True)
-        emb = np.array([emb], dtype="float32")
-        index.add(emb)
-        metadata.append(c)
-    save_index()
-    return len(chunks)
+        try:
+            await run_ingest_job(job)
+        except asyncio.CancelledError:
+            raise  # left 'running'; re-queued on next startup
+        except Exception as e:
+            print(f"Ingestion job {job['id']} failed: {e!r}")
+            await asyncio.to_thread(job_queue.fail, job["id"], repr(e))
 
 def rag_chain(query: str):
     answer, sources = generate_answer(query)
@@ -101,48 +256,193 @@ def rag_chain(query: str):
 rag_pipeline = rag_chain
 # ---------------- API Routes ----------------
 
+# ---------------- Startup ----------------
+# Startup only schedules work, so the server accepts connections right away.
+# The index and PRELOAD_MODELS then load in a background thread (each model
+# with one dummy forward pass unless WARMUP_FORWARD=0). /health/ready
+# reports their progress and turns 200 once everything is loaded. Requests
+# that arrive earlier still work: they wait for whatever they need to load.
+_started_at = time.time()
+_warmup = {step: {"status": "pending", "seconds": None} for step in ["index", *PRELOAD_MODELS]}
+_warmup_task = None
+
+def warm_up():
+    for step, state in _warmup.items():
+        state["status"] = "loading"
+        start = time.perf_counter()
+        try:
+            if step == "index":
+                get_index_service()
+            else:
+                registry.warm(step)
+        except Exception as e:  # stay live and say what failed rather than crash the worker
+            state.update(status="failed", error=repr(e))
+            print(f"Warm-up of '{step}' failed: {e!r}")
+            continue
+        state.update(status="ready", seconds=round(time.perf_counter() - start, 3))
+    print(f"Ready {time.time() - _started_at:.1f}s after import")
+
+@app.on_event("startup")
+async def start_warm_up():
+    global _warmup_task
+    _warmup_task = asyncio.create_task(asyncio.to_thread(warm_up))
+
+@app.on_event("startup")
+async def start_ingest_workers():
+    global _job_wakeup
+    _job_wakeup = asyncio.Event()
+    requeued = job_queue.requeue_interrupted()
+    if requeued:
+        print(f"Re-queued {requeued} interrupted ingestion job(s)")
+    for _ in range(INGEST_WORKERS):
+        _job_workers.append(asyncio.create_task(ingest_worker()))
+
+@app.on_event("shutdown")
+def flush_index():
+    for task in _job_workers:
+        task.cancel()
+    pools.shutdown()
+    if batcher is not None:
+        batcher.close()
+    service = loaded_index_service()
+    if service is not None:  # never opened: nothing to flush
+        service.compact()
+
+@app.get("/health/live")
+def health_live():
+    # The process is up and serving; says nothing about models or the index
+    return {"status": "live", "uptime_seconds": round(time.time() - _started_at, 1)}
+
+@app.get("/health/ready")
+def health_ready():
+    statuses = {state["status"] for state in _warmup.values()}
+    status = "ready" if statuses == {"ready"} else "failed" if "failed" in statuses else "starting"
+    return JSONResponse(status_code=200 if status == "ready" else 503,
+                        content={"status": status, "uptime_seconds": round(time.time() - _started_at, 1),
+                                 "steps": _warmup})
+
+@app.get("/models")
+def model_stats():
+    return registry.stats()
+
+@app.get("/index")
+def index_stats():
+    return get_index_service().stats()
+
+@app.get("/cache")
+def cache_stats():
+    ocr_cache = get_ocr_cache()
+    return {**get_query_cache().stats(), "rerank": reranker.stats(),
+            "ocr": ocr_cache.stats() if ocr_cache is not None else None}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/workers")
+def worker_stats():
+    stats = pools.stats()
+    if batcher is not None:
+        stats["query_batcher"] = batcher.stats()
+    return stats
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     file_path = UPLOAD_DIR / file.filename
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    start = time.perf_counter()
+    await save_upload(file, file_path)
 
-    chunks = ingest_chain(str(file_path))
-    chunk_count = embed_chain(chunks)
+    job_id = await asyncio.to_thread(job_queue.enqueue, str(file_path), file.filename,
+                                     time.perf_counter() - start)
+    _job_wakeup.set()
 
     return {
-        "message": f"File '{file.filename}' successfully ingested.",
-        "chunks_created": chunk_count
+        "message": f"File '{file.filename}' queued for ingestion.",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}"
     }
 
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job
+
+@app.get("/jobs")
+def recent_jobs(limit: int = 50):
+    return job_queue.recent(limit)
+
 @app.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
     file_path = UPLOAD_DIR / file.filename
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    await save_upload(file, file_path)
     
-    result = whisper_model.transcribe(str(file_path))
+    result = await pools.run_model("whisper", lambda: get_whisper().transcribe(str(file_path)))
     return {"text": result["text"]}
 
 @app.post("/ocr")
 async def ocr_image(file: UploadFile = File(...)):
     file_path = UPLOAD_DIR / file.filename
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    await save_upload(file, file_path)
     
-    # Read text using EasyOCR
-    results = ocr_reader.readtext(str(file_path))
-    # Combine all detected text segments
-    text = " ".join([res[1] for res in results])
+    # Read text using EasyOCR; shares the content-hash cache with ingestion
+    info = await pools.run_model("ocr", ocr_image_file, str(file_path))
+    text = " ".join(r["text"] for r in info["ocr"])
     
-    return {"text": text}
+    return {"text": text, "ocr_key": info["ocr_key"]}
+
+@app.get("/ocr/{ocr_key}")
+def ocr_details(ocr_key: str):
+    # Word boxes for an image or scanned page; chunks only carry the key
+    details = get_ocr_details(ocr_key)
+    if details is None:
+        raise HTTPException(status_code=404, detail="Unknown OCR key")
+    return {"ocr_key": ocr_key, "ocr": details}
 
 @app.post("/query")
-def query_endpoint(request: QueryRequest):
+async def query_endpoint(request: QueryRequest):
     q = request.query
-    answer, sources = generate_answer(q)
+    trace = metrics.start_trace() if request.timings else None
+    if batcher is not None:
+        answer, sources = await batcher.answer(q, **request.answer_kwargs())
+    else:
+        answer, sources = await pools.run_model("llm", generate_answer, q, **request.answer_kwargs())
+    if trace is not None:
+        return {"answer": answer, "sources": sources, "timings": metrics.timings_ms(trace)}
     return {"answer": answer, "sources": sources}
 
+@app.post("/query/stream")
+async def query_stream_endpoint(request: QueryRequest):
+    # Server-Sent Events: "sources" first, then "token" events as flan-t5
+    # decodes, then "done" with time-to-first-token and tokens/sec
+    if decoding_config(request.decoding).get("num_beams", 1) > 1:
+        raise HTTPException(status_code=400, detail="beam search cannot be streamed; use greedy or sampling")
+    limiter = pools.limiters["llm"]
+    if limiter.saturated():
+        raise PoolSaturated(limiter.name)  # 429 before the stream starts
+
+    async def events():
+        # The LLM slot is taken and released inside the body, so a response
+        # that never starts holds nothing; on disconnect, `stop` ends decoding
+        trace = metrics.start_trace() if request.timings else None
+        stop = threading.Event()
+        try:
+            async with limiter:
+                try:
+                    answer_events = stream_answer(request.query, **request.answer_kwargs(), stop=stop)
+                    async for event, data in iterate_in_threadpool(answer_events):
+                        if event == "done" and trace is not None:
+                            data = {**data, "timings": metrics.timings_ms(trace)}
+                        yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                finally:
+                    stop.set()  # before the slot is released
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': repr(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 
 @app.get("/")
 def home():
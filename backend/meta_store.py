@@ -0,0 +1,333 @@
+# backend/meta_store.py
+# Columnar, memory-mapped chunk metadata (replaces the metadatas.json array).
+#
+#   meta_columns.bin  fixed-width rows (ROW_DTYPE): id, string-table codes for
+#                     file_name / source_type / raw_path, page, char offsets,
+#                     audio times and the offset of the row's text in the blob
+#   meta_text.bin     UTF-8 chunk text, each followed by a JSON object holding
+#                     any remaining fields (e.g. ocr_details)
+#   meta_strings.json the small string table the codes point into
+#
+# Both .bin files are memory-mapped, so opening the store costs the same for
+# ten chunks or ten million; a row's text and extras are only decoded when
+# the row is read (i.e. for the top-k search hits). Filtered search uses an
+# AttributeIndex built from the columns on first use.
+import json
+import math
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+COLUMNS_FILE = "meta_columns.bin"
+BLOB_FILE = "meta_text.bin"
+STRINGS_FILE = "meta_strings.json"
+STORE_FILES = (COLUMNS_FILE, BLOB_FILE, STRINGS_FILE)
+
+ID_BYTES = 40
+ROW_DTYPE = np.dtype([
+    ("id", f"S{ID_BYTES}"),
+    ("file_name", "<i4"),
+    ("source_type", "<i4"),
+    ("raw_path", "<i4"),
+    ("page", "<i4"),
+    ("char_start", "<i4"),
+    ("char_end", "<i4"),
+    ("start_time", "<f8"),
+    ("end_time", "<f8"),
+    ("text_off", "<i8"),
+    ("text_len", "<i4"),
+    ("extra_len", "<i4"),
+])
+STRING_FIELDS = ("file_name", "source_type", "raw_path")
+INT_FIELDS = ("page", "char_start", "char_end")
+FLOAT_FIELDS = ("start_time", "end_time")
+COLUMN_FIELDS = ("id", "text") + STRING_FIELDS + INT_FIELDS + FLOAT_FIELDS
+NULL = -1  # int/string-code columns; float columns use NaN
+
+
+FILTER_FIELDS = ("file_name", "source_type", "page", "time")
+
+
+def store_exists(directory: Path) -> bool:
+    return all((Path(directory) / name).exists() for name in STORE_FILES)
+
+
+# ----------------- Filters -----------------
+def normalize_filters(filters) -> Optional[Tuple]:
+    """
+    Canonical, hashable form of a filter spec, or None for "no filter":
+      {"file_name": [..], "source_type": [..], "page": [lo, hi], "time": [t0, t1]}
+    Lists match any value; page bounds are inclusive; "time" keeps chunks whose
+    [start_time, end_time] overlaps the window. Either bound may be None.
+    """
+    if not filters:
+        return None
+    filters = dict(filters)
+    unknown = set(filters) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown filter(s) {sorted(unknown)}. Choose from {FILTER_FIELDS}")
+    out = []
+    for field in FILTER_FIELDS:
+        value = filters.get(field)
+        if value is None:
+            continue
+        if field in ("page", "time"):
+            lo, hi = value
+            if lo is None and hi is None:
+                continue
+            out.append((field, (lo, hi)))
+        else:
+            values = [value] if isinstance(value, str) else list(value)
+            out.append((field, tuple(sorted(set(values)))))
+    return tuple(out) or None
+
+
+def matches_filters(meta: Dict, filters: Tuple) -> bool:
+    for field, value in filters:
+        if field in ("file_name", "source_type"):
+            if meta.get(field) not in value:
+                return False
+        elif field == "page":
+            page, (lo, hi) = meta.get("page"), value
+            if page is None or (lo is not None and page < lo) or (hi is not None and page > hi):
+                return False
+        else:
+            start, end, (t0, t1) = meta.get("start_time"), meta.get("end_time"), value
+            if start is None or end is None or (t1 is not None and start > t1) or (t0 is not None and end < t0):
+                return False
+    return True
+
+
+# ----------------- Writing -----------------
+class MetaStoreWriter:
+    """Streams records into a new store; files get `suffix` until the caller renames them."""
+
+    def __init__(self, directory: Path, suffix: str = ""):
+        self.directory = Path(directory)
+        self.suffix = suffix
+        self._cols = open(self.directory / (COLUMNS_FILE + suffix), "wb")
+        self._blob = open(self.directory / (BLOB_FILE + suffix), "wb")
+        self._strings: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._offset = 0
+        self._buf = np.zeros(4096, dtype=ROW_DTYPE)
+        self._buffered = 0
+        self.count = 0
+
+    def _code(self, value) -> int:
+        if value is None:
+            return NULL
+        value = str(value)
+        if value not in self._codes:
+            self._codes[value] = len(self._strings)
+            self._strings.append(value)
+        return self._codes[value]
+
+    def append(self, meta: Dict):
+        text = (meta.get("text") or "").encode("utf-8")
+        extra = {k: v for k, v in meta.items() if k not in COLUMN_FIELDS}
+        extra_bytes = json.dumps(extra, ensure_ascii=False).encode("utf-8") if extra else b""
+        if self._buffered == len(self._buf):
+            self._flush()
+        row = self._buf[self._buffered]
+        row["id"] = (meta.get("id") or "").encode("ascii", "replace")[:ID_BYTES]
+        for f in STRING_FIELDS:
+            row[f] = self._code(meta.get(f))
+        for f in INT_FIELDS:
+            row[f] = NULL if meta.get(f) is None else int(meta[f])
+        for f in FLOAT_FIELDS:
+            row[f] = np.nan if meta.get(f) is None else float(meta[f])
+        row["text_off"] = self._offset
+        row["text_len"] = len(text)
+        row["extra_len"] = len(extra_bytes)
+        self._buffered += 1
+        self._blob.write(text)
+        self._blob.write(extra_bytes)
+        self._offset += len(text) + len(extra_bytes)
+        self.count += 1
+
+    def _flush(self):
+        self._cols.write(self._buf[: self._buffered].tobytes())
+        self._buffered = 0
+
+    def close(self):
+        self._flush()
+        self._cols.close()
+        self._blob.close()
+        with open(self.directory / (STRINGS_FILE + self.suffix), "w", encoding="utf-8") as f:
+            json.dump(self._strings, f, ensure_ascii=False)
+
+
+def write_store(directory: Path, records: Iterable[Dict], commit: bool = True) -> int:
+    """
+    Write a complete store atomically (per file) into `directory`. With
+    commit=False the files are left as "<name>.tmp" for the caller to rename.
+    """
+    writer = MetaStoreWriter(directory, suffix=".tmp")
+    for meta in records:
+        writer.append(meta)
+    writer.close()
+    if commit:
+        for name in STORE_FILES:
+            os.replace(Path(directory) / (name + ".tmp"), Path(directory) / name)
+    return writer.count
+
+
+# ----------------- Reading -----------------
+class MetaStore:
+    """Read-only, memory-mapped view of a store written by MetaStoreWriter."""
+
+    def __init__(self, directory: Path):
+        directory = Path(directory)
+        self.rows = np.zeros(0, dtype=ROW_DTYPE)
+        self.strings: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._blob = None
+        self._attributes = None
+        self._attributes_lock = threading.Lock()
+        if not store_exists(directory):
+            return
+        with open(directory / STRINGS_FILE, "r", encoding="utf-8") as f:
+            self.strings = json.load(f)
+        if os.path.getsize(directory / COLUMNS_FILE):
+            self.rows = np.memmap(directory / COLUMNS_FILE, dtype=ROW_DTYPE, mode="r")
+        if os.path.getsize(directory / BLOB_FILE):
+            with open(directory / BLOB_FILE, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._codes = {s: i for i, s in enumerate(self.strings)}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _string(self, code) -> str:
+        return None if code == NULL else self.strings[code]
+
+    def __getitem__(self, i: int) -> Dict:
+        row = self.rows[i]
+        meta = {"id": row["id"].decode("ascii") or None}
+        for f in STRING_FIELDS:
+            meta[f] = self._string(int(row[f]))
+        for f in INT_FIELDS:
+            meta[f] = None if row[f] == NULL else int(row[f])
+        for f in FLOAT_FIELDS:
+            meta[f] = None if np.isnan(row[f]) else float(row[f])
+        off, n, n_extra = int(row["text_off"]), int(row["text_len"]), int(row["extra_len"])
+        meta["text"] = self._blob[off: off + n].decode("utf-8") if n else ""
+        if n_extra:
+            meta.update(json.loads(self._blob[off + n: off + n + n_extra].decode("utf-8")))
+        return meta
+
+    @property
+    def attributes(self) -> "AttributeIndex":
+        """Per-attribute row index for filtered search; built once, on first use."""
+        if self._attributes is None:
+            with self._attributes_lock:
+                if self._attributes is None:
+                    self._attributes = AttributeIndex(self.rows)
+        return self._attributes
+
+    def filter_rows(self, filters: Tuple) -> np.ndarray:
+        """Sorted row numbers matching normalized `filters`."""
+        idx, result = self.attributes, None
+        for field, value in filters:
+            if field in ("file_name", "source_type"):
+                rows = idx.rows_in(field, [self._codes[v] for v in value if v in self._codes])
+            elif field == "page":
+                lo, hi = value
+                rows = idx.rows_between("page", 0 if lo is None else lo, math.inf if hi is None else hi)
+            else:
+                # overlap: start_time <= t1 and end_time >= t0
+                t0, t1 = value
+                rows = np.intersect1d(idx.rows_between("start_time", -math.inf, math.inf if t1 is None else t1),
+                                      idx.rows_between("end_time", -math.inf if t0 is None else t0, math.inf),
+                                      assume_unique=True)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+        return np.arange(len(self), dtype="int64") if result is None else result
+
+    def rows_where(self, field: str, values: Sequence) -> np.ndarray:
+        """Row numbers whose `field` (id or a string column) is in `values`, via a column scan."""
+        if field == "id":
+            wanted = np.array([str(v).encode("ascii", "replace")[:ID_BYTES] for v in values], dtype=f"S{ID_BYTES}")
+        else:
+            wanted = np.array([self._codes[v] for v in values if v in self._codes], dtype="<i4")
+        if not len(self.rows) or not len(wanted):
+            return np.zeros(0, dtype="int64")
+        return np.nonzero(np.isin(self.rows[field], wanted))[0]
+
+    def close(self):
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+
+
+class AttributeIndex:
+    """
+    Sorted views of the filterable columns: rows grouped by string code
+    (file_name, source_type) and rows ordered by page / start_time /
+    end_time, so a filter is a few binary searches instead of a column scan.
+    """
+
+    def __init__(self, rows: np.ndarray):
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for field in ("file_name", "source_type", "page", "start_time", "end_time"):
+            values = np.asarray(rows[field])
+            order = np.argsort(values, kind="stable")  # NaN times sort last
+            self._sorted[field] = (order.astype("int64"), values[order])
+
+    def rows_in(self, field: str, codes: Sequence[int]) -> np.ndarray:
+        order, values = self._sorted[field]
+        parts = [order[np.searchsorted(values, c, "left"): np.searchsorted(values, c, "right")] for c in codes]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype="int64")
+
+    def rows_between(self, field: str, lo: float, hi: float) -> np.ndarray:
+        """Rows with lo <= value <= hi (NaN never matches)."""
+        order, values = self._sorted[field]
+        return np.sort(order[np.searchsorted(values, lo, "left"): np.searchsorted(values, hi, "right")])
+
+
+# ----------------- Base store + in-memory tail -----------------
+class ChunkMetadata:
+    """
+    Row-aligned metadata for the vector index: the memory-mapped snapshot
+    store followed by the records appended since (kept as dicts until the
+    next compaction writes a new store).
+    """
+
+    def __init__(self, store: MetaStore):
+        self.store = store
+        self.tail: List[Dict] = []
+
+    def __len__(self) -> int:
+        return len(self.store) + len(self.tail)
+
+    def __getitem__(self, i: int) -> Dict:
+        i = int(i)
+        base = len(self.store)
+        return self.store[i] if i < base else self.tail[i - base]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def extend(self, metas: Iterable[Dict]):
+        self.tail.extend(metas)
+
+    def filter_rows(self, filters: Tuple) -> np.ndarray:
+        """Sorted row numbers (store + tail) matching normalized `filters`."""
+        base = len(self.store)
+        tail = [base + i for i, m in enumerate(self.tail) if matches_filters(m, filters)]
+        return np.concatenate([self.store.filter_rows(filters), np.asarray(tail, dtype="int64")])
+
+    def rows_where(self, field: str, values: Sequence) -> List[int]:
+        wanted = set(values)
+        rows = self.store.rows_where(field, list(wanted)).tolist()
+        base = len(self.store)
+        rows.extend(base + i for i, m in enumerate(self.tail) if m.get(field) in wanted)
+        return rows
+
+    def close(self):
+        self.store.close()
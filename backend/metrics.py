@@ -0,0 +1,187 @@
+# backend/metrics.py
+# In-process metrics and per-request stage timings.
+#
+#   with stage("search"): ...          latency histogram per stage, and the
+#                                      current request's breakdown if it asked
+#   observe("llm_batch_size", n, SIZE_BUCKETS)   any other distribution
+#   registry.render()                  Prometheus text format for GET /metrics
+#
+# Request breakdowns ride on a context variable, so they follow a request
+# through asyncio tasks and, via WorkerPools.run_model, into worker threads.
+# The query batcher installs all of its requests' traces at once, so batched
+# stages are charged to every request in the batch. With METRICS=0 and no
+# trace requested, stage() is one flag check and a bare yield.
+# Stages that run in worker processes (AUDIO_WORKERS, OCR_WORKERS,
+# ingest_dir.py) are recorded in those processes and not exported here.
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# ----------------- Config -----------------
+METRICS = os.getenv("METRICS", "1") == "1"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+PREFIX = "intellica_"
+
+_traces: contextvars.ContextVar = contextvars.ContextVar("traces", default=())
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict, float]]]] = []
+        self._help: Dict[str, str] = {}
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, fn: Callable[[], Iterable[Tuple[str, Dict, float]]]):
+        """fn() -> [(gauge name, labels, value)], called at every scrape."""
+        self._collectors.append(fn)
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def render(self) -> str:
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {PREFIX}{name} {self._help[name]}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        with self._lock:
+            histograms = sorted((k, h.buckets, list(h.counts), h.sum, h.count) for k, h in self._histograms.items())
+            counters = sorted(self._counters.items())
+        seen = set()
+        for (name, labels), buckets, counts, total, count in histograms:
+            if name not in seen:
+                header(name, "histogram")
+                seen.add(name)
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            if name not in seen:
+                header(name, "counter")
+                seen.add(name)
+            lines.append(f"{PREFIX}{name}_total{_labels(labels)} {value}")
+        for collect in self._collectors:
+            try:
+                gauges = sorted(collect(), key=lambda g: g[0])
+            except Exception as e:  # a broken collector must not take /metrics down
+                print(f"Metrics collector failed: {e!r}")
+                continue
+            for name, labels, value in gauges:
+                if value is None:
+                    continue
+                if name not in seen:
+                    header(name, "gauge")
+                    seen.add(name)
+                lines.append(f"{PREFIX}{name}{_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Tuple, **extra) -> str:
+    pairs = list(labels) + [(k, v) for k, v in extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+registry.describe("stage_seconds", "Wall time per pipeline stage")
+registry.describe("http_request_seconds", "Wall time per HTTP request")
+
+
+# ----------------- Recording -----------------
+def observe(name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels):
+    if METRICS:
+        registry.observe(name, value, buckets, **labels)
+
+
+def inc(name: str, value: float = 1, **labels):
+    if METRICS:
+        registry.inc(name, value, **labels)
+
+
+@contextmanager
+def stage(name: str):
+    traces = _traces.get()
+    if not METRICS and not traces:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if METRICS:
+            registry.observe("stage_seconds", elapsed, stage=name)
+        for trace in traces:
+            trace[name] = trace.get(name, 0.0) + elapsed
+
+
+# ----------------- Per-request breakdowns -----------------
+def start_trace() -> Dict[str, float]:
+    """Begin collecting stage times for the current request; returns the (live) trace."""
+    trace: Dict[str, float] = {}
+    _traces.set(_traces.get() + (trace,))
+    return trace
+
+
+def current_trace() -> Optional[Dict[str, float]]:
+    traces = _traces.get()
+    return traces[-1] if traces else None
+
+
+@contextmanager
+def tracing(traces: Sequence[Dict[str, float]]):
+    """Charge the stages run inside to all of `traces` (e.g. a query batch)."""
+    token = _traces.set(tuple(traces))
+    try:
+        yield
+    finally:
+        _traces.reset(token)
+
+
+def timings_ms(trace: Dict[str, float]) -> Dict[str, float]:
+    return {name: round(seconds * 1000, 2) for name, seconds in trace.items()}
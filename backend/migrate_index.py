@@ -0,0 +1,69 @@
+# backend/migrate_index.py
+# Convert data/vectors in place to L2-normalized vectors searched by inner
+# product (cosine similarity), optionally compressing vector storage, and
+# report the memory saved and the recall change.
+#   python migrate_index.py                    # float32, same backend
+#   python migrate_index.py --storage float16
+#   python migrate_index.py --storage int8 -k 10
+import argparse
+import shutil
+
+import faiss
+import numpy as np
+
+from index_backends import STORAGES, backend_of, index_nbytes, normalize, rebuild_like, storage_of
+from index_service import IndexService
+
+
+def recall_at_k(index, queries: np.ndarray, truth: np.ndarray, k: int) -> float:
+    _, found = index.search(queries, k)
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-normalize faiss_index.bin for cosine similarity")
+    parser.add_argument("--storage", choices=STORAGES, help="vector encoding (default: keep current)")
+    parser.add_argument("--queries", type=int, default=200, help="sample queries for the recall check")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--no-backup", action="store_true", help="do not keep faiss_index.bin.bak")
+    args = parser.parse_args()
+
+    service = IndexService()
+    old_index = service.index
+    vectors, metadata = service.export()
+    if not len(vectors):
+        raise SystemExit("Vector store is empty; nothing to migrate.")
+
+    storage = args.storage or storage_of(old_index)
+    normalized = normalize(vectors)
+    new_index = rebuild_like(old_index, normalized, metric=faiss.METRIC_INNER_PRODUCT, storage=storage)
+
+    # Ground truth: exact cosine neighbours. Queries are stored vectors with a
+    # little noise, normalized the way rag_generate normalizes real queries.
+    n, dim = normalized.shape
+    k = min(args.k, n)
+    rng = np.random.default_rng(0)
+    queries = normalized[rng.integers(0, n, args.queries)]
+    queries = normalize(queries + 0.05 * rng.normal(size=queries.shape).astype("float32"))
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(normalized)
+    _, truth = exact.search(queries, k)
+
+    old_eval = rebuild_like(old_index, vectors)  # live rows only, same metric/storage as before
+    old_recall = recall_at_k(old_eval, queries, truth, k)
+    new_recall = recall_at_k(new_index, queries, truth, k)
+    old_bytes, new_bytes = index_nbytes(old_index), index_nbytes(new_index)
+
+    if not args.no_backup and service.faiss_file.exists():
+        shutil.copy2(service.faiss_file, service.faiss_file.with_suffix(".bin.bak"))
+    service.replace(new_index, metadata)
+
+    metric_name = {faiss.METRIC_L2: "L2", faiss.METRIC_INNER_PRODUCT: "IP"}.get(old_index.metric_type, "?")
+    print(f"Migrated {n} vectors ({backend_of(new_index)}): "
+          f"{metric_name}/{storage_of(old_index)} -> IP/{storage}")
+    print(f"Memory: {old_bytes / 1e6:.2f} MB -> {new_bytes / 1e6:.2f} MB "
+          f"({old_bytes / max(new_bytes, 1):.2f}x smaller)")
+    print(f"Recall@{k} vs exact cosine: {old_recall:.3f} -> {new_recall:.3f} "
+          f"({new_recall - old_recall:+.3f})")
+    print(f"Saved to {service.faiss_file}")
@@ -0,0 +1,283 @@
+# backend/model_registry.py
+# One in-process registry for every model the backend uses (embedder and its
+# tokenizer, LLM, reranker, OCR, Whisper). Each model is loaded lazily on first
+# use, shared by all callers, optionally preloaded at startup and evicted when
+# idle or when the resident total goes over MODEL_MEMORY_BUDGET_MB. Nothing
+# heavy (torch, transformers, whisper, easyocr) is imported until a loader runs.
+import gc
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except Exception:
+    PSUTIL_AVAILABLE = False
+
+# ----------------- Config -----------------
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"  # English only
+LLM_MODEL_NAME = "google/flan-t5-small"
+RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+OCR_LANGS = ["en"]
+WHISPER_MODEL_SIZE = "tiny"
+
+# 0 disables budget-based eviction
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# Models loaded by main.py at startup; the rest load on first use
+PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "embedder,llm").split(",") if m.strip()]
+# Run one tiny forward pass after a preload, so the first real request
+# doesn't pay for lazy kernel/graph initialization
+WARMUP_FORWARD = os.getenv("WARMUP_FORWARD", "1") == "1"
+
+
+def get_device() -> str:
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# ----------------- Memory accounting -----------------
+def process_rss_bytes() -> int:
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return 0
+
+
+def _param_bytes(obj) -> int:
+    """Bytes held by torch parameters/buffers reachable from obj (0 if not a torch model)."""
+    modules = obj if isinstance(obj, (tuple, list)) else [obj]
+    total = 0
+    for m in modules:
+        # EasyOCR and Whisper wrappers keep their torch modules as attributes
+        for sub in [m, getattr(m, "detector", None), getattr(m, "recognizer", None)]:
+            if sub is not None and hasattr(sub, "parameters") and hasattr(sub, "buffers"):
+                total += sum(t.numel() * t.element_size() for t in sub.parameters())
+                total += sum(t.numel() * t.element_size() for t in sub.buffers())
+    return total
+
+
+class _Entry:
+    def __init__(self, name: str, loader: Callable, warmer: Optional[Callable] = None):
+        self.name = name
+        self.loader = loader
+        self.warmer = warmer
+        self.instance = None
+        self.lock = threading.Lock()
+        self.load_seconds = None
+        self.rss_delta_bytes = 0
+        self.param_bytes = 0
+        self.last_used = 0.0
+        self.loads = 0
+        self.warm_seconds = None
+
+    @property
+    def resident_bytes(self) -> int:
+        # RSS delta undercounts when allocator pages were already mapped, and
+        # parameter size misses activations/caches; take whichever is larger.
+        return max(self.rss_delta_bytes, self.param_bytes)
+
+
+# ----------------- Registry -----------------
+class ModelRegistry:
+    def __init__(self, memory_budget_mb: float = MODEL_MEMORY_BUDGET_MB):
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable, warmer: Optional[Callable] = None):
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(name, loader, warmer)
+
+    def is_loaded(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.instance is not None
+
+    def get(self, name: str):
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Unknown model '{name}'. Registered: {sorted(self._entries)}")
+        entry.last_used = time.time()
+        if entry.instance is not None:
+            return entry.instance
+        with entry.lock:
+            if entry.instance is None:
+                rss_before = process_rss_bytes()
+                start = time.perf_counter()
+                instance = entry.loader()
+                entry.load_seconds = time.perf_counter() - start
+                entry.rss_delta_bytes = max(0, process_rss_bytes() - rss_before)
+                entry.param_bytes = _param_bytes(instance)
+                entry.loads += 1
+                entry.instance = instance
+                print(f"Loaded model '{name}' in {entry.load_seconds:.2f}s "
+                      f"(~{entry.resident_bytes / 1e6:.0f} MB)")
+        self._enforce_budget(keep=name)
+        return entry.instance
+
+    def preload(self, names: Optional[Iterable[str]] = None):
+        for name in (names if names is not None else list(self._entries)):
+            self.get(name)
+
+    def warm(self, name: str, forward: bool = WARMUP_FORWARD):
+        """Load `name` and, if it has a warmer, run its dummy forward pass once."""
+        instance = self.get(name)
+        entry = self._entries[name]
+        if forward and entry.warmer is not None and entry.warm_seconds is None:
+            start = time.perf_counter()
+            entry.warmer(instance)
+            entry.warm_seconds = time.perf_counter() - start
+        return instance
+
+    def evict(self, name: str) -> bool:
+        """Drop the registry's reference. Callers still holding the instance keep it alive."""
+        entry = self._entries.get(name)
+        if entry is None or entry.instance is None:
+            return False
+        with entry.lock:
+            entry.instance = None
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+        print(f"Evicted model '{name}'")
+        return True
+
+    def evict_idle(self, max_idle_seconds: float) -> list:
+        now = time.time()
+        idle = [e.name for e in self._entries.values()
+                if e.instance is not None and now - e.last_used > max_idle_seconds]
+        for name in idle:
+            self.evict(name)
+        return idle
+
+    def resident_bytes(self) -> int:
+        return sum(e.resident_bytes for e in self._entries.values() if e.instance is not None)
+
+    def _enforce_budget(self, keep: str = None):
+        if self.memory_budget_bytes <= 0:
+            return
+        loaded = sorted((e for e in self._entries.values() if e.instance is not None and e.name != keep),
+                        key=lambda e: e.last_used)
+        while loaded and self.resident_bytes() > self.memory_budget_bytes:
+            self.evict(loaded.pop(0).name)
+
+    def stats(self) -> Dict:
+        models = {}
+        for e in self._entries.values():
+            models[e.name] = {
+                "loaded": e.instance is not None,
+                "load_seconds": e.load_seconds,
+                "resident_mb": round(e.resident_bytes / 1e6, 1) if e.loads else None,
+                "param_mb": round(e.param_bytes / 1e6, 1) if e.loads else None,
+                "loads": e.loads,
+                "warm_seconds": round(e.warm_seconds, 3) if e.warm_seconds is not None else None,
+                "idle_seconds": round(time.time() - e.last_used, 1) if e.last_used else None,
+            }
+        return {
+            "process_rss_mb": round(process_rss_bytes() / 1e6, 1),
+            "models_resident_mb": round(self.resident_bytes() / 1e6, 1),
+            "memory_budget_mb": self.memory_budget_bytes / 1e6 if self.memory_budget_bytes else None,
+            "models": models,
+        }
+
+
+# ----------------- Loaders -----------------
+def _load_embedder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME, device=get_device())
+
+
+def _load_embed_tokenizer():
+    # Chunk sizing only needs the tokenizer; reuse the embedder's if it is resident
+    if registry.is_loaded("embedder"):
+        return registry.get("embedder").tokenizer
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+
+
+def _load_llm():
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+    tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL_NAME)
+    model = AutoModelForSeq2SeqLM.from_pretrained(LLM_MODEL_NAME).to(get_device())
+    model.eval()
+    return tokenizer, model
+
+
+def _load_reranker():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANKER_MODEL_NAME, device=get_device())
+
+
+def _load_ocr():
+    import easyocr
+    import torch
+    return easyocr.Reader(OCR_LANGS, gpu=torch.cuda.is_available())
+
+
+# ----------------- Warmers -----------------
+def _warm_embedder(model):
+    model.encode(["warm-up"], convert_to_numpy=True)
+
+
+def _warm_llm(llm):
+    import torch
+    tokenizer, model = llm
+    inputs = tokenizer(["warm-up"], return_tensors="pt").to(model.device)
+    with torch.no_grad():
+        model.generate(**inputs, max_new_tokens=2)
+
+
+def _warm_reranker(model):
+    model.predict([("warm-up", "warm-up")])
+
+
+def _whisper_loader(size: str):
+    def load():
+        import whisper
+        return whisper.load_model(size)
+    return load
+
+
+registry = ModelRegistry()
+registry.register("embedder", _load_embedder, _warm_embedder)
+registry.register("embed_tokenizer", _load_embed_tokenizer)
+registry.register("llm", _load_llm, _warm_llm)
+registry.register("reranker", _load_reranker, _warm_reranker)
+registry.register("ocr", _load_ocr)
+registry.register(f"whisper:{WHISPER_MODEL_SIZE}", _whisper_loader(WHISPER_MODEL_SIZE))
+
+
+def get_embedder():
+    return registry.get("embedder")
+
+
+def get_embed_tokenizer():
+    return registry.get("embed_tokenizer")
+
+
+def get_llm():
+    """(tokenizer, model) for the seq2seq answer generator."""
+    return registry.get("llm")
+
+
+def get_reranker():
+    return registry.get("reranker")
+
+
+def get_ocr_reader():
+    return registry.get("ocr")
+
+
+def get_whisper(size: str = WHISPER_MODEL_SIZE):
+    name = f"whisper:{size}"
+    registry.register(name, _whisper_loader(size))
+    return registry.get(name)
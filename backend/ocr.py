@@ -0,0 +1,227 @@
+# backend/ocr.py
+# OCR for image files and scanned (text-less) PDF pages.
+#
+# Images are grayscaled and downsized to OCR_DPI (PDF pages are rasterized
+# at it directly), which is plenty for EasyOCR and far cheaper than full
+# scanner resolution. Same-size images are recognized together with
+# readtext_batched, and large scans fan out over OCR_WORKERS processes, one
+# reader each. Results are cached in SQLite by a hash of the prepared
+# pixels, so a re-upload, a renamed copy or the /ocr endpoint never redo a
+# page. The cache is also where the per-image box list lives: chunks only
+# carry its "ocr_key" (see get_ocr_details).
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+from model_registry import OCR_LANGS, get_ocr_reader
+
+# ----------------- Config -----------------
+BASE_DIR = Path(__file__).resolve().parent.parent
+OCR_CACHE_DB = BASE_DIR / "data" / "cache" / "ocr_cache.sqlite3"
+OCR_CACHE = os.getenv("OCR_CACHE", "1") == "1"
+DEFAULT_CACHE = OCR_CACHE_DB if OCR_CACHE else None
+OCR_DPI = int(os.getenv("OCR_DPI", "150"))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2560"))  # px; caps images without DPI info
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "1"))  # 1 = OCR in this process
+# PDF pages with less extracted text than this are treated as scans
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "16"))
+PDF_POINTS_PER_INCH = 72
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr (
+    key TEXT PRIMARY KEY,
+    results TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+# ----------------- Cache -----------------
+class OCRCache:
+    """image key -> [{"text", "prob", "bbox"}] in prepared-image pixels; safe across processes (WAL)."""
+
+    def __init__(self, path: Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[Dict]]:
+        if not keys:
+            return {}
+        marks = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._db.execute(f"SELECT key, results FROM ocr WHERE key IN ({marks})", list(keys)).fetchall()
+        found = {k: json.loads(v) for k, v in rows}
+        self.counters["hits"] += len(found)
+        self.counters["misses"] += len(set(keys)) - len(found)
+        return found
+
+    def put(self, key: str, results: List[Dict]):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO ocr (key, results, created_at) VALUES (?, ?, ?)",
+                             (key, json.dumps(results), time.time()))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM ocr").fetchone()[0]
+        return {"entries": entries, **self.counters}
+
+
+_caches: Dict[str, OCRCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_ocr_cache(path: Optional[Path] = DEFAULT_CACHE) -> Optional[OCRCache]:
+    """Per-process cache for `path`; None disables caching."""
+    if path is None:
+        return None
+    with _caches_lock:
+        if str(path) not in _caches:
+            _caches[str(path)] = OCRCache(path)
+        return _caches[str(path)]
+
+
+def get_ocr_details(key: str, cache_path: Optional[Path] = DEFAULT_CACHE) -> Optional[List[Dict]]:
+    """Boxes for a chunk's "ocr_key", in pixels of the prepared (OCR_DPI, grayscale) image."""
+    cache = get_ocr_cache(cache_path)
+    return cache.get_many([key]).get(key) if cache is not None else None
+
+
+# ----------------- Preparing images -----------------
+def image_key(pixels: np.ndarray) -> str:
+    h = hashlib.sha256(f"{pixels.shape}|{','.join(OCR_LANGS)}|".encode("ascii"))
+    h.update(np.ascontiguousarray(pixels).tobytes())
+    return h.hexdigest()
+
+
+def prepare_image(path: str, dpi: int = OCR_DPI, max_side: int = OCR_MAX_SIDE) -> Tuple[np.ndarray, float]:
+    """(grayscale pixels, scale from source pixels) for an image file."""
+    from PIL import Image
+    with Image.open(path) as img:
+        img = img.convert("L")
+        scale = 1.0
+        source_dpi = img.info.get("dpi", (0, 0))[0]
+        if source_dpi and source_dpi > dpi:
+            scale = dpi / float(source_dpi)
+        scale = min(scale, max_side / float(max(img.size)))
+        if scale < 1.0:
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+        else:
+            scale = 1.0
+        return np.asarray(img, dtype="uint8"), scale
+
+
+def rasterize_page(page, dpi: int = OCR_DPI) -> np.ndarray:
+    import fitz
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    return np.frombuffer(pix.samples, dtype="uint8").reshape(pix.height, pix.stride)[:, :pix.width].copy()
+
+
+# ----------------- Recognition -----------------
+def _as_results(raw) -> List[Dict]:
+    return [{"text": text, "prob": float(prob), "bbox": [[float(c) for c in point] for point in bbox]}
+            for bbox, text, prob in raw]
+
+
+def _scaled(results: List[Dict], scale: float) -> List[Dict]:
+    if scale == 1.0:
+        return results
+    return [{**r, "bbox": [[c / scale for c in point] for point in r["bbox"]]} for r in results]
+
+
+def ocr_images(images: Sequence[np.ndarray], batch_size: int = OCR_BATCH_SIZE,
+               cache_path: Optional[Path] = DEFAULT_CACHE) -> List[Tuple[str, List[Dict]]]:
+    """(key, results) per prepared image, in order; cached images are not recognized again."""
+    keys = [image_key(img) for img in images]
+    cache = get_ocr_cache(cache_path)
+    found = cache.get_many(keys) if cache is not None else {}
+    todo: Dict[tuple, List[int]] = {}
+    for i, key in enumerate(keys):
+        if key not in found:
+            todo.setdefault(images[i].shape, []).append(i)
+            found[key] = None  # recognize each distinct image once
+    reader = get_ocr_reader() if todo else None
+    for shape, positions in todo.items():
+        # readtext_batched stacks its inputs, so only same-size images share a batch
+        for at in range(0, len(positions), batch_size):
+            batch = positions[at:at + batch_size]
+            metrics.observe("ocr_batch_size", len(batch), metrics.SIZE_BUCKETS)
+            with metrics.stage("ocr"):
+                if len(batch) == 1:
+                    raws = [reader.readtext(images[batch[0]])]
+                else:
+                    raws = reader.readtext_batched([images[i] for i in batch], batch_size=len(batch))
+            for i, raw in zip(batch, raws):
+                found[keys[i]] = _as_results(raw)
+                if cache is not None:
+                    cache.put(keys[i], found[keys[i]])
+    return [(key, found[key]) for key in keys]
+
+
+def full_text(results: List[Dict]) -> str:
+    return "\n".join(r["text"] for r in results)
+
+
+def ocr_image_file(path: str, cache_path: Optional[Path] = DEFAULT_CACHE) -> Dict:
+    """{"ocr_key", "ocr", "full_text"}; boxes are in the original image's pixels."""
+    pixels, scale = prepare_image(path)
+    key, results = ocr_images([pixels], cache_path=cache_path)[0]
+    return {"ocr_key": key, "ocr": _scaled(results, scale), "full_text": full_text(results)}
+
+
+def ocr_pdf_pages(path: str, pages: Sequence[int], dpi: int = OCR_DPI,
+                  cache_path: Optional[Path] = DEFAULT_CACHE) -> List[Dict]:
+    """
+    {"page", "ocr_key", "ocr", "full_text"} for 1-based `pages`, boxes in PDF
+    points. Top-level so it can run in a worker process.
+    """
+    import fitz
+    doc = fitz.open(path)
+    try:
+        images = [rasterize_page(doc[p - 1], dpi) for p in pages]
+    finally:
+        doc.close()
+    scale = dpi / PDF_POINTS_PER_INCH
+    return [{"page": p, "ocr_key": key, "ocr": _scaled(results, scale), "full_text": full_text(results)}
+            for p, (key, results) in zip(pages, ocr_images(images, cache_path=cache_path))]
+
+
+def iter_ocr_pdf_pages(path: str, pages: Sequence[int], workers: int = OCR_WORKERS,
+                       batch_size: int = OCR_BATCH_SIZE,
+                       cache_path: Optional[Path] = DEFAULT_CACHE) -> Iterator[Dict]:
+    """ocr_pdf_pages over `pages` in batches, in order, fanned out over `workers` processes."""
+    batches = [list(pages[i:i + batch_size]) for i in range(0, len(pages), batch_size)]
+    if workers <= 1 or len(batches) <= 1:
+        for batch in batches:
+            yield from ocr_pdf_pages(path, batch, cache_path=cache_path)
+        return
+
+    # At most 2 batches per worker in flight, like ingest.iter_pdf_pages
+    todo = iter(batches)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        for batch in todo:
+            pending.append(pool.submit(ocr_pdf_pages, path, batch, OCR_DPI, cache_path))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            results = pending.popleft().result()
+            nxt = next(todo, None)
+            if nxt is not None:
+                pending.append(pool.submit(ocr_pdf_pages, path, nxt, OCR_DPI, cache_path))
+            yield from results
@@ -0,0 +1,299 @@
+# backend/query_cache.py
+# Answer and retrieval cache for /query.
+#
+#   exact     LRU keyed by kind + search params + normalized query text
+#   semantic  reuses an entry whose query embedding is within
+#             QUERY_CACHE_SEMANTIC_THRESHOLD cosine of the new query's
+#   disk      optional SQLite tier (QUERY_CACHE_DISK=1) that survives restarts
+#
+# Entries expire after QUERY_CACHE_TTL_SECONDS and the memory tiers hold at
+# most QUERY_CACHE_MAX_ENTRIES. Every entry belongs to one index state: when
+# index_service.version moves (upload, delete, compaction) the cache compares
+# the index fingerprint and drops everything cached against the old index.
+# Callers pass the version they searched against to put(), so a result
+# computed before an upload is never stored as if it were current.
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from index_service import get_index_service
+
+# ----------------- Config -----------------
+BASE_DIR = Path(__file__).resolve().parent.parent
+CACHE_DB = BASE_DIR / "data" / "cache" / "query_cache.sqlite3"
+QUERY_CACHE = os.getenv("QUERY_CACHE", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_THRESHOLD = float(os.getenv("QUERY_CACHE_SEMANTIC_THRESHOLD", "0.95"))  # 0 disables the tier
+CACHE_DISK = os.getenv("QUERY_CACHE_DISK", "0") == "1"
+DISK_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_DISK_MAX_ENTRIES", "100000"))
+
+KINDS = ("retrieval", "answer")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key         TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    params      TEXT NOT NULL,
+    value       TEXT NOT NULL,          -- JSON
+    vec         BLOB,                   -- float32 query embedding
+    fingerprint TEXT NOT NULL,          -- index state the value was computed against
+    created_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_created ON entries (created_at);
+"""
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+class _Entry:
+    __slots__ = ("kind", "params", "value", "vec", "created_at")
+
+    def __init__(self, kind, params, value, vec, created_at):
+        self.kind = kind
+        self.params = params
+        self.value = value
+        self.vec = vec
+        self.created_at = created_at
+
+
+class QueryCache:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 semantic_threshold: float = SEMANTIC_THRESHOLD, disk_path: Optional[Path] = None,
+                 disk_max_entries: int = DISK_MAX_ENTRIES, service=None, enabled: bool = True):
+        self.enabled = enabled and max_entries > 0
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.threshold = semantic_threshold
+        self.disk_max_entries = disk_max_entries
+        self._service = service
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._matrices: Dict[tuple, tuple] = {}  # (kind, params) -> (keys, stacked vecs); rebuilt lazily
+        self._lock = threading.Lock()
+        self._version = None
+        self._fingerprint = None
+        self.counters = {f"{kind}_{event}": 0 for kind in KINDS
+                         for event in ("exact_hits", "semantic_hits", "disk_hits", "misses")}
+        self.counters.update(evictions=0, expirations=0, invalidations=0, stale_puts=0)
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if self.enabled and disk_path is not None:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(disk_path), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+            self._sync_index()
+            self._warm_from_disk()
+
+    def _execute(self, sql: str, params=()):
+        with self._db_lock:
+            return self._db.execute(sql, params)
+
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = get_index_service()
+        return self._service
+
+    @staticmethod
+    def _key(kind: str, params: Sequence, query: str) -> str:
+        return f"{kind}|{json.dumps(list(params))}|{normalize_query(query)}"
+
+    # ---------- invalidation ----------
+    def _sync_index(self):
+        """Drop every entry cached against an older index state."""
+        version = self.service.version
+        if version == self._version:
+            return
+        fingerprint = self.service.fingerprint()
+        with self._lock:
+            self._version = version
+            if fingerprint == self._fingerprint:
+                return
+            if self._fingerprint is not None and self._entries:
+                self.counters["invalidations"] += 1
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self._matrices.clear()
+            if self._db is not None:
+                self._execute("DELETE FROM entries WHERE fingerprint != ?", (fingerprint,))
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl > 0 and now - entry.created_at > self.ttl
+
+    # ---------- lookups ----------
+    def get_exact(self, kind: str, query: str, params: Sequence):
+        """Cached value for this exact (normalized) query, from memory or disk, else None."""
+        if not self.enabled:
+            return None
+        self._sync_index()
+        key = self._key(kind, params, query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry, now):
+                    self._entries.move_to_end(key)
+                    self.counters[f"{kind}_exact_hits"] += 1
+                    return entry.value
+                self._drop(key)
+                self.counters["expirations"] += 1
+        if self._db is not None:
+            row = self._execute(
+                "SELECT params, value, vec, created_at FROM entries WHERE key = ? AND fingerprint = ? "
+                "AND created_at >= ?", (key, self._fingerprint, now - self.ttl if self.ttl > 0 else 0)).fetchone()
+            if row is not None:
+                entry = self._entry_from_row(kind, row)
+                with self._lock:
+                    self._insert(key, entry)
+                    self.counters[f"{kind}_disk_hits"] += 1
+                return entry.value
+        return None
+
+    def get_semantic(self, kind: str, query_vec: np.ndarray, params: Sequence):
+        """
+        Cached value of the most similar cached query with the same params, if
+        its cosine similarity to `query_vec` (normalized) clears the threshold.
+        Counts a miss when nothing qualifies, so call it after get_exact; pass
+        query_vec=None to only count the miss.
+        """
+        if not self.enabled:
+            return None
+        if self.threshold <= 0 or query_vec is None:
+            self.counters[f"{kind}_misses"] += 1
+            return None
+        group = (kind, json.dumps(list(params)))
+        now = time.time()
+        with self._lock:
+            keys, matrix = self._matrix(group)
+            if len(keys):
+                sims = matrix @ np.asarray(query_vec, dtype="float32").reshape(-1)
+                for i in np.argsort(-sims):
+                    if sims[i] < self.threshold:
+                        break
+                    entry = self._entries.get(keys[i])
+                    if entry is None or self._expired(entry, now):
+                        continue
+                    self._entries.move_to_end(keys[i])
+                    self.counters[f"{kind}_semantic_hits"] += 1
+                    return entry.value
+            self.counters[f"{kind}_misses"] += 1
+        return None
+
+    def _matrix(self, group: tuple):
+        if group not in self._matrices:
+            keys = [k for k, e in self._entries.items()
+                    if e.vec is not None and (e.kind, e.params) == group]
+            vecs = [self._entries[k].vec for k in keys]
+            self._matrices[group] = (keys, np.stack(vecs) if vecs else np.empty((0, 0), dtype="float32"))
+        return self._matrices[group]
+
+    # ---------- writes ----------
+    def put(self, kind: str, query: str, params: Sequence, query_vec: Optional[np.ndarray], value,
+            version: Optional[int] = None):
+        """
+        Cache `value` (JSON-serializable). `version` is the index_service.version
+        read before the value was computed; if the index has moved since, the
+        value may be stale and is not stored.
+        """
+        if not self.enabled:
+            return
+        self._sync_index()
+        if version is not None and version != self._version:
+            self.counters["stale_puts"] += 1
+            return
+        key = self._key(kind, params, query)
+        vec = None if query_vec is None else np.asarray(query_vec, dtype="float32").reshape(-1)
+        # JSON round trip: memory and disk hits hand back the same shapes
+        value = json.loads(json.dumps(value, ensure_ascii=False))
+        entry = _Entry(kind, json.dumps(list(params)), value, vec, time.time())
+        with self._lock:
+            self._insert(key, entry)
+        if self._db is not None:
+            self._execute(
+                "INSERT OR REPLACE INTO entries (key, kind, params, value, vec, fingerprint, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, entry.params, json.dumps(value, ensure_ascii=False),
+                 None if vec is None else vec.tobytes(), self._fingerprint, entry.created_at))
+            self._trim_disk()
+
+    def _insert(self, key: str, entry: _Entry):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = entry
+        self._matrices.pop((entry.kind, entry.params), None)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        self._matrices.pop((entry.kind, entry.params), None)
+
+    # ---------- disk tier ----------
+    @staticmethod
+    def _entry_from_row(kind: str, row) -> _Entry:
+        params, value, vec, created_at = row
+        vec = np.frombuffer(vec, dtype="float32") if vec else None
+        return _Entry(kind, params, json.loads(value), vec, created_at)
+
+    def _warm_from_disk(self):
+        """Load the most recent unexpired disk entries into the memory tiers."""
+        cutoff = time.time() - self.ttl if self.ttl > 0 else 0
+        rows = self._execute(
+            "SELECT key, kind, params, value, vec, created_at FROM entries WHERE fingerprint = ? "
+            "AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+            (self._fingerprint, cutoff, self.max_entries)).fetchall()
+        with self._lock:
+            for key, kind, *rest in reversed(rows):
+                self._insert(key, self._entry_from_row(kind, rest))
+
+    def _trim_disk(self):
+        if self.ttl > 0:
+            self._execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl,))
+        self._execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY created_at DESC "
+            "LIMIT -1 OFFSET ?)", (self.disk_max_entries,))
+
+    # ---------- admin ----------
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            if self._db is not None:
+                self._execute("DELETE FROM entries")
+
+    def stats(self) -> Dict:
+        stats = {"enabled": self.enabled, "entries": len(self._entries), "max_entries": self.max_entries,
+                 "ttl_seconds": self.ttl, "semantic_threshold": self.threshold,
+                 "disk": self._db is not None, **self.counters}
+        for kind in KINDS:
+            hits = sum(self.counters[f"{kind}_{t}_hits"] for t in ("exact", "semantic", "disk"))
+            total = hits + self.counters[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = round(hits / total, 3) if total else 0.0
+        if self._db is not None:
+            stats["disk_entries"] = self._execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return stats
+
+
+# ----------------- Shared instance -----------------
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_query_cache() -> QueryCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QueryCache(disk_path=CACHE_DB if CACHE_DISK else None, enabled=QUERY_CACHE)
+    return _cache
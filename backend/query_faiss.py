@@ -1,42 +1,24 @@
 # backend/query_faiss.py
-import json
-from pathlib import Path
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
 
-# ----------------- Config -----------------
-BASE_DIR = Path(__file__).resolve().parent.parent
-VECTOR_DIR = BASE_DIR / "data" / "vectors"
-FAISS_FILE = VECTOR_DIR / "faiss_index.bin"
-META_FILE = VECTOR_DIR / "metadatas.json"
+from index_service import get_index_service
+from model_registry import get_embedder
 
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"  # English only
+# ----------------- Config -----------------
 TOP_K = 5  # Number of results to return
 
-# ----------------- Load FAISS & metadata -----------------
-index = faiss.read_index(str(FAISS_FILE))
-with open(META_FILE, "r", encoding="utf-8") as f:
-    metadatas = json.load(f)
-
-# ----------------- Load embedding model -----------------
-model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
 # ----------------- Query function -----------------
 def search(query: str, top_k: int = TOP_K):
-    query_emb = model.encode(query)
+    query_emb = get_embedder().encode(query, normalize_embeddings=True)
     query_emb = np.array([query_emb], dtype="float32")
     
-    # Search FAISS
-    distances, indices = index.search(query_emb, top_k)
+    # Search FAISS (snapshot + any vectors appended since by /upload)
+    hits = get_index_service().search(query_emb, top_k)[0]
     
     results = []
-    for dist, idx in zip(distances[0], indices[0]):
-        if idx == -1:
-            continue
-        meta = metadatas[idx]
+    for meta in hits:
         results.append({
-            "score": float(dist),
+            "score": meta["score"],
             "text": meta.get("text", ""),
             "file_name": meta.get("file_name"),
             "source_type": meta.get("source_type"),
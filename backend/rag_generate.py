@@ -1,55 +1,143 @@
 # backend/rag_generate.py
-import json
-from pathlib import Path
-import faiss
-import torch
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import os
+import threading
+import time
 
-# ---------------- CONFIG -----------------
-BASE_DIR = Path(__file__).resolve().parent.parent
-VECTOR_DIR = BASE_DIR / "data/vectors"  # vector storage folder
-FAISS_FILE = VECTOR_DIR / "faiss_index.bin"
-META_FILE = VECTOR_DIR / "metadatas.json"
-# Models
-EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
-LLM_MODEL = "google/flan-t5-small"  # <= 1.5GB RAM
+import metrics
+from index_service import get_index_service
+from meta_store import normalize_filters
+from model_registry import get_embedder, get_llm, get_device
+from query_cache import get_query_cache
+import reranker
+from reranker import RERANK, RERANK_CANDIDATES, was_reranked
 
+# ---------------- CONFIG -----------------
 TOP_K = 5
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+MAX_NEW_TOKENS = 400
+# flan-t5 was trained on 512 input tokens; longer prompts mostly buy encoder
+# time, not answer quality
+LLM_MAX_INPUT_TOKENS = int(os.getenv("LLM_MAX_INPUT_TOKENS", "512"))
+MIN_PACKED_CHUNK_TOKENS = 32  # don't cite a chunk cut shorter than this
+PACK_MARGIN_TOKENS = 4        # tokenizing the parts separately can differ slightly from the whole
+
+# ---------------- DECODING -----------------
+DECODING_MODES = {
+    "greedy": dict(do_sample=False, num_beams=1),
+    "beam": dict(do_sample=False, num_beams=4, early_stopping=True, no_repeat_ngram_size=3),
+    "sampling": dict(do_sample=True, temperature=0.7, top_p=0.9),
+}
+DECODING_MODE = os.getenv("DECODING_MODE", "greedy")  # greedy/beam are deterministic, so answers cache well
+
+def decoding_config(mode=None):
+    mode = mode or DECODING_MODE
+    if mode not in DECODING_MODES:
+        raise ValueError(f"Unknown decoding mode '{mode}'. Choose from {tuple(DECODING_MODES)}")
+    return DECODING_MODES[mode]
+
+# FAISS index + metadata live in index_service, shared with /upload so new
+# documents are searchable without a restart.
+
+# Models (embedder, flan-t5-small) come from model_registry and are shared
+# with main.py and the ingest pipeline.
+
+# Repeated and near-duplicate questions are answered from query_cache; its
+# entries are dropped whenever the index changes.
+
+# ---------------- RETRIEVAL MODES -----------------
+# dense: FAISS only; sparse: BM25 only (exact identifiers, part numbers,
+# acronyms); hybrid: both, fused by weighted reciprocal rank.
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+HYBRID_WEIGHTS = (float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0")), float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0")))
+RRF_K = 60               # rank damping from the original RRF paper
+HYBRID_CANDIDATES = 4    # each retriever contributes top_k * this to the fusion
 
-# ---------------- LOAD FAISS & METADATA -----------------
-if not FAISS_FILE.exists() or not META_FILE.exists():
-    raise FileNotFoundError("FAISS index or metadata not found. Run Phase 4 first.")
+def retrieval_config(mode=None, weights=None):
+    """(mode, weights) with defaults applied; weights is None unless mode is hybrid."""
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}'. Choose from {RETRIEVAL_MODES}")
+    if mode != "hybrid":
+        return mode, None
+    return mode, tuple(float(w) for w in weights) if weights else HYBRID_WEIGHTS
 
-index = faiss.read_index(str(FAISS_FILE))
+def candidate_k(top_k, mode, rerank=False):
+    """Dense hits to fetch: over-fetched for hybrid fusion and for the reranker."""
+    k = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+    return k * HYBRID_CANDIDATES if mode == "hybrid" else k
 
-with open(META_FILE, "r", encoding="utf-8") as f:
-    metadata = json.load(f)
+def rrf_fuse(result_lists, weights, top_k, k=RRF_K):
+    # ---------------- Reciprocal-rank fusion -----------------
+    scores, hits = {}, {}
+    for results, weight in zip(result_lists, weights):
+        for rank, hit in enumerate(results, 1):
+            scores[hit["row"]] = scores.get(hit["row"], 0.0) + weight / (k + rank)
+            hits.setdefault(hit["row"], hit)
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [{**hits[row], "score": scores[row]} for row in best]
 
-# ---------------- LOAD EMBEDDING MODEL -----------------
-embed_model = SentenceTransformer(EMBEDDING_MODEL, device=DEVICE)
+def combine_hits(query, dense_hits, top_k, mode, weights=None, filters=None):
+    """Final hits for `mode`, given the dense hits (over-fetched for hybrid; unused for sparse)."""
+    if mode == "dense":
+        return dense_hits[:top_k]
+    with metrics.stage("bm25"):
+        sparse_hits = get_index_service().search_sparse(query, candidate_k(top_k, mode), filters=filters)
+    if mode == "sparse":
+        return sparse_hits
+    return rrf_fuse([dense_hits, sparse_hits], weights, top_k)
 
-# ---------------- LOAD LLM -----------------
-tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL)
-model = AutoModelForSeq2SeqLM.from_pretrained(LLM_MODEL).to(DEVICE)
-model.eval()
+def finalize_hits(query, dense_hits, top_k, mode, weights=None, rerank=False, rerank_budget_ms=None,
+                  filters=None):
+    """combine_hits, then (optionally) cross-encoder rerank of the over-fetched candidates."""
+    if not rerank:
+        return combine_hits(query, dense_hits, top_k, mode, weights, filters)
+    candidates = combine_hits(query, dense_hits, max(top_k, RERANK_CANDIDATES), mode, weights, filters)
+    with metrics.stage("rerank"):
+        return reranker.rerank(query, dedupe_chunks(candidates), top_k, rerank_budget_ms)
 
 # ---------------- SEMANTIC SEARCH -----------------
-def semantic_search(query, top_k=TOP_K):
-    query_vec = embed_model.encode(query, convert_to_numpy=True, normalize_embeddings=True)
-    query_vec = query_vec.reshape(1, -1).astype("float32")
-    distances, indices = index.search(query_vec, top_k)
-    results = []
-    for idx in indices[0]:
-        if idx != -1:
-            results.append(metadata[idx])
-    return results
-
-def generate_answer(query, top_k=TOP_K, max_new_tokens=400):
-    # ---------------- Retrieve top-k chunks -----------------
-    chunks = semantic_search(query, top_k)
+def embed_query(query):
+    with metrics.stage("embed_query"):
+        query_vec = get_embedder().encode(query, convert_to_numpy=True, normalize_embeddings=True)
+    return query_vec.reshape(-1).astype("float32")
+
+def semantic_search(query, top_k=TOP_K, nprobe=None, ef_search=None, query_vec=None,
+                    retrieval=None, weights=None, rerank=None, rerank_budget_ms=None, filters=None):
+    """
+    Top-k hits for `query`. `filters` ({"file_name": [...], "source_type": [...],
+    "page": [lo, hi], "time": [t0, t1]}) restricts retrieval to matching
+    chunks before ranking, see meta_store.normalize_filters.
+    """
+    mode, weights = retrieval_config(retrieval, weights)
+    rerank = RERANK if rerank is None else rerank
+    filters = normalize_filters(filters)
+    cache = get_query_cache()
+    params = (top_k, nprobe, ef_search, mode, weights, rerank, filters)
+    service = get_index_service()
+    version = service.version
+    hits = cache.get_exact("retrieval", query, params)
+    if hits is not None:
+        return hits
+    if mode != "sparse" and query_vec is None:
+        query_vec = embed_query(query)
+    # Near-duplicate reuse only for dense: "part AB-1234" and "part AB-1235"
+    # embed almost identically but must not share keyword results
+    hits = cache.get_semantic("retrieval", query_vec if mode == "dense" else None, params)
+    if hits is not None:
+        return hits
+    dense_hits = []
+    if mode != "sparse":
+        with metrics.stage("search"):
+            dense_hits = service.search(query_vec.reshape(1, -1), candidate_k(top_k, mode, rerank),
+                                        nprobe=nprobe, ef_search=ef_search, filters=filters)[0]
+    hits = finalize_hits(query, dense_hits, top_k, mode, weights, rerank, rerank_budget_ms, filters)
+    if not rerank or was_reranked(hits):  # an over-budget fallback is not worth keeping
+        cache.put("retrieval", query, params, query_vec, hits, version)
+    return hits
 
+NO_ANSWER = "No relevant information found in documents."
+
+def dedupe_chunks(chunks):
     # ---------------- Deduplicate chunk texts -----------------
     unique_chunks = []
     seen_texts = set()
@@ -58,10 +146,16 @@ def generate_answer(query, top_k=TOP_K, max_new_tokens=400):
         if text and text not in seen_texts:
             seen_texts.add(text)
             unique_chunks.append(c)
+    return unique_chunks
 
-    if not unique_chunks:
-        return "No relevant information found in documents.", []
+def retrieve_chunks(query, top_k=TOP_K, nprobe=None, ef_search=None, query_vec=None, retrieval=None, weights=None,
+                    rerank=None, rerank_budget_ms=None, filters=None):
+    # ---------------- Retrieve top-k chunks -----------------
+    return dedupe_chunks(semantic_search(query, top_k, nprobe=nprobe, ef_search=ef_search, query_vec=query_vec,
+                                         retrieval=retrieval, weights=weights,
+                                         rerank=rerank, rerank_budget_ms=rerank_budget_ms, filters=filters))
 
+def build_prompt(query, unique_chunks):
     # ---------------- Build readable context with citations -----------------
     context_lines = []
     for i, c in enumerate(unique_chunks, 1):
@@ -69,7 +163,7 @@ def generate_answer(query, top_k=TOP_K, max_new_tokens=400):
     context_text = "\n\n".join(context_lines)
 
     # ---------------- Explicit prompt for detailed, beginner-friendly answers -----------------
-    prompt = f"""
+    return f"""
 You are an expert assistant. Answer the question using ONLY the context below.
 Explain it clearly in a way that a beginner can understand.
 Use multiple sentences if needed.
@@ -84,27 +178,183 @@ Question:
 Answer:
 """
 
-    # ---------------- Tokenize and generate -----------------
+def pack_context(query, chunks, max_input_tokens=LLM_MAX_INPUT_TOKENS, tokenizer=None):
+    """
+    Fit the highest-ranked chunks into the encoder budget.
+
+    The instructions and the question are counted first, so they are never
+    truncated; chunks are then added in rank order until one does not fit.
+    That chunk is cut at a token boundary if enough room is left, and the
+    rest are dropped. Returns (prompt, used_chunks, prompt_tokens); citation
+    numbers in the prompt follow used_chunks.
+    """
+    with metrics.stage("pack_context"):
+        return _pack_context(query, chunks, max_input_tokens, tokenizer or get_llm()[0])
+
+def _pack_context(query, chunks, max_input_tokens, tokenizer):
+    count = lambda text: len(tokenizer(text)["input_ids"])
+    budget = max_input_tokens - count(build_prompt(query, [])) - PACK_MARGIN_TOKENS
+    if not chunks or budget <= 0:
+        prompt = build_prompt(query, [])
+        return prompt, [], count(prompt)
+
+    lines = [f"[{i}] {c['text']} (source: {c['file_name']})" for i, c in enumerate(chunks, 1)]
+    line_tokens = tokenizer(lines, add_special_tokens=False)["input_ids"]
+    packed, used = [], []
+    for c, ids in zip(chunks, line_tokens):
+        cost = len(ids) + 1  # "\n\n" separator
+        if cost <= budget:
+            packed.append(c)
+            used.append(c)
+            budget -= cost
+            continue
+        text_ids = tokenizer(c["text"], add_special_tokens=False)["input_ids"]
+        room = budget - (cost - len(text_ids)) - 2  # citation/source overhead + "..."
+        if room >= MIN_PACKED_CHUNK_TOKENS:
+            cut = tokenizer.decode(text_ids[:room], skip_special_tokens=True).rstrip()
+            packed.append({**c, "text": cut + " ..."})
+            used.append(c)
+        break
+    prompt = build_prompt(query, packed)
+    return prompt, used, count(prompt)
+
+def _generate_inputs(prompt, max_new_tokens, decoding=None):
+    # ---------------- Tokenize -----------------
+    # `prompt` may be a list: prompts are padded to a batch for one generate()
+    tokenizer, model = get_llm()
     inputs = tokenizer(
         prompt, 
         return_tensors="pt", 
+        padding=True,
         truncation=True, 
-        max_length=2048
-    ).to(DEVICE)
-
-    with torch.no_grad():
-        output_ids = model.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            do_sample=True,
-            temperature=0.7,
-            top_p=0.9,
-            pad_token_id=tokenizer.eos_token_id
-        )
-
-    # ---------------- Decode and return -----------------
-    answer = tokenizer.decode(output_ids[0], skip_special_tokens=True)
-    return answer, unique_chunks
+        max_length=LLM_MAX_INPUT_TOKENS
+    ).to(get_device())
+    gen_kwargs = dict(
+        **inputs,
+        max_new_tokens=max_new_tokens,
+        pad_token_id=tokenizer.eos_token_id,
+        **decoding_config(decoding)
+    )
+    return tokenizer, model, gen_kwargs
+
+def generate_texts(prompts, max_new_tokens=MAX_NEW_TOKENS, decoding=None):
+    import torch  # imported on first use so the server starts without it
+    # ---------------- Generate (one padded batch) -----------------
+    with metrics.stage("tokenize"):
+        tokenizer, model, gen_kwargs = _generate_inputs(list(prompts), max_new_tokens, decoding)
+    with metrics.stage("generate"), torch.no_grad():
+        output_ids = model.generate(**gen_kwargs)
+    if metrics.METRICS:
+        metrics.observe("llm_batch_size", len(prompts), metrics.SIZE_BUCKETS)
+        for n in gen_kwargs["attention_mask"].sum(dim=1).tolist():
+            metrics.observe("prompt_tokens", n, metrics.SIZE_BUCKETS)
+        for n in (output_ids != tokenizer.pad_token_id).sum(dim=1).tolist():  # T5 starts with pad
+            metrics.observe("generated_tokens", n, metrics.SIZE_BUCKETS)
+
+    # ---------------- Decode -----------------
+    return tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+
+def generate_answer(query, top_k=TOP_K, max_new_tokens=MAX_NEW_TOKENS, nprobe=None, ef_search=None,
+                    decoding=None, retrieval=None, weights=None, rerank=None, rerank_budget_ms=None, filters=None):
+    decoding = decoding or DECODING_MODE
+    decoding_config(decoding)  # reject unknown modes before any work
+    mode, weights = retrieval_config(retrieval, weights)
+    rerank = RERANK if rerank is None else rerank
+    filters = normalize_filters(filters)
+
+    # ---------------- Cached answer? -----------------
+    cache = get_query_cache()
+    params = (top_k, nprobe, ef_search, max_new_tokens, decoding, mode, weights, rerank, filters)
+    version = get_index_service().version
+    cached = cache.get_exact("answer", query, params)
+    query_vec = None
+    if cached is None:
+        if mode != "sparse":
+            query_vec = embed_query(query)
+        cached = cache.get_semantic("answer", query_vec if mode == "dense" else None, params)
+    if cached is not None:
+        return cached[0], cached[1]
+
+    unique_chunks = retrieve_chunks(query, top_k, nprobe=nprobe, ef_search=ef_search, query_vec=query_vec,
+                                    retrieval=mode, weights=weights, rerank=rerank, rerank_budget_ms=rerank_budget_ms,
+                                    filters=filters)
+    answer, sources = NO_ANSWER, []
+    if unique_chunks:
+        prompt, sources, _ = pack_context(query, unique_chunks)
+        answer = generate_texts([prompt], max_new_tokens, decoding)[0]
+    if not rerank or was_reranked(sources):
+        cache.put("answer", query, params, query_vec, [answer, sources], version)
+    return answer, sources
+
+def stream_answer(query, top_k=TOP_K, max_new_tokens=MAX_NEW_TOKENS, nprobe=None, ef_search=None,
+                  decoding=None, retrieval=None, weights=None, rerank=None, rerank_budget_ms=None, filters=None,
+                  stop=None):
+    """
+    Yield ("sources", chunks), then ("token", text) pieces as the decoder
+    produces them, then ("done", stats) with time-to-first-token and
+    tokens/sec. Same retrieval, packing and decoding as generate_answer,
+    except that beam search cannot stream. Setting the threading.Event
+    `stop` (e.g. when the client goes away) ends decoding at the next token.
+    """
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    if decoding_config(decoding).get("num_beams", 1) > 1:
+        raise ValueError("beam search cannot be streamed; use greedy or sampling")
+    start = time.perf_counter()
+    unique_chunks = retrieve_chunks(query, top_k, nprobe=nprobe, ef_search=ef_search,
+                                    retrieval=retrieval, weights=weights,
+                                    rerank=rerank, rerank_budget_ms=rerank_budget_ms, filters=filters)
+    prompt, unique_chunks, _ = pack_context(query, unique_chunks) if unique_chunks else (None, [], 0)
+    yield "sources", unique_chunks
+    if not unique_chunks:
+        yield "token", NO_ANSWER
+        yield "done", {"tokens": 0, "ttft_ms": None, "tokens_per_sec": None,
+                       "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+        return
+
+    tokenizer, model, gen_kwargs = _generate_inputs(prompt, max_new_tokens, decoding)
+    streamer = TextIteratorStreamer(tokenizer, skip_special_tokens=True)
+    result = {}
+    if stop is not None:
+        class _StopRequested(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return stop.is_set()
+        gen_kwargs["stopping_criteria"] = StoppingCriteriaList([_StopRequested()])
+
+    def run():
+        import torch
+        try:
+            with torch.no_grad():
+                result["output_ids"] = model.generate(**gen_kwargs, streamer=streamer)
+        except Exception as e:
+            result["error"] = e
+            streamer.end()
+
+    gen_start = time.perf_counter()
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    first_token_at = None
+    for text in streamer:
+        if not text:
+            continue
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        yield "token", text
+    worker.join()
+    if "error" in result:
+        raise result["error"]
+
+    end = time.perf_counter()
+    # Decoder output starts with the decoder_start_token, which is not generated
+    n_tokens = max(int(result["output_ids"].shape[-1]) - 1, 0)
+    decode_s = end - (first_token_at or end)
+    yield "done", {
+        "tokens": n_tokens,
+        "ttft_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+        "tokens_per_sec": round(n_tokens / (end - gen_start), 1) if end > gen_start else None,
+        "decode_ms": round(decode_s * 1000, 1),
+        "total_ms": round((end - start) * 1000, 1),
+    }
 
 
 # ---------------- INTERACTIVE CLI -----------------
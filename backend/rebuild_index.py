@@ -0,0 +1,44 @@
+# backend/rebuild_index.py
+# Rebuild the vector index from data/vectors on another FAISS backend.
+#   python rebuild_index.py                         # pick backend by corpus size
+#   python rebuild_index.py --backend hnsw
+#   python rebuild_index.py --backend ivf_pq --nlist 1024 --pq-m 48
+import argparse
+import time
+
+from index_backends import (BACKENDS, INDEX_MEMORY_BUDGET_MB, INDEX_STORAGE, STORAGES, build_index,
+                            choose_backend, estimate_memory_bytes)
+from index_service import IndexService
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train/rebuild the FAISS index from the existing vector store")
+    parser.add_argument("--backend", choices=("auto",) + BACKENDS, default="auto")
+    parser.add_argument("--memory-budget-mb", type=float, default=INDEX_MEMORY_BUDGET_MB,
+                        help="used by --backend auto (0 = unlimited)")
+    parser.add_argument("--storage", choices=STORAGES, default=INDEX_STORAGE,
+                        help="vector encoding for flat / ivf_flat / hnsw")
+    parser.add_argument("--nlist", type=int, help="IVF coarse centroids (default: 4*sqrt(n))")
+    parser.add_argument("--pq-m", type=int, help="IVF-PQ sub-quantizers")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW neighbours per node")
+    args = parser.parse_args()
+
+    service = IndexService()
+    vectors, metadata = service.export()
+    n, dim = vectors.shape
+
+    if args.backend == "auto":
+        kind, params = choose_backend(n, dim, args.memory_budget_mb, args.storage)
+    else:
+        kind, params = args.backend, ({} if args.backend == "ivf_pq" else {"storage": args.storage})
+    for key in ("nlist", "pq_m", "hnsw_m"):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    print(f"Building {kind} index over {n} vectors {params or ''} "
+          f"(~{estimate_memory_bytes(kind, n, dim, params) / 1e6:.1f} MB)")
+    start = time.perf_counter()
+    index = build_index(kind, vectors, **params)
+    print(f"Built in {time.perf_counter() - start:.2f}s")
+
+    service.replace(index, metadata)
+    print(f"Saved to {service.faiss_file}")
@@ -0,0 +1,93 @@
+# backend/reranker.py
+# Optional cross-encoder rerank of retrieval candidates.
+#
+# semantic_search over-fetches RERANK_CANDIDATES hits, scores each
+# (query, chunk) pair with a small local cross-encoder in batches and keeps
+# the best top_k. The stage has a latency budget: if scoring the next batch
+# would overrun it, the un-reranked order is returned instead, so a slow
+# CPU or a cold model never holds a query hostage. Pair scores are cached,
+# so repeated questions only pay for chunks they have not seen.
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from model_registry import get_reranker
+from query_cache import normalize_query
+
+# ----------------- Config -----------------
+RERANK = os.getenv("RERANK", "0") == "1"  # default for requests that don't choose
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "250"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))  # cached (query, chunk) scores
+
+_scores: "OrderedDict[tuple, float]" = OrderedDict()  # (query key, chunk key) -> score
+_scores_lock = threading.Lock()
+counters = {"reranked": 0, "degraded": 0, "pairs_scored": 0, "pairs_cached": 0}
+
+
+def _chunk_key(chunk: Dict) -> str:
+    if chunk.get("id"):
+        return chunk["id"]
+    return hashlib.sha1(chunk.get("text", "").encode("utf-8")).hexdigest()
+
+
+def was_reranked(hits: List[Dict]) -> bool:
+    """False for a list that fell back to retrieval order (don't cache it as reranked)."""
+    return all("rerank_score" in h for h in hits)
+
+
+def rerank(query: str, candidates: List[Dict], top_k: int,
+           budget_ms: Optional[float] = None, batch_size: int = RERANK_BATCH_SIZE) -> List[Dict]:
+    """
+    Top-k of `candidates` by cross-encoder score, each hit gaining
+    "rerank_score". Falls back to candidates[:top_k] unchanged when the
+    budget (RERANK_BUDGET_MS; <= 0 for none) would be exceeded.
+    """
+    if not candidates:
+        return []
+    budget = (RERANK_BUDGET_MS if budget_ms is None else budget_ms) / 1000.0
+    start = time.perf_counter()
+    qkey = normalize_query(query)
+    keys = [(qkey, _chunk_key(c)) for c in candidates]
+
+    scores: Dict[int, float] = {}
+    with _scores_lock:
+        for i, key in enumerate(keys):
+            if key in _scores:
+                _scores.move_to_end(key)
+                scores[i] = _scores[key]
+    counters["pairs_cached"] += len(scores)
+
+    todo = [i for i in range(len(candidates)) if i not in scores]
+    model = get_reranker() if todo else None
+    batch_seconds = 0.0
+    for at in range(0, len(todo), batch_size):
+        elapsed = time.perf_counter() - start
+        if budget > 0 and elapsed + batch_seconds > budget:
+            counters["degraded"] += 1
+            return candidates[:top_k]
+        rows = todo[at: at + batch_size]
+        batch_start = time.perf_counter()
+        batch_scores = model.predict([(query, candidates[i].get("text", "")) for i in rows],
+                                     batch_size=len(rows), show_progress_bar=False)
+        batch_seconds = time.perf_counter() - batch_start  # predicts the next batch's cost
+        with _scores_lock:
+            for i, score in zip(rows, batch_scores):
+                scores[i] = float(score)
+                _scores[keys[i]] = float(score)
+            while len(_scores) > RERANK_CACHE_SIZE:
+                _scores.popitem(last=False)
+        counters["pairs_scored"] += len(rows)
+
+    counters["reranked"] += 1
+    best = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:top_k]
+    return [{**candidates[i], "rerank_score": scores[i]} for i in best]
+
+
+def stats() -> Dict:
+    return {**counters, "cached_pairs": len(_scores), "candidates": RERANK_CANDIDATES,
+            "budget_ms": RERANK_BUDGET_MS, "default": RERANK}
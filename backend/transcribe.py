@@ -0,0 +1,119 @@
+# backend/transcribe.py
+# Long-audio transcription for ingest.
+#
+# The recording is decoded once, split on silence by a frame-energy voice
+# activity detector into windows of about AUDIO_WINDOW_SECONDS, and the
+# windows are transcribed in order. With AUDIO_WORKERS > 1 they fan out over
+# worker processes, each loading the Whisper model once (model_registry)
+# and keeping it for every window it gets. Segment times are shifted by the
+# window's offset, so start/end stay absolute, and each window's segments
+# are handed out as soon as it and all earlier windows are done. Silent
+# windows are skipped, so Whisper never runs on (and never hallucinates over)
+# dead air.
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+import metrics
+from model_registry import WHISPER_MODEL_SIZE, get_whisper
+
+# ----------------- Config -----------------
+SAMPLE_RATE = 16000  # what whisper.load_audio resamples to
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", "1"))  # 1 = transcribe windows in this process
+AUDIO_WINDOW_SECONDS = float(os.getenv("AUDIO_WINDOW_SECONDS", "120"))
+VAD_FRAME_MS = 30
+VAD_MIN_SILENCE_SECONDS = 0.5  # shorter pauses are not cut points
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "12"))  # speech: this far above the noise floor
+
+
+def load_audio(path: str) -> np.ndarray:
+    import whisper
+    return whisper.load_audio(path)  # float32 mono at SAMPLE_RATE, decoded by ffmpeg
+
+
+# ----------------- Voice activity -----------------
+def speech_frames(audio: np.ndarray, frame_ms: int = VAD_FRAME_MS,
+                  threshold_db: float = VAD_THRESHOLD_DB) -> np.ndarray:
+    """Boolean per frame: louder than the recording's noise floor by threshold_db."""
+    frame = SAMPLE_RATE * frame_ms // 1000
+    n = len(audio) // frame
+    if not n:
+        return np.ones(1 if len(audio) else 0, dtype=bool)
+    energy = np.square(audio[:n * frame].reshape(n, frame), dtype="float64").mean(axis=1)
+    db = 10.0 * np.log10(energy + 1e-10)
+    return db > np.percentile(db, 10) + threshold_db
+
+
+def plan_windows(audio: np.ndarray, window_seconds: float = AUDIO_WINDOW_SECONDS,
+                 min_silence: float = VAD_MIN_SILENCE_SECONDS) -> List[Tuple[int, int]]:
+    """
+    (start, end) sample ranges covering the speech in `audio`. Windows end in
+    the middle of a pause once they are window_seconds long; a stretch with
+    no pause is cut hard at twice that. Windows without speech are dropped.
+    If the VAD finds no speech at all (quiet or noisy recordings can fool the
+    energy threshold), the whole file is one window and Whisper decides.
+    """
+    frame = SAMPLE_RATE * VAD_FRAME_MS // 1000
+    speech = speech_frames(audio)
+    if not speech.any():
+        return [(0, len(audio))] if len(audio) else []
+    # midpoints of silent runs of at least min_silence
+    padded = np.concatenate([[True], speech, [True]]).astype("int8")
+    edges = np.flatnonzero(np.diff(padded))
+    starts, ends = edges[0::2], edges[1::2]  # silent runs [start, end) in frames
+    long_runs = (ends - starts) * frame >= min_silence * SAMPLE_RATE
+    cuts = [int((s + e) // 2 * frame) for s, e in zip(starts[long_runs], ends[long_runs])]
+
+    target, hard = int(window_seconds * SAMPLE_RATE), int(2 * window_seconds * SAMPLE_RATE)
+    windows, start = [], 0
+    for cut in cuts + [len(audio)]:
+        while cut - start > hard:
+            windows.append((start, start + target))
+            start += target
+        if cut - start >= target or cut == len(audio):
+            windows.append((start, cut))
+            start = cut
+    return [(s, e) for s, e in windows if e > s and speech[s // frame:(e + frame - 1) // frame].any()]
+
+
+# ----------------- Transcription -----------------
+def transcribe_window(audio: np.ndarray, offset: float, model_size: str = WHISPER_MODEL_SIZE) -> List[Dict]:
+    # Top-level so it can run in a worker process; the model loads once per process
+    model = get_whisper(model_size)
+    with metrics.stage("transcribe"):
+        res = model.transcribe(audio, language="en")
+    return [{"start": offset + float(seg.get("start", 0.0)), "end": offset + float(seg.get("end", 0.0)),
+             "text": seg.get("text", "")} for seg in res.get("segments", [])]
+
+
+def iter_transcribed_windows(path: str, model_size: str = WHISPER_MODEL_SIZE,
+                             workers: int = AUDIO_WORKERS,
+                             window_seconds: float = AUDIO_WINDOW_SECONDS) -> Iterator[List[Dict]]:
+    """Each speech window's segments (absolute times), in order, as soon as they are ready."""
+    audio = load_audio(path)
+    windows = plan_windows(audio, window_seconds)
+    if workers <= 1 or len(windows) <= 1:
+        for s, e in windows:
+            yield transcribe_window(audio[s:e], s / SAMPLE_RATE, model_size)
+        return
+
+    # At most 2 windows per worker in flight, so a long recording doesn't
+    # queue every slice up front
+    todo = iter(windows)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        for s, e in todo:
+            pending.append(pool.submit(transcribe_window, audio[s:e], s / SAMPLE_RATE, model_size))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            segments = pending.popleft().result()
+            nxt = next(todo, None)
+            if nxt is not None:
+                s, e = nxt
+                pending.append(pool.submit(transcribe_window, audio[s:e], s / SAMPLE_RATE, model_size))
+            yield segments
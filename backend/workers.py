@@ -0,0 +1,112 @@
+# backend/workers.py
+# Bounded worker pools that keep model inference and file extraction off the
+# FastAPI event loop.
+#
+# Each model (and "extract" for PDF/DOCX/text parsing) has its own limiter:
+# at most MODEL_CONCURRENCY[name] calls run at once and at most
+# MODEL_QUEUE_LIMIT more may wait. Anything beyond that raises PoolSaturated,
+# which main.py turns into HTTP 429, so a burst of uploads cannot pile up
+# unbounded work in front of /query. Everything runs on one thread pool:
+# torch releases the GIL, and large PDFs already fan their pages out over
+# processes inside ingest.iter_pdf_pages.
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict
+
+import metrics
+
+# ----------------- Config -----------------
+CPU_COUNT = os.cpu_count() or 2
+MODEL_CONCURRENCY = {
+    "llm": int(os.getenv("LLM_CONCURRENCY", "2")),
+    "embedder": int(os.getenv("EMBED_CONCURRENCY", "2")),
+    "ocr": int(os.getenv("OCR_CONCURRENCY", "1")),
+    "whisper": int(os.getenv("WHISPER_CONCURRENCY", "1")),
+    "extract": int(os.getenv("EXTRACT_CONCURRENCY", str(max(1, CPU_COUNT // 2)))),
+}
+MODEL_QUEUE_LIMIT = int(os.getenv("MODEL_QUEUE_LIMIT", "16"))  # waiting calls per limiter before 429
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class PoolSaturated(Exception):
+    def __init__(self, name: str):
+        super().__init__(f"'{name}' workers are saturated; retry later")
+        self.name = name
+
+
+class _Limiter:
+    """Concurrency cap plus bounded wait queue for one model."""
+
+    def __init__(self, name: str, concurrency: int, queue_limit: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.running = 0
+        self.waiting = 0
+        self._sem = None  # created lazily inside the running event loop
+
+    def saturated(self) -> bool:
+        """True if acquire() would raise PoolSaturated right now."""
+        return self._sem is not None and self._sem.locked() and self.waiting >= self.queue_limit
+
+    async def acquire(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        if self.saturated():
+            raise PoolSaturated(self.name)
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self._sem.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class WorkerPools:
+    def __init__(self, concurrency: Dict[str, int] = MODEL_CONCURRENCY, queue_limit: int = MODEL_QUEUE_LIMIT):
+        self.limiters = {name: _Limiter(name, n, queue_limit) for name, n in concurrency.items()}
+        self.threads = ThreadPoolExecutor(max_workers=sum(concurrency.values()), thread_name_prefix="model")
+
+    async def run_model(self, name: str, fn: Callable, *args, **kwargs):
+        """Run fn in the thread pool under the `name` limiter."""
+        loop = asyncio.get_running_loop()
+        queued = time.perf_counter()
+        async with self.limiters[name]:
+            metrics.observe("queue_wait_seconds", time.perf_counter() - queued, pool=name)
+            ctx = contextvars.copy_context()  # carries the request's timing trace into the thread
+            return await loop.run_in_executor(self.threads, lambda: ctx.run(fn, *args, **kwargs))
+
+    def stats(self) -> Dict:
+        return {name: {"running": l.running, "waiting": l.waiting, "concurrency": l.concurrency}
+                for name, l in self.limiters.items()}
+
+    def shutdown(self):
+        self.threads.shutdown(wait=False, cancel_futures=True)
+
+
+async def save_upload(file, dest: Path, chunk_bytes: int = UPLOAD_CHUNK_BYTES) -> int:
+    """Stream an UploadFile to disk chunk by chunk instead of reading it whole."""
+    written = 0
+    with open(dest, "wb") as out:
+        while True:
+            data = await file.read(chunk_bytes)
+            if not data:
+                break
+            await asyncio.to_thread(out.write, data)
+            written += len(data)
+    return written
@@ -21,12 +21,23 @@ const Dashboard = () => {
   const [loading, setLoading] = useState(false);
 
   // ---------------- Knowledge Base Upload ----------------
+  // /upload returns a job id right away; poll /jobs/{id} until ingestion ends
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const res = await axios.get(`http://localhost:8000/jobs/${jobId}`);
+      if (res.data.status === "done") return res.data;
+      if (res.data.status === "failed") throw new Error(res.data.error);
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleUpload = async (file) => {
     const formData = new FormData();
     formData.append("file", file);
     setLoading(true);
     try {
-      await axios.post("http://localhost:8000/upload", formData);
+      const res = await axios.post("http://localhost:8000/upload", formData);
+      await waitForJob(res.data.job_id);
       toast.success(`${file.name} uploaded successfully!`);
     } catch (err) {
       console.error(err);